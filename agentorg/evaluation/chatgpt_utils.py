@@ -1,18 +1,83 @@
 import os
+import time
 import random
 import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from openai import OpenAI
 from dotenv import load_dotenv
 
 from agentorg.utils.model_config import MODEL
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 client = OpenAI(
     api_key=os.environ["OPENAI_API_KEY"]
 )
 
+
+class RateLimiter:
+    """Spaces the calls evenly to at most `per_minute` calls per minute, across threads."""
+
+    def __init__(self, per_minute=None):
+        self.set_rate(per_minute)
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def set_rate(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.next_time, now)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+# limits the calls of the simulated user to the OpenAI api, unlimited by default
+rate_limiter = RateLimiter()
+# one session per thread, so that the connections to the chatbot api are reused
+_local = threading.local()
+
+
+def get_session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def map_concurrently(func, items, concurrency=1):
+    """Apply `func` to the items with at most `concurrency` running at once. The results keep
+    the order of the items. An item that raises is logged, and once all the items are done
+    the first error is raised with the number of failed items."""
+    errors = []
+
+    def run(idx, item):
+        try:
+            return func(item)
+        except Exception as e:
+            logger.error("Error in simulated conversation %d: %s", idx, e)
+            errors.append(e)
+            return None
+
+    if concurrency <= 1:
+        results = [run(idx, item) for idx, item in enumerate(items)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run, range(len(items)), items))
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(items)} simulated conversations failed") from errors[0]
+    return results
+
+
 def chatgpt_chatbot(messages, model=MODEL["model_type_or_path"]):
+    rate_limiter.wait()
     completion = client.chat.completions.create(
         model=model,
         messages=messages,
@@ -53,7 +118,7 @@ def query_chatbot(model_api, history, params):
     history = flip_hist_content_only(history)
     data = {"history": history, "parameters": params}
     data = json.dumps(data)
-    response = requests.post(model_api, headers={"Content-Type": "application/json"}, data=data)
+    response = get_session().post(model_api, headers={"Content-Type": "application/json"}, data=data)
     return response.json()
 
 def format_chat_history_str(chat_history):
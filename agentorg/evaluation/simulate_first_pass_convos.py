@@ -2,7 +2,8 @@ import json
 import random
 from agentorg.evaluation.get_documents import load_docs
 from agentorg.evaluation.chatgpt_utils import (chatgpt_chatbot, query_chatbot, filter_convo, 
-                                               flip_hist, generate_goals, format_chat_history_str, flip_hist_content_only)
+                                               flip_hist, generate_goals, format_chat_history_str, flip_hist_content_only,
+                                               map_concurrently)
 
 def check_goal_completion(goal, convo):
     convo_str = format_chat_history_str(flip_hist_content_only(convo[2:]))
@@ -37,15 +38,17 @@ def conversation(model_api, goal, summary, model_params, synthetic_data_params):
     return history
 
 def generate_conversations(model_api, goals, summary, model_params, synthetic_data_params):
-    convos = []
-    for i in range(synthetic_data_params['num_convos']):
-        goal = random.choice(goals)
+    # the goals are drawn upfront so that the conversations do not depend on the scheduling
+    convo_goals = [random.choice(goals) for _ in range(synthetic_data_params['num_convos'])]
+
+    def simulate(goal):
         convo = conversation(model_api, goal, summary, model_params, synthetic_data_params)
-        convos.append(flip_hist(filter_convo(convo, filter_turns=False)))
-    return convos
+        return flip_hist(filter_convo(convo, filter_turns=False))
+
+    return map_concurrently(simulate, convo_goals, synthetic_data_params.get('concurrency', 1))
 
 def simulate_conversations(model_api, model_params, synthetic_data_params, config):
-    documents = load_docs(config['documents_dir'], config, synthetic_data_params['num_goals'] * 2)
+    documents = load_docs(config['documents_dir'], config, synthetic_data_params['num_goals'] * 2, refresh=config.get('refresh_docs', False))
     summary = config['intro']
     goals = generate_goals(documents, synthetic_data_params)
     conversations = generate_conversations(model_api, goals, summary, model_params, synthetic_data_params)
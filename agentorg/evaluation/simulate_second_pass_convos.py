@@ -1,7 +1,7 @@
 import json
 import random
 from agentorg.evaluation.extract_conversation_info import build_intent_graph
-from agentorg.evaluation.chatgpt_utils import chatgpt_chatbot, query_chatbot, flip_hist, filter_convo, generate_goals
+from agentorg.evaluation.chatgpt_utils import chatgpt_chatbot, query_chatbot, flip_hist, filter_convo, generate_goals, map_concurrently
 from agentorg.evaluation.get_documents import load_docs
 
 def sampling_paths(start_node, graph, path_length, max_turns, intents):
@@ -41,19 +41,20 @@ def interact(intent_path, summary, model_api, model_params):
         history.append({'role': 'user', 'content': answer + '\nRespond to this utterance with the following intent: ' + intent + '\nMake sure your response is natural and follows the flow of the conversation. For example, if the bot asks you a question make sure you answer it.'})
     return history
 
-def generate_labeled_convos(intent_paths, summary, model_api, model_params):
-    convos = []
+def generate_labeled_convos(intent_paths, summary, model_api, model_params, concurrency=1):
     model_params = {}
-    for intent_path in intent_paths:
+
+    def simulate(intent_path):
         convo = interact(intent_path, summary, model_api, model_params)
-        convos.append(flip_hist(filter_convo(convo)))
-    return convos
+        return flip_hist(filter_convo(convo))
+
+    return map_concurrently(simulate, intent_paths, concurrency)
 
 def get_labeled_convos(first_pass_data, model_api, synthetic_data_params, model_params, config):
     intent_graph = build_intent_graph(first_pass_data)
     intent_paths = get_paths(intent_graph, synthetic_data_params['num_convos'], synthetic_data_params['max_turns'])
     summary = config['intro']
-    convos = generate_labeled_convos(intent_paths, summary, model_api, model_params)
+    convos = generate_labeled_convos(intent_paths, summary, model_api, model_params, synthetic_data_params.get('concurrency', 1))
     return convos
 
 
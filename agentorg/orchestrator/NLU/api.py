@@ -2,27 +2,74 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[3]))
 
+import os
+import time
+import asyncio
 import logging
 import string
+from typing import Any, Awaitable, Callable, List
 
-from openai import OpenAI
-from fastapi import FastAPI, Response
+from openai import OpenAI, AsyncOpenAI
+from fastapi import FastAPI, Response, HTTPException
+from fastapi.responses import PlainTextResponse
 
 from agentorg.utils.graph_state import Slots
 from dotenv import load_dotenv
 load_dotenv()
 
 from agentorg.utils.model_config import MODEL
+from agentorg.utils.timing import record_llm_call
 
 logger = logging.getLogger(__name__)
 
+# The concurrent requests of an endpoint are collected over a short window and served as
+# one batch. The requests waiting or in flight are capped, beyond that they get a 503.
+BATCH_WINDOW_MS = float(os.environ.get("AGENTORG_NLU_BATCH_WINDOW_MS", "10"))
+MAX_BATCH_SIZE = int(os.environ.get("AGENTORG_NLU_MAX_BATCH_SIZE", "32"))
+MAX_PENDING = int(os.environ.get("AGENTORG_NLU_MAX_PENDING", "256"))
+# concurrent calls to the OpenAI api of a batched endpoint
+MAX_CONCURRENCY = int(os.environ.get("AGENTORG_NLU_MAX_CONCURRENCY", "16"))
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_DELAY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
 SYSTEM_PROMPT_NLU = """According to the conversation, decide what is the user's intent in the last turn? \nHere are the definitions for each intent:\n{definition}\nHere are some sample utterances from user that indicate each intent:\n{exemplars}\nConversation:\n{formatted_chat}\n\nOnly choose from the following options.\n{intents_choice}\n\nAnswer:
 """
 
 
 class OpenAIAPI:
-    def __init__(self):
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
         self.client = OpenAI()
+        self.max_concurrency = max_concurrency
+        self._async_client = None
+        self._semaphore = None
+
+    # created in the event loop of the server, on first use
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI()
+        return self._async_client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def apredict(self, **kwargs):
+        """By default the blocking `predict` runs in the default executor, the OpenAI backends
+        override it with a call of the async client."""
+        return await asyncio.to_thread(self.predict, **kwargs)
+
+    async def predict_batch(self, batch: List[dict]) -> list:
+        """Predictions of a batch of requests, an exception in place of a failed one. The
+        OpenAI backends make one call per request, at most `max_concurrency` at a time; a
+        local model would override it with one forward pass over the batch."""
+        async def limited(request):
+            async with self.semaphore:
+                return await self.apredict(**request)
+
+        return await asyncio.gather(*(limited(request) for request in batch), return_exceptions=True)
 
 
 class NLUOpenAIAPI(OpenAIAPI):
@@ -31,20 +78,32 @@ class NLUOpenAIAPI(OpenAIAPI):
         self.user_prefix = "USER"
         self.assistant_prefix = "ASSISTANT"
 
-    def get_response(self, sys_prompt, response_format="text", debug_text="none", params=MODEL):
-        logger.info(f"gpt system_prompt for {debug_text} is \n{sys_prompt}")
+    def _request(self, sys_prompt, response_format, debug_text, params):
+        logger.info("gpt system_prompt for %s is \n%s", debug_text, sys_prompt)
         dialog_history = {"role": "system", "content": sys_prompt}
-        completion = self.client.chat.completions.create(
+        return dict(
             model=params.get("model_type_or_path", "gpt-4o"),
             response_format={"type": "json_object"} if response_format=="json" else {"type": "text"},
             messages=[dialog_history],
             n=1,
             temperature = 0.7
         )
+
+    def _response(self, completion, debug_text):
+        if completion.usage:
+            record_llm_call(completion.usage.prompt_tokens, completion.usage.completion_tokens)
         response = completion.choices[0].message.content
-        logger.info(f"response for {debug_text} is \n{response}")
+        logger.info("response for %s is \n%s", debug_text, response)
         return response
 
+    def get_response(self, sys_prompt, response_format="text", debug_text="none", params=MODEL):
+        completion = self.client.chat.completions.create(**self._request(sys_prompt, response_format, debug_text, params))
+        return self._response(completion, debug_text)
+
+    async def aget_response(self, sys_prompt, response_format="text", debug_text="none", params=MODEL):
+        completion = await self.async_client.chat.completions.create(**self._request(sys_prompt, response_format, debug_text, params))
+        return self._response(completion, debug_text)
+
     def format_input(self, intents, chat_history_str) -> str:
         """Format input text before feeding it to the model."""
         intents_choice, definition_str, exemplars_str = "", "", ""
@@ -112,13 +171,31 @@ class NLUOpenAIAPI(OpenAIAPI):
         response = self.get_response(
             system_prompt, debug_text="get intent"
         )
-        logger.info(f"postprocessed intent response: {response}")
+        return self.postprocess(response, idx2intents_mapping)
+
+    async def apredict(
+        self,
+        text,
+        intents,
+        chat_history_str
+    ) -> str:
+
+        system_prompt, idx2intents_mapping = self.format_input(
+            intents, chat_history_str
+        )
+        response = await self.aget_response(
+            system_prompt, debug_text="get intent"
+        )
+        return self.postprocess(response, idx2intents_mapping)
+
+    def postprocess(self, response, idx2intents_mapping) -> str:
+        logger.info("postprocessed intent response: %s", response)
         try:
             pred_intent_idx = response.split(")")[0]
             pred_intent = idx2intents_mapping[pred_intent_idx]
         except:
             pred_intent = response.strip().lower()
-        logger.info(f"postprocessed intent response: {pred_intent}")
+        logger.info("postprocessed intent response: %s", pred_intent)
         return pred_intent
 
 
@@ -128,22 +205,34 @@ class SlotFillOpenAIAPI(OpenAIAPI):
         self.user_prefix = "USER"
         self.assistant_prefix = "ASSISTANT"
 
-    def get_response(self, sys_prompt, debug_text="none", params=MODEL):
-        logger.info(f"gpt system_prompt for {debug_text} is \n{sys_prompt}")
+    def _request(self, sys_prompt, debug_text, params):
+        logger.info("gpt system_prompt for %s is \n%s", debug_text, sys_prompt)
         dialog_history = {"role": "system", "content": sys_prompt}
-        completion = self.client.beta.chat.completions.parse(
+        return dict(
             model=params.get("model_type_or_path", "gpt-4o"),
             messages=[dialog_history],
             response_format=Slots,
             n=1,
             temperature = 0.7
         )
+
+    def _response(self, completion, debug_text):
+        if completion.usage:
+            record_llm_call(completion.usage.prompt_tokens, completion.usage.completion_tokens)
         response = completion.choices[0].message
         if (response.refusal):
             return None
-        logger.info(f"response for {debug_text} is \n{response.parsed}")
+        logger.info("response for %s is \n%s", debug_text, response.parsed)
         return response.parsed
 
+    def get_response(self, sys_prompt, debug_text="none", params=MODEL):
+        completion = self.client.beta.chat.completions.parse(**self._request(sys_prompt, debug_text, params))
+        return self._response(completion, debug_text)
+
+    async def aget_response(self, sys_prompt, debug_text="none", params=MODEL):
+        completion = await self.async_client.beta.chat.completions.parse(**self._request(sys_prompt, debug_text, params))
+        return self._response(completion, debug_text)
+
     def format_input(self, slots: Slots, chat_history_str) -> str:
         """Format input text before feeding it to the model."""
         system_prompt = f"Given the conversation and definition of dialog states definition, update the value of following dialogue states.\nDialogue Statues:\n{slots}\nConversation:\n{chat_history_str}\n\n"
@@ -162,30 +251,215 @@ class SlotFillOpenAIAPI(OpenAIAPI):
         response = self.get_response(
             system_prompt, debug_text="get slots"
         )
+        return self.postprocess(response, slots)
+
+    async def apredict(
+        self,
+        text,
+        slots,
+        chat_history_str
+    ):
+
+        system_prompt = self.format_input(
+            slots, chat_history_str
+        )
+        response = await self.aget_response(
+            system_prompt, debug_text="get slots"
+        )
+        return self.postprocess(response, slots)
+
+    def postprocess(self, response, slots):
         if not response:
-            logger.info(f"Failed to update dialogue states")
+            logger.info("Failed to update dialogue states")
             return slots
-        logger.info(f"Updated dialogue states: {response}")
+        logger.info("Updated dialogue states: %s", response)
         return response
 
 
+class BatchMetrics:
+    """Batch sizes, queueing delays and rejected requests of the batched endpoints, in the
+    Prometheus text format."""
+
+    def __init__(self):
+        self.endpoints = {}
+
+    def _endpoint(self, endpoint: str) -> dict:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                "batch_size": [0] * len(BATCH_SIZE_BUCKETS), "batch_size_sum": 0, "batches": 0,
+                "queue_delay": [0] * len(QUEUE_DELAY_BUCKETS), "queue_delay_sum": 0.0, "requests": 0,
+                "rejected": 0, "pending": 0,
+            }
+        return self.endpoints[endpoint]
+
+    @staticmethod
+    def _observe(buckets, bounds, value):
+        for idx, bound in enumerate(bounds):
+            if value <= bound:
+                buckets[idx] += 1
+
+    def observe_batch(self, endpoint: str, queue_delays: List[float]):
+        stats = self._endpoint(endpoint)
+        stats["batches"] += 1
+        stats["batch_size_sum"] += len(queue_delays)
+        self._observe(stats["batch_size"], BATCH_SIZE_BUCKETS, len(queue_delays))
+        for delay in queue_delays:
+            stats["requests"] += 1
+            stats["queue_delay_sum"] += delay
+            self._observe(stats["queue_delay"], QUEUE_DELAY_BUCKETS, delay)
+
+    def observe_rejected(self, endpoint: str):
+        self._endpoint(endpoint)["rejected"] += 1
+
+    def set_pending(self, endpoint: str, pending: int):
+        self._endpoint(endpoint)["pending"] = pending
+
+    def render(self) -> str:
+        lines = []
+        histograms = (
+            ("agentorg_nlu_batch_size", "batch_size", "batch_size_sum", "batches", BATCH_SIZE_BUCKETS, "Requests served per batch."),
+            ("agentorg_nlu_queue_delay_seconds", "queue_delay", "queue_delay_sum", "requests", QUEUE_DELAY_BUCKETS, "Time from the arrival of a request to the dispatch of its batch."),
+        )
+        for name, field, sum_field, count_field, bounds, description in histograms:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint, stats in sorted(self.endpoints.items()):
+                for bound, count in zip(bounds, stats[field]):
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {stats[count_field]}')
+                lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {stats[sum_field]}')
+                lines.append(f'{name}_count{{endpoint="{endpoint}"}} {stats[count_field]}')
+        lines.append("# HELP agentorg_nlu_rejected_total Requests rejected because too many were pending.")
+        lines.append("# TYPE agentorg_nlu_rejected_total counter")
+        for endpoint, stats in sorted(self.endpoints.items()):
+            lines.append(f'agentorg_nlu_rejected_total{{endpoint="{endpoint}"}} {stats["rejected"]}')
+        lines.append("# HELP agentorg_nlu_pending_requests Requests waiting for their batch or in flight.")
+        lines.append("# TYPE agentorg_nlu_pending_requests gauge")
+        for endpoint, stats in sorted(self.endpoints.items()):
+            lines.append(f'agentorg_nlu_pending_requests{{endpoint="{endpoint}"}} {stats["pending"]}')
+        return "\n".join(lines) + "\n"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher:
+    """Collects the concurrent requests of an endpoint for `window_ms` after the first one,
+    or until `max_batch_size` of them arrived, and serves them with one `handler` call.
+    While a batch is served the next one is collected. At most `max_pending` requests wait
+    or are in flight, `submit` raises QueueFull beyond that."""
+
+    def __init__(
+            self,
+            name: str,
+            handler: Callable[[List[dict]], Awaitable[list]],
+            metrics: BatchMetrics,
+            window_ms: float = BATCH_WINDOW_MS,
+            max_batch_size: int = MAX_BATCH_SIZE,
+            max_pending: int = MAX_PENDING,
+        ):
+        self.name = name
+        self.handler = handler
+        self.metrics = metrics
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.queue = None
+        self.collector = None
+        self.batches = set()
+
+    async def submit(self, request: dict) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            self.metrics.observe_rejected(self.name)
+            if self.rejected % 100 == 1:
+                logger.warning("%s %s requests are pending, %s requests rejected so far", self.pending, self.name, self.rejected)
+            raise QueueFull(f"{self.pending} {self.name} requests are pending")
+        if self.collector is None:
+            # created in the event loop of the server, on first use
+            self.queue = asyncio.Queue()
+            self.collector = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        self.metrics.set_pending(self.name, self.pending)
+        self.queue.put_nowait((request, future, time.perf_counter()))
+        try:
+            return await future
+        finally:
+            self.pending -= 1
+            self.metrics.set_pending(self.name, self.pending)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            now = time.perf_counter()
+            self.metrics.observe_batch(self.name, [now - arrival for _, _, arrival in batch])
+            task = asyncio.create_task(self._serve(batch))
+            # keep a reference to the batches in flight, the event loop only keeps weak ones
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+
+    async def _serve(self, batch):
+        try:
+            results = await self.handler([request for request, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
 app = FastAPI()
 nlu_openai = NLUOpenAIAPI()
 slotfilling_openai = SlotFillOpenAIAPI()
+batch_metrics = BatchMetrics()
+nlu_batcher = MicroBatcher("nlu", nlu_openai.predict_batch, batch_metrics)
+slotfill_batcher = MicroBatcher("slotfill", slotfilling_openai.predict_batch, batch_metrics)
+
+
+async def submit(batcher: MicroBatcher, data: dict):
+    try:
+        return await batcher.submit(data)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 
 @app.post("/nlu/predict")
-def predict(data: dict, res: Response):
-    logger.info(f"Received data: {data}")
-    pred_intent = nlu_openai.predict(**data)
+async def predict(data: dict, res: Response):
+    logger.info("Received data: %s", data)
+    pred_intent = await submit(nlu_batcher, data)
 
-    logger.info(f"pred_intent: {pred_intent}")
+    logger.info("pred_intent: %s", pred_intent)
     return {"intent": pred_intent}
 
 @app.post("/slotfill/predict")
-def predict(data: dict, res: Response):
-    logger.info(f"Received data: {data}")
-    results = slotfilling_openai.predict(**data)
-
-    logger.info(f"pred_slots: {results.slots}")
-    return results.slots
\ No newline at end of file
+async def predict(data: dict, res: Response):
+    logger.info("Received data: %s", data)
+    results = await submit(slotfill_batcher, data)
+    # the input slots come back as they are when the model refused or failed
+    pred_slots = results.slots if hasattr(results, "slots") else results
+
+    logger.info("pred_slots: %s", pred_slots)
+    return pred_slots
+
+@app.get("/metrics")
+def get_metrics():
+    """Batch sizes, queueing delays and rejected requests, in the Prometheus text format."""
+    return PlainTextResponse(batch_metrics.render(), media_type="text/plain; version=0.0.4")
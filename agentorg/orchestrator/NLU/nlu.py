@@ -2,66 +2,108 @@ import requests
 import logging
 from dotenv import load_dotenv
 
-import langsmith as ls
-
-from agentorg.utils.trace import TraceRunName
+from agentorg.utils.trace import TraceRunName, tracer
+from agentorg.utils.timing import span
+from agentorg.utils.model_config import INPROC_ADDR
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 
+def is_inproc(url) -> bool:
+    """Whether the `nluapi` / `slotfillapi` of a task graph selects the in-process models."""
+    return isinstance(url, str) and url.startswith(INPROC_ADDR)
+
+
+def _inproc_api():
+    # the models of the NLU api, imported on first use and shared by the task graphs of the process
+    from agentorg.orchestrator.NLU import api
+    return api
+
+
 class NLU:
     def __init__(self, url):
         self.url = url
+        self.inproc = is_inproc(url)
 
+    @span("nlu")
     def execute(self, text:str, intents:dict, chat_history_str:str, metadata:dict) -> str:
-        logger.info(f"candidates intents by using NLU API: {intents}")
+        logger.info("candidates intents by using NLU API: %s", intents)
         data = {
             "text": text,
             "intents": intents,
             "chat_history_str": chat_history_str
         }
-        response = requests.post(self.url, json=data)
-        with ls.trace(name=TraceRunName.NLU, inputs=data) as rt:
-            rt.end(
-                outputs=response.json(),
+        if self.inproc:
+            # no serialization nor HTTP round trip, the model is called directly
+            try:
+                pred_intent = _inproc_api().nlu_openai.predict(**data)
+                outputs = {"intent": pred_intent}
+                logger.info("pred_intent is %s", pred_intent)
+            except Exception as e:
+                pred_intent = "others"
+                outputs = {"error": str(e)}
+                logger.error("In-process NLU failed: %s", e)
+        else:
+            response = requests.post(self.url, json=data)
+            outputs = {"status_code": response.status_code, "response": response.text}
+            if response.status_code == 200:
+                results = response.json()
+                pred_intent = results['intent']
+                logger.info("pred_intent is %s", pred_intent)
+            else:
+                pred_intent = "others"
+                logger.error('Remote Server Error when predicting NLU')
+        if tracer.enabled:
+            tracer.record(
+                TraceRunName.NLU,
+                inputs=data,
+                outputs=outputs,
                 metadata={"conv_id": metadata.get("conv_id"), "turn_id": metadata.get("turn_id")}
             )
-        if response.status_code == 200:
-            results = response.json()
-            pred_intent = results['intent']
-            logger.info(f"pred_intent is {pred_intent}")
-        else:
-            pred_intent = "others"
-            logger.error('Remote Server Error when predicting NLU')
 
-        
         return pred_intent
     
 
 class SlotFilling:
     def __init__(self, url):
         self.url = url
+        self.inproc = is_inproc(url)
 
+    @span("slot_filling")
     def execute(self, text:str, slots:list, chat_history_str:str, metadata: dict) -> dict:
-        logger.info(f"extracted slots: {slots}")
+        logger.info("extracted slots: %s", slots)
         data = {
             "text": text,
             "slots": slots,
             "chat_history_str": chat_history_str
         }
-        response = requests.post(self.url, json=data)
-        with ls.trace(name=TraceRunName.SlotFilling, inputs=data) as rt:
-            rt.end(
-                outputs=response.json(),
+        if self.inproc:
+            try:
+                results = _inproc_api().slotfilling_openai.predict(**data)
+                # the same plain dicts as the json of the remote api
+                pred_slots = [slot.model_dump() for slot in results.slots] if hasattr(results, "slots") else results
+                outputs = {"slots": pred_slots}
+                logger.info("pred_slots is %s", pred_slots)
+            except Exception as e:
+                pred_slots = slots
+                outputs = {"error": str(e)}
+                logger.error("In-process Slot Filling failed: %s", e)
+        else:
+            response = requests.post(self.url, json=data)
+            outputs = {"status_code": response.status_code, "response": response.text}
+            if response.status_code == 200:
+                pred_slots = response.json()
+                logger.info("pred_slots is %s", pred_slots)
+            else:
+                pred_slots = slots
+                logger.error('Remote Server Error when predicting Slot Filling')
+        if tracer.enabled:
+            tracer.record(
+                TraceRunName.SlotFilling,
+                inputs=data,
+                outputs=outputs,
                 metadata={"conv_id": metadata.get("conv_id"), "turn_id": metadata.get("turn_id")}
             )
-        if response.status_code == 200:
-            pred_slots = response.json()
-            logger.info(f"pred_slots is {pred_slots}")
-        else:
-            pred_slots = slots
-            logger.error('Remote Server Error when predicting Slot Filling')
 
-        
         return pred_slots
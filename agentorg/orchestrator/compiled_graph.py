@@ -0,0 +1,181 @@
+import os
+import copy
+import json
+import pickle
+import hashlib
+import logging
+import collections
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+COMPILED_SUFFIX = ".compiled.pkl"
+# bump when the layout of CompiledTaskGraph changes, older artifacts are then recompiled
+COMPILED_VERSION = 2
+
+# artifacts loaded by the process, {path: (modification time, compiled graph)}; the
+# compiled graphs are read-only at runtime, so they are shared by the task graphs
+_loaded: Dict[str, Tuple[int, "CompiledTaskGraph"]] = {}
+
+
+def source_hash(product_kwargs: dict) -> str:
+    source = json.dumps(
+        {"nodes": product_kwargs.get("nodes", []), "edges": product_kwargs.get("edges", [])},
+        sort_keys=True
+    )
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def compiled_graph_path(taskgraph_path: str) -> str:
+    return os.path.splitext(taskgraph_path)[0] + COMPILED_SUFFIX
+
+
+def weighted_index(rng: np.random.Generator, cum_weights: np.ndarray) -> int:
+    """Sample an index with probability proportional to its weight, given the cumulative
+    weights, in O(log n). Zero weight entries are never sampled."""
+    return int(np.searchsorted(cum_weights, rng.random() * cum_weights[-1], side="right"))
+
+
+class CompiledTaskGraph:
+    """Read-only, array based form of the task graph used at runtime.
+
+    Nodes are numbered in insertion order. The out-edges are stored in CSR
+    layout (`indptr`, `targets`, `weights`), and the out-edges of a node are
+    grouped by intent so that every (node, intent) pair maps to a contiguous
+    slice, recorded in `local_intents`. `cum_weights` holds the cumulative
+    weights within each slice for sampling. Nodes and edges keep the networkx
+    semantics of the JSON task graph: repeated ids merge their attributes and
+    edge intents are lowercased.
+    """
+
+    def __init__(self, product_kwargs: dict):
+        self.version = COMPILED_VERSION
+        self.source_hash = source_hash(product_kwargs)
+
+        # nodes, in insertion order
+        nodes = collections.OrderedDict()
+        for node_id, data in product_kwargs.get("nodes", []):
+            nodes.setdefault(str(node_id), {}).update(data)
+        # edges, a repeated (source, target) pair keeps its position and merges its data
+        edges = collections.OrderedDict()
+        for source, target, data in product_kwargs.get("edges", []):
+            source, target = str(source), str(target)
+            nodes.setdefault(source, {})
+            nodes.setdefault(target, {})
+            data = copy.deepcopy(data)
+            data["intent"] = data.get("intent", "").lower()
+            edges.setdefault((source, target), {}).update(data)
+
+        self.node_ids: List[str] = list(nodes.keys())
+        self.node_index: Dict[str, int] = {node_id: idx for idx, node_id in enumerate(self.node_ids)}
+        self.nodes: Dict[str, dict] = dict(nodes)
+
+        # group the out-edges by source, then by intent (first occurrence order)
+        out_edges = [collections.OrderedDict() for _ in self.node_ids]
+        for (source, target), data in edges.items():
+            out_edges[self.node_index[source]].setdefault(data["intent"], []).append((target, data))
+
+        num_edges = len(edges)
+        self.indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        self.targets = np.zeros(num_edges, dtype=np.int64)
+        self.weights = np.zeros(num_edges, dtype=np.float64)
+        self.edges: List[dict] = []
+        self.local_intents: List[Dict[str, Tuple[int, int]]] = []
+        self.first_in_edge = np.full(len(self.node_ids), -1, dtype=np.int64)
+        self.pred_intents = collections.defaultdict(list)
+        edge_positions = {}
+        edge_idx = 0
+        for node_idx, intents in enumerate(out_edges):
+            node_intents = {}
+            for intent, group in intents.items():
+                start = edge_idx
+                for target, data in group:
+                    target_idx = self.node_index[target]
+                    edge_info = dict(data)
+                    edge_info["source_node"] = self.node_ids[node_idx]
+                    edge_info["target_node"] = target
+                    self.edges.append(edge_info)
+                    edge_positions[(self.node_ids[node_idx], target)] = edge_idx
+                    self.targets[edge_idx] = target_idx
+                    self.weights[edge_idx] = data.get("attribute", {}).get("weight", 1)
+                    if data.get("attribute", {}).get("pred", False):
+                        self.pred_intents[intent].append(edge_info)
+                    edge_idx += 1
+                node_intents[intent] = (start, edge_idx)
+            self.local_intents.append(node_intents)
+            self.indptr[node_idx + 1] = edge_idx
+        # the first in-edge of every node, in edge insertion order
+        for source, target in edges.keys():
+            target_idx = self.node_index[target]
+            if self.first_in_edge[target_idx] < 0:
+                self.first_in_edge[target_idx] = edge_positions[(source, target)]
+        self.pred_intents = dict(self.pred_intents)
+        self.cum_weights = np.zeros(num_edges, dtype=np.float64)
+        for node_intents in self.local_intents:
+            for start, end in node_intents.values():
+                self.cum_weights[start:end] = np.cumsum(self.weights[start:end])
+
+        self.start_node: Optional[str] = None
+        for node_id, data in self.nodes.items():
+            if data.get("type", "") == "start":
+                self.start_node = node_id
+                break
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.node_index
+
+    def out_degree(self, node_id: str) -> int:
+        node_idx = self.node_index[node_id]
+        return int(self.indptr[node_idx + 1] - self.indptr[node_idx])
+
+    def intent_edges(self, node_id: str, intent: str) -> range:
+        """Indices of the out-edges of the node with the given intent."""
+        start, end = self.local_intents[self.node_index[node_id]].get(intent, (0, 0))
+        return range(start, end)
+
+    def sample_edge(self, node_id: str, intent: str, available_nodes: dict, rng: np.random.Generator) -> Optional[int]:
+        """Sample one of the out-edges of the node with the given intent, by weight, among
+        the edges whose target is still available. Returns None when there is no candidate."""
+        start, end = self.local_intents[self.node_index[node_id]].get(intent, (0, 0))
+        if start == end:
+            return None
+        available = np.array([available_nodes[self.node_ids[target]]["limit"] >= 1 for target in self.targets[start:end]])
+        if available.all():
+            cum_weights = self.cum_weights[start:end]
+        else:
+            cum_weights = np.cumsum(np.where(available, self.weights[start:end], 0.0))
+        if cum_weights[-1] <= 0:
+            return None
+        return start + weighted_index(rng, cum_weights)
+
+    def in_edge(self, node_id: str) -> Optional[dict]:
+        edge_idx = self.first_in_edge[self.node_index[node_id]]
+        return self.edges[edge_idx] if edge_idx >= 0 else None
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: Optional[str], product_kwargs: dict) -> "CompiledTaskGraph":
+        """Load the compiled artifact, or compile the task graph in memory when the
+        artifact is missing or was compiled from a different task graph."""
+        if path and os.path.exists(path):
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                cached = _loaded.get(path)
+                if cached is not None and cached[0] == mtime:
+                    compiled = cached[1]
+                else:
+                    with open(path, "rb") as f:
+                        compiled = pickle.load(f)
+                if getattr(compiled, "version", None) == COMPILED_VERSION and compiled.source_hash == source_hash(product_kwargs):
+                    _loaded[path] = (mtime, compiled)
+                    return compiled
+                logger.warning(f"Compiled task graph {path} is stale, compiling the task graph in memory")
+            except Exception as e:
+                logger.warning(f"Failed to load the compiled task graph {path}: {e}")
+        return cls(product_kwargs)
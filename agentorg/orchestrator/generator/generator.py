@@ -5,9 +5,8 @@ import logging
 from datetime import datetime
 from tqdm import tqdm as progress_bar
 import subprocess
-import pickle
-from pathlib import Path
 import inspect
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from langchain.prompts import PromptTemplate
 from langchain_openai.chat_models import ChatOpenAI
@@ -175,6 +174,8 @@ class Generator:
         self.model = model
         self.timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         self.output_dir = output_dir
+        self.refresh_docs = getattr(args, "refresh_docs", False)
+        self.max_concurrency = getattr(args, "max_concurrency", None) or 1
     
     def _generate_tasks(self):
         # based on the type and documents
@@ -250,16 +251,31 @@ class Generator:
         prompt = PromptTemplate.from_template(embed_resources_sys_prompt)
         resources = {}
         for worker_name in self.workers:
-            if not WORKER_REGISTRY.get(worker_name):
+            if worker_name not in WORKER_REGISTRY:
                 logger.error(f"Worker {worker_name} is not registered in the WORKER_REGISTRY")
                 continue
-            worker_desp = WORKER_REGISTRY.get(worker_name).description
+            worker_desp = WORKER_REGISTRY.description(worker_name)
             resources[worker_name] = worker_desp
         input_prompt = prompt.invoke({"best_practice": best_practice, "resources": resources})
         final_chain = self.model | StrOutputParser()
         answer = final_chain.invoke(input_prompt)
         return postprocess_json(answer)
     
+    def _map_tasks(self, func, items, fallback, desc):
+        """Apply `func` to every item on a bounded thread pool, keeping the input order.
+        A failing item is logged and replaced by `fallback(item)`, the other items are not affected."""
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {executor.submit(func, item): idx for idx, item in enumerate(items)}
+            for future in progress_bar(as_completed(futures), total=len(futures), desc=desc):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    logger.error(f"Error in {desc} for item {idx}: {e}")
+                    results[idx] = fallback(items[idx])
+        return results
+
     def _format_task_graph(self, finetuned_best_practices):
         node_id = 1
         nodes = []
@@ -342,21 +358,10 @@ class Generator:
     
     def _load_docs(self):
         if self.task_docs:
-            filepath = os.path.join(self.output_dir, "task_documents.pkl")
+            filepath = os.path.join(self.output_dir, "task_documents.db")
             total_num_docs = sum([doc.get("num") if doc.get("num") else 1 for doc in self.task_docs])
             loader = Loader()
-            if Path(filepath).exists():
-                logger.warning(f"Loading existing documents from {os.path.join(self.output_dir, 'task_documents.pkl')}! If you want to recrawl, please delete the file or specify a new --output-dir when initiate Generator.")
-                crawled_urls_full = pickle.load(open(os.path.join(self.output_dir, "task_documents.pkl"), "rb"))
-            else:
-                crawled_urls_full = []
-                for doc in self.task_docs:
-                    source = doc.get("source")
-                    num_docs = doc.get("num") if doc.get("num") else 1
-                    urls = loader.get_all_urls(source, num_docs)
-                    crawled_urls = loader.to_crawled_obj(urls)
-                    crawled_urls_full.extend(crawled_urls)
-                Loader.save(filepath, crawled_urls_full)
+            crawled_urls_full, _ = loader.load_or_crawl(filepath, self.task_docs, refresh=self.refresh_docs)
             if total_num_docs > 50:
                 limit = total_num_docs // 5
             else:
@@ -381,12 +386,14 @@ class Generator:
             logger.info(f"Formatted tasks: {self.tasks}")
 
         # Step 2: Generate the task planning
-        best_practices = []
-        for idx, task in progress_bar(enumerate(self.tasks), total=len(self.tasks)):
-            logger.info(f"Generating best practice for task {idx}: {task}")
-            best_practice = self._generate_best_practice(task)
+        best_practices = self._map_tasks(
+            self._generate_best_practice,
+            self.tasks,
+            fallback=lambda task: [{"step": 1, "task": task["task"]}],
+            desc="best practice"
+        )
+        for idx, best_practice in enumerate(best_practices):
             logger.info(f"Generated best practice for task {idx}: {best_practice}")
-            best_practices.append(best_practice)
 
         # Step 3: iterate with user
         format_tasks = []
@@ -405,18 +412,23 @@ class Generator:
         json.dump(hitl_result, open(task_planning_filepath, "w"), indent=4)
 
         # Step 4: Pair task with worker
-        finetuned_best_practices = []
-        for idx_t, task in enumerate(hitl_result):
-            steps = task["steps"]
+        all_format_steps = []
+        for task in hitl_result:
             format_steps = []
-            for idx_s, step in enumerate(steps):
+            for idx_s, step in enumerate(task["steps"]):
                 format_steps.append({
                     "step": idx_s + 1,
                     "task": step
                 })
-            finetuned_best_practice = self._finetune_best_practice(format_steps)
+            all_format_steps.append(format_steps)
+        finetuned_best_practices = self._map_tasks(
+            self._finetune_best_practice,
+            all_format_steps,
+            fallback=lambda steps: [{**step, "resource": "MessageWorker", "example_response": ""} for step in steps],
+            desc="finetune best practice"
+        )
+        for idx_t, finetuned_best_practice in enumerate(finetuned_best_practices):
             logger.info(f"Finetuned best practice for task {idx_t}: {finetuned_best_practice}")
-            finetuned_best_practices.append(finetuned_best_practice)
 
         # Step 5: Format the task graph
         task_graph = self._format_task_graph(finetuned_best_practices)
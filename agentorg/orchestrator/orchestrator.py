@@ -1,36 +1,102 @@
 import json
-import time
-from typing import Any, Dict
+import queue
+import threading
+import contextvars
+from typing import Any, Dict, Iterator
 import logging
 import uuid
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 from langchain_core.runnables import RunnableLambda
-import langsmith as ls
-from openai import OpenAI
 
 from agentorg.orchestrator.task_graph import TaskGraph
-from agentorg.workers.worker import WORKER_REGISTRY
+from agentorg.orchestrator.compiled_graph import compiled_graph_path
+from agentorg.workers.worker import WORKER_REGISTRY, BaseWorker
 from agentorg.utils.graph_state import ConvoMessage, OrchestratorMessage
-from agentorg.utils.utils import init_logger
+from agentorg.utils.utils import log_context
 from agentorg.orchestrator.NLU.nlu import NLU
 from agentorg.utils.graph_state import MessageState, StatusEnum
-from agentorg.utils.trace import TraceRunName
+from agentorg.utils.trace import TraceRunName, tracer
+from agentorg.utils.streaming import token_sink
+from agentorg.utils.timing import record_timing, span
+from agentorg.utils.clients import openai_client
 
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# runs the speculative preparation of the workers, shared by the AgentOrg instances of the process
+_prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="worker-prefetch")
+
+
+class WorkerPrefetch:
+    """Speculative preparation of the worker of a predicted node, running in the background."""
+
+    def __init__(self, node, worker_name, message_state):
+        self.node = node
+        self.worker_name = worker_name
+        # the preparation is recorded in the timing and log context of the turn
+        self.future = _prefetch_executor.submit(contextvars.copy_context().run, self._prepare, message_state)
+
+    def _prepare(self, message_state):
+        worker = WORKER_REGISTRY[self.worker_name]()
+        worker.prepared = worker.prepare(message_state)
+        return worker
+
+    def result(self, node, worker_name):
+        """The prepared worker if the prediction was right, otherwise the prefetch is discarded."""
+        if node != self.node or worker_name != self.worker_name:
+            logger.info("Discard the prefetch of %s for node %s, the turn goes to node %s", self.worker_name, self.node, node)
+            self.discard()
+            return None
+        try:
+            worker = self.future.result()
+            logger.info("Use the prefetch of %s for node %s", self.worker_name, self.node)
+            return worker
+        except Exception as e:
+            logger.warning("Prefetch of %s for node %s failed: %s", self.worker_name, self.node, e)
+            return None
+
+    def discard(self):
+        self.future.cancel()
+
+
+# task graphs read by the process, {path: (modification time, task graph)}
+_configs = {}
+
+
+def load_config(config: str) -> dict:
+    """The task graph json, read once per process and again when it changes. It is shared
+    by the AgentOrg instances and must not be modified."""
+    mtime = os.stat(config).st_mtime_ns
+    cached = _configs.get(config)
+    if cached is None or cached[0] != mtime:
+        with open(config) as f:
+            cached = _configs[config] = (mtime, json.load(f))
+    return cached[1]
+
+
 class AgentOrg:
     def __init__(self, config, **kwargs):
-        self.product_kwargs = json.load(open(config))
+        self.product_kwargs = load_config(config)
         os.environ["AVAILABLE_WORKERS"] = ",".join(self.product_kwargs["workers"])
         self.user_prefix = "USER"
         self.worker_prefix = "ASSISTANT"
         self.__eos_token = "\n"
         self.tools = list(WORKER_REGISTRY.keys())
-        self.task_graph = TaskGraph("taskgraph", self.product_kwargs)
+        # only the workers of the task graph are imported
+        WORKER_REGISTRY.preload(self.product_kwargs["workers"])
+        self.task_graph = TaskGraph("taskgraph", self.product_kwargs, compiled_path=compiled_graph_path(config))
+        self.speculative_prefetch = self.product_kwargs.get("speculative_prefetch", False)
+
+    def warm_up(self):
+        """Load the shared state of the workers of the task graph, e.g. when a server starts."""
+        for worker_name in self.product_kwargs["workers"]:
+            worker_class = WORKER_REGISTRY.get(worker_name)
+            if worker_class is not None:
+                worker_class.warm_up()
 
     def _format_chat_history(self, chat_history, text):
         '''Includes current user utterance'''
@@ -40,25 +106,61 @@ class AgentOrg:
         chat_history_str += f"{self.user_prefix}: {text}"
         return chat_history_str.strip()
 
+    def _sys_instruct(self):
+        return "You are a " + self.product_kwargs["role"] + ". " + self.product_kwargs["user_objective"] + self.product_kwargs["builder_objective"] + self.product_kwargs["intro"]
+
+    def _start_prefetch(self, params, chat_history_str, text):
+        # Start the preparation of the worker of the likely node, while the safety check and the NLU run
+        node = self.task_graph.predict_next_node(params)
+        if node is None:
+            return None
+        worker_name = self.task_graph.graph.nodes[node]["name"]
+        worker_class = WORKER_REGISTRY.get(worker_name)
+        if worker_class is None or worker_class.prepare is BaseWorker.prepare:
+            return None
+        attribute = self.task_graph.graph.nodes[node]["attribute"]
+        message_state = MessageState(
+            sys_instruct=self._sys_instruct(),
+            user_message=ConvoMessage(history=chat_history_str, message=text),
+            orchestrator_message=OrchestratorMessage(message=attribute["value"], attribute=attribute),
+            message_flow="",
+            slots=params.get("dialog_states")
+        )
+        logger.info("Prefetch %s for the predicted node %s", worker_name, node)
+        return WorkerPrefetch(node, worker_name, message_state)
+
     def get_response(self, inputs: dict) -> Dict[str, Any]:
-        text = inputs["text"]
-        chat_history = inputs["chat_history"]
+        # the stages of the turn are timed into params["timing"]
         params = inputs["parameters"]
         params["timing"] = {}
-        chat_history_str = self._format_chat_history(chat_history, text)
-        params["dialog_states"] = params.get("dialog_states", [])
         metadata = params.get("metadata", {})
         metadata["conv_id"] = metadata.get("conv_id", str(uuid.uuid4()))
         metadata["turn_id"] = metadata.get("turn_id", 0) + 1
         params["metadata"] = metadata
+        with log_context(conv_id=metadata["conv_id"], turn_id=metadata["turn_id"]), record_timing(params["timing"]):
+            output = self._get_response(inputs)
+        output["parameters"]["timing"] = params["timing"]
+        return output
+
+    def _get_response(self, inputs: dict) -> Dict[str, Any]:
+        text = inputs["text"]
+        chat_history = inputs["chat_history"]
+        params = inputs["parameters"]
+        chat_history_str = self._format_chat_history(chat_history, text)
+        params["dialog_states"] = params.get("dialog_states", [])
+        metadata = params["metadata"]
+        prefetch = self._start_prefetch(params, chat_history_str, text) if self.speculative_prefetch else None
 
         ##### Model safety checking
         # check the response, decide whether to give template response or not
-        client = OpenAI()
+        client = openai_client()
         text = inputs["text"]
-        moderation_response = client.moderations.create(input=text).model_dump()
+        with span("moderation"):
+            moderation_response = client.moderations.create(input=text).model_dump()
         is_flagged = moderation_response["results"][0]["flagged"]
         if is_flagged:
+            if prefetch:
+                prefetch.discard()
             return_response = {
                 "answer": self.product_kwargs["safety_response"],
                 "parameters": params,
@@ -72,15 +174,16 @@ class AgentOrg:
             "chat_history_str": chat_history_str,
             "parameters": params  ## TODO: different params for different components
         }
-        dt = time.time()
         taskgraph_chain = RunnableLambda(self.task_graph.get_node) | RunnableLambda(self.task_graph.postprocess_node)
-        node_info, params = taskgraph_chain.invoke(taskgraph_inputs)
-        params["timing"]["taskgraph"] = time.time() - dt
+        with span("taskgraph"):
+            node_info, params = taskgraph_chain.invoke(taskgraph_inputs)
         logger.info("=============node_info=============")
         logger.info(node_info) # {'name': 'MessageWorker', 'attribute': {'value': 'If you are interested, you can book a calendly meeting https://shorturl.at/crFLP with us. Or, you can tell me your phone number, email address, and name; our expert will reach out to you soon.', 'direct': False, 'slots': {"<name>": {<attributes>}}}}
 
-        with ls.trace(name=TraceRunName.TaskGraph, inputs={"taskgraph_inputs": taskgraph_inputs}) as rt:
-            rt.end(
+        if tracer.enabled:
+            tracer.record(
+                TraceRunName.TaskGraph,
+                inputs={"taskgraph_inputs": taskgraph_inputs},
                 outputs={
                     "metadata": params.get("metadata"),
                     "timing": params.get("timing", {}),
@@ -91,20 +194,25 @@ class AgentOrg:
                     },
                     "curr_global_intent": params.get("curr_pred_intent"),
                     "dialog_states": params.get("dialog_states"),
-                    "node_status": params.get("node_status")}, 
+                    "node_status": params.get("node_status")},
                 metadata={"conv_id": metadata.get("conv_id"), "turn_id": metadata.get("turn_id")}
             )
         #### Worker execution
         user_message = ConvoMessage(history=chat_history_str, message=text)
         orchestrator_message = OrchestratorMessage(message=node_info["attribute"]["value"], attribute=node_info["attribute"])
-        sys_instruct = "You are a " + self.product_kwargs["role"] + ". " + self.product_kwargs["user_objective"] + self.product_kwargs["builder_objective"] + self.product_kwargs["intro"]
+        sys_instruct = self._sys_instruct()
         message_state = MessageState(sys_instruct=sys_instruct, user_message=user_message, orchestrator_message=orchestrator_message, message_flow=params.get("worker_response", {}).get("message_flow", ""), slots=params.get("dialog_states"))
-        worker = WORKER_REGISTRY[node_info["name"]]()
-        worker_response = worker.execute(message_state)
+        worker = prefetch.result(params.get("curr_node"), node_info["name"]) if prefetch else None
+        if worker is None:
+            worker = WORKER_REGISTRY[node_info["name"]]()
+        with span("worker"):
+            worker_response = worker.execute(message_state)
 
-        with ls.trace(name=TraceRunName.ExecutionResult, inputs={"message_state": message_state}) as rt:
-            rt.end(
-                outputs={"metadata": params.get("metadata"), **worker_response}, 
+        if tracer.enabled:
+            tracer.record(
+                TraceRunName.ExecutionResult,
+                inputs={"message_state": message_state},
+                outputs={"metadata": params.get("metadata"), **worker_response},
                 metadata={"conv_id": metadata.get("conv_id"), "turn_id": metadata.get("turn_id")}
             )
 
@@ -122,10 +230,48 @@ class AgentOrg:
             "parameters": params
         }
 
-        with ls.trace(name=TraceRunName.OrchestResponse) as rt:
-            rt.end(
+        if tracer.enabled:
+            tracer.record(
+                TraceRunName.OrchestResponse,
                 outputs={"metadata": params.get("metadata"), **output},
                 metadata={"conv_id": metadata.get("conv_id"), "turn_id": metadata.get("turn_id")}
             )
 
         return output
+
+    def get_response_stream(self, inputs: dict) -> Iterator[Dict[str, Any]]:
+        """Run the turn in a background thread and yield its events as they come:
+        {"type": "token", "content": ...} for every token of the response, then a trailing
+        {"type": "final", "answer": ..., "parameters": ...}. A response that was not generated
+        by a streaming model (e.g. the safety response) is sent as a single token event."""
+        events = queue.Queue()
+        done = object()
+        result = {}
+
+        def run():
+            try:
+                with token_sink(lambda token: events.put(token)):
+                    result["output"] = self.get_response(inputs)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                events.put(done)
+
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(run,), daemon=True)
+        thread.start()
+        streamed = False
+        while True:
+            token = events.get()
+            if token is done:
+                break
+            if token:
+                streamed = True
+                yield {"type": "token", "content": token}
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        output = result["output"]
+        if not streamed and output["answer"]:
+            yield {"type": "token", "content": output["answer"]}
+        yield {"type": "final", **output}
@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import threading
+import contextvars
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from agentorg.workers.worker import WORKER_REGISTRY
+from agentorg.utils.timing import record_cache_hit
+
+
+logger = logging.getLogger(__name__)
+
+# values of the `skip_check` attribute of a node (or of the task graph, as the default of its nodes)
+SKIP_CHECK_LLM = "llm"      # pre-check the slots, then ask the model
+SKIP_CHECK_SLOTS = "slots"  # only the deterministic pre-check against the filled slots
+SKIP_CHECK_NEVER = "never"  # never skip the node
+SKIP_CHECK_MODES = (SKIP_CHECK_LLM, SKIP_CHECK_SLOTS, SKIP_CHECK_NEVER)
+
+CACHE_SIZE = 1024
+MAX_PREFETCH_WORKERS = 8
+
+SKIP_PROMPT = """Given the conversation history and the proposed worker, you task is to decide whether the user has already provided the answer for the following worker's response. Reply with 'yes' if already answered, otherwise 'no'.
+
+        Conversation history:
+        {chat_history_str}
+        Proposed worker:
+        The purpose of this worker is to {worker_desp}
+        The prompt of the worker response could be {msg}
+
+        Answer:
+        """
+
+# skip decisions shared by the task graphs of the process, keyed by (graph, node, history hash)
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _cache_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_PREFETCH_WORKERS, thread_name_prefix="skip-check")
+    return _executor
+
+
+def _slot_value(slot):
+    if isinstance(slot, dict):
+        return slot.get("name"), slot.get("value")
+    return getattr(slot, "name", None), getattr(slot, "value", None)
+
+
+class SkipPolicy:
+    """Decides whether the task graph skips the node it lands on.
+
+    The decision of a node follows its `skip_check` attribute. The slots a node
+    collects (the `slots` of its attribute) are first checked against the filled
+    `dialog_states`, which settles the decision without a model call. Model
+    decisions are cached per (node, chat history), and with `lookahead` set the
+    nodes reachable through a chain of single `none` edges are checked
+    concurrently, so that walking the chain costs one model latency.
+    """
+
+    def __init__(self, model, graph, default_mode: str = SKIP_CHECK_LLM, lookahead: int = 0):
+        self.model = model
+        self.graph = graph
+        if default_mode not in SKIP_CHECK_MODES:
+            logger.warning("Unknown skip_check %s, using %s", default_mode, SKIP_CHECK_LLM)
+            default_mode = SKIP_CHECK_LLM
+        self.default_mode = default_mode
+        self.lookahead = lookahead
+
+    def mode(self, node_id: str) -> str:
+        skip_check = self.graph.nodes[node_id].get("skip_check", self.default_mode)
+        if skip_check is True:
+            return SKIP_CHECK_LLM
+        if skip_check is False:
+            return SKIP_CHECK_NEVER
+        return skip_check if skip_check in SKIP_CHECK_MODES else self.default_mode
+
+    def check_slots(self, node_id: str, dialog_states: list) -> Optional[bool]:
+        """Skip when every slot collected by the node is filled, keep the node when one is
+        missing, and return None when the node does not declare its slots."""
+        node_slots = (self.graph.nodes[node_id].get("attribute") or {}).get("slots")
+        if not node_slots:
+            return None
+        filled = set()
+        for slot in dialog_states or []:
+            name, value = _slot_value(slot)
+            if value:
+                filled.add(name)
+        return all(name in filled for name in node_slots)
+
+    def _key(self, node_id: str, chat_history_str: str):
+        history_hash = hashlib.sha256(chat_history_str.encode("utf-8")).hexdigest()
+        return (self.graph.source_hash, node_id, history_hash)
+
+    def _ask_model(self, node_id: str, chat_history_str: str) -> bool:
+        system_prompt = SKIP_PROMPT.format(
+            chat_history_str=chat_history_str,
+            worker_desp=WORKER_REGISTRY.description(self.graph.nodes[node_id]["name"]),
+            msg=self.graph.nodes[node_id]["attribute"]
+        )
+        skip_status = self.model.invoke(system_prompt)
+        logger.debug("skip_status: %s", skip_status)
+        return "yes" in skip_status.content.lower()
+
+    def _submit(self, node_id: str, chat_history_str: str, run_inline: bool) -> Future:
+        key = self._key(node_id, chat_history_str)
+        with _cache_lock:
+            future = _cache.get(key)
+            if future is not None:
+                _cache.move_to_end(key)
+                record_cache_hit()
+                return future
+            future = Future()
+            _cache[key] = future
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+        def run():
+            try:
+                future.set_result(self._ask_model(node_id, chat_history_str))
+            except Exception as e:
+                with _cache_lock:
+                    _cache.pop(key, None)
+                future.set_exception(e)
+
+        if run_inline:
+            run()
+        else:
+            # the timing recorder and the log context of the turn are context variables
+            _get_executor().submit(contextvars.copy_context().run, run)
+        return future
+
+    def _needs_model(self, node_id: str, dialog_states: list) -> bool:
+        return self.mode(node_id) == SKIP_CHECK_LLM and self.check_slots(node_id, dialog_states) is None
+
+    def lookahead_chain(self, node_id: str, available_nodes: dict) -> List[str]:
+        """Nodes after `node_id` reached through its only available `none` edge, in order."""
+        chain = []
+        seen = {node_id}
+        while len(chain) < self.lookahead:
+            targets = [
+                self.graph.edges[edge_idx]["target_node"]
+                for edge_idx in self.graph.intent_edges(node_id, "none")
+                if available_nodes[self.graph.edges[edge_idx]["target_node"]]["limit"] >= 1
+            ]
+            if len(targets) != 1 or targets[0] in seen:
+                break
+            node_id = targets[0]
+            seen.add(node_id)
+            chain.append(node_id)
+        return chain
+
+    def should_skip(self, node_id: str, chat_history_str: str, dialog_states: list, available_nodes: dict = None) -> bool:
+        mode = self.mode(node_id)
+        if mode == SKIP_CHECK_NEVER:
+            return False
+        skip = self.check_slots(node_id, dialog_states)
+        if skip is not None:
+            logger.info("Skip decision of node %s from the filled slots: %s", node_id, skip)
+            return skip
+        if mode == SKIP_CHECK_SLOTS:
+            return False
+        if self.lookahead and available_nodes is not None:
+            for next_node in self.lookahead_chain(node_id, available_nodes):
+                if self._needs_model(next_node, dialog_states):
+                    self._submit(next_node, chat_history_str, run_inline=False)
+        return self._submit(node_id, chat_history_str, run_inline=True).result()
@@ -1,51 +1,93 @@
 import copy
+import hashlib
 import logging
+import functools
 import collections
 
-import networkx as nx
 import numpy as np
-from langchain_openai import ChatOpenAI
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
 
-from agentorg.utils.utils import normalize, str_similarity
 from agentorg.utils.graph_state import StatusEnum
 from agentorg.orchestrator.NLU.nlu import NLU, SlotFilling
-from agentorg.workers.tools.database.utils import SLOTS
-from agentorg.workers.worker import WORKER_REGISTRY
-from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
+from agentorg.orchestrator.compiled_graph import CompiledTaskGraph, weighted_index
+from agentorg.orchestrator.skip_policy import SkipPolicy, SKIP_CHECK_LLM
+from agentorg.utils.timing import span
 
 logger = logging.getLogger(__name__)
 
+
+def load_rng(params: dict) -> np.random.Generator:
+    """The random generator of the conversation: restored from the state saved in the
+    parameters, or seeded from the conversation id on its first turn."""
+    rng = np.random.Generator(np.random.PCG64())
+    rng_state = params.get("rng_state")
+    if rng_state:
+        rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {"state": int(rng_state["state"]), "inc": int(rng_state["inc"])},
+            "has_uint32": rng_state["has_uint32"],
+            "uinteger": int(rng_state["uinteger"]),
+        }
+        return rng
+    conv_id = params.get("metadata", {}).get("conv_id", "")
+    seed = int(hashlib.sha256(str(conv_id).encode("utf-8")).hexdigest()[:16], 16)
+    return np.random.Generator(np.random.PCG64(seed))
+
+
+# minimum share of the out-edge weights for a successor to be predicted as the next node
+SPECULATION_MIN_SHARE = 0.5
+# minimum normalized Levenshtein similarity for a predicted intent to match an available one
+INTENT_SIMILARITY_THRESHOLD = 0.9
+
+
+def normalize_intent(intent: str) -> str:
+    return " ".join(intent.lower().split()).strip(" .'\"")
+
+
+@functools.lru_cache(maxsize=256)
+def intent_index(intents: tuple) -> dict:
+    """Normalized intent name -> intent, the first intent wins on collisions."""
+    index = {}
+    for intent in intents:
+        index.setdefault(normalize_intent(intent), intent)
+    return index
+
+
+def dump_rng(rng: np.random.Generator) -> dict:
+    # 128 bit integers are kept as strings so that the state survives any JSON client
+    state = rng.bit_generator.state
+    return {
+        "state": str(state["state"]["state"]),
+        "inc": str(state["state"]["inc"]),
+        "has_uint32": state["has_uint32"],
+        "uinteger": str(state["uinteger"]),
+    }
+
+
 class TaskGraphBase:
-    def __init__(self, name, product_kwargs):
-        self.graph = nx.DiGraph(name=name)
+    def __init__(self, name, product_kwargs, compiled_path=None):
+        self.name = name
         self.product_kwargs = product_kwargs
-        self.create_graph()
+        self.graph = self.create_graph(compiled_path)
         self.intents = self.get_pred_intents() # global intents
         self.start_node = self.get_start_node()
 
-    def create_graph(self):
-        raise NotImplementedError
+    def create_graph(self, compiled_path=None):
+        # load the artifact compiled by create.py, or compile the nodes and edges in memory
+        return CompiledTaskGraph.load(compiled_path, self.product_kwargs)
 
     def get_pred_intents(self):
-        intents = collections.defaultdict(list)
-        for edge in self.graph.edges.data():
-            if edge[2].get("attribute", {}).get("pred", False):
-                edge_info = copy.deepcopy(edge[2])
-                edge_info["source_node"] = edge[0]
-                edge_info["target_node"] = edge[1]
-                intents[edge[2].get("intent")].append(edge_info)
-        return intents
+        return collections.defaultdict(list, self.graph.pred_intents)
     
     def get_start_node(self):
-        for node in self.graph.nodes.data():
-            if node[1].get("type", "") == "start":
-                return node[0]
-        return None
+        return self.graph.start_node
 
 
 class TaskGraph(TaskGraphBase):
-    def __init__(self, name: str, product_kwargs: dict):
-        super().__init__(name, product_kwargs)
+    def __init__(self, name: str, product_kwargs: dict, compiled_path: str = None):
+        super().__init__(name, product_kwargs, compiled_path)
         self.unsure_intent = {
                 "intent": "others",
                 "source_node": None,
@@ -57,85 +99,81 @@ class TaskGraph(TaskGraphBase):
                     "sample_utterances": []
                 }
             }
-        self.initial_node = self.get_initial_flow()
-        self.model = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        # candidates of the initial flow and their cumulative weights (the weights of their in-edges)
+        services_nodes = self.product_kwargs.get("services_nodes", None) or {}
+        self.initial_flow_nodes = [str(v) for v in services_nodes.values()]
+        in_edges = [self.graph.first_in_edge[self.graph.node_index[n]] for n in self.initial_flow_nodes]
+        self.initial_flow_cum_weights = np.cumsum([self.graph.weights[e] if e >= 0 else 0.0 for e in in_edges])
+        self.rng = np.random.Generator(np.random.PCG64())
+        self.model = chat_model()
         self.nluapi = NLU(self.product_kwargs.get("nluapi"))
         self.slotfillapi = SlotFilling(self.product_kwargs.get("slotfillapi"))
-
-    def create_graph(self):
-        nodes = self.product_kwargs["nodes"]
-        edges = self.product_kwargs["edges"]
-        # convert the intent into lowercase
-        for edge in edges:
-            edge[2]['intent'] = edge[2]['intent'].lower()
-        self.graph.add_nodes_from(nodes)
-        self.graph.add_edges_from(edges)
+        self.skip_policy = SkipPolicy(
+            self.model,
+            self.graph,
+            default_mode=self.product_kwargs.get("skip_check", SKIP_CHECK_LLM),
+            lookahead=self.product_kwargs.get("skip_lookahead", 0)
+        )
 
     def get_initial_flow(self):
-        services_nodes = self.product_kwargs.get("services_nodes", None)
         node = None
-        if services_nodes:
-            candidates_nodes = [v for k, v in services_nodes.items()]
-            candidates_nodes_weights = [list(self.graph.in_edges(n, data="weight"))[0][2] for n in candidates_nodes]
-            node = np.random.choice(candidates_nodes, p=normalize(candidates_nodes_weights))
+        if self.initial_flow_nodes and self.initial_flow_cum_weights[-1] > 0:
+            node = self.initial_flow_nodes[weighted_index(self.rng, self.initial_flow_cum_weights)]
         return node
 
     def jump_to_node(self, pred_intent, intent_idx, available_nodes, curr_node):
-        logger.info(f"pred_intent in jump_to_node is {pred_intent}")
+        logger.info("pred_intent in jump_to_node is %s", pred_intent)
         candidates_nodes = [self.intents[pred_intent][intent_idx]]
         candidates_nodes = [node for node in candidates_nodes if available_nodes[node["target_node"]]["limit"] >= 1]
         candidates_nodes_weights = [node["attribute"]["weight"] for node in candidates_nodes]
         if candidates_nodes:
-            next_node = np.random.choice([node["target_node"] for node in candidates_nodes], p=normalize(candidates_nodes_weights))
+            next_node = candidates_nodes[weighted_index(self.rng, np.cumsum(candidates_nodes_weights))]["target_node"]
             next_intent = pred_intent
         else:  # This is for protection, logically shouldn't enter this branch
             next_node = curr_node
-            next_intent = list(self.graph.in_edges(curr_node, data="intent"))[0][2]
+            next_intent = self.graph.in_edge(curr_node)["intent"]
         return next_node, next_intent
     
     def move_to_node(self, curr_node, available_nodes):
         # if not match other intent, randomly choose one sample from candidate samples
-        candidate_samples = []
-        candidates_nodes_weights = []
-        for out_edge in self.graph.out_edges(curr_node, data=True):
-            if out_edge[2]["intent"] == "none" and available_nodes[out_edge[1]]["limit"] >= 1:
-                candidate_samples.append(out_edge[1])
-                candidates_nodes_weights.append(out_edge[2]["attribute"]["weight"])
-        if candidate_samples:
-            # randomly choose one sample from candidate samples
-            next_node = np.random.choice(candidate_samples, p=normalize(candidates_nodes_weights))
+        edge_idx = self.graph.sample_edge(curr_node, "none", available_nodes, self.rng)
+        if edge_idx is not None:
+            next_node = self.graph.edges[edge_idx]["target_node"]
         else:  # leaf node
             next_node = curr_node
 
         return next_node
     
-    def _check_skip(self, worker_class, sample_node):
-        worker_desp = worker_class.description
-        skip = False
-        sys_prompt = """Given the conversation history and the proposed worker, you task is to decide whether the user has already provided the answer for the following worker's response. Reply with 'yes' if already answered, otherwise 'no'.
-        
-        Conversation history:
-        {chat_history_str}
-        Proposed worker: 
-        The purpose of this worker is to {worker_desp}
-        The prompt of the worker response could be {msg}
-        
-        Answer:
-        """
-        system_prompt = sys_prompt.format(
-            chat_history_str=self.chat_history_str, 
-            worker_desp=worker_desp, 
-            msg=self.graph.nodes[sample_node]["attribute"]
-        )
-        skip_status = self.model.invoke(system_prompt)
-        logger.debug(f"skip_status: {skip_status}")
-        if "yes" in skip_status.content.lower():
-            skip = True
-        return skip
+    def predict_next_node(self, params):
+        """Guess the node of this turn before running the NLU: the current node while it
+        is incomplete, or its successor that holds most of the out-edge weight."""
+        curr_node = params.get("curr_node", None)
+        if not curr_node or str(curr_node) not in self.graph:
+            return None
+        curr_node = str(curr_node)
+        if params.get("node_status", {}).get(curr_node) == StatusEnum.INCOMPLETE:
+            return curr_node
+        node_idx = self.graph.node_index[curr_node]
+        start, end = self.graph.indptr[node_idx], self.graph.indptr[node_idx + 1]
+        available_nodes = params.get("available_nodes") or {}
+        weights = np.array([
+            self.graph.weights[edge_idx] if available_nodes.get(self.graph.edges[edge_idx]["target_node"], {"limit": 1})["limit"] >= 1 else 0.0
+            for edge_idx in range(start, end)
+        ])
+        if not weights.size or weights.sum() <= 0:
+            return None
+        best = int(weights.argmax())
+        if weights[best] / weights.sum() > SPECULATION_MIN_SHARE:
+            return self.graph.edges[start + best]["target_node"]
+        return None
+
+    @span("skip_check")
+    def _check_skip(self, sample_node, available_nodes):
+        return self.skip_policy.should_skip(sample_node, self.chat_history_str, self.dialog_states, available_nodes)
     
     def _get_node(self, sample_node, available_nodes, available_intents, params, intent=None):
-        logger.info(f"available_intents in _get_node: {available_intents}")
-        logger.info(f"intent in _get_node: {intent}")
+        logger.info("available_intents in _get_node: %s", available_intents)
+        logger.info("intent in _get_node: %s", intent)
         candidates_intents = collections.defaultdict(list)
         worker_name = self.graph.nodes[sample_node]["name"]
         available_nodes[sample_node]["limit"] -= 1
@@ -149,9 +187,8 @@ class TaskGraph(TaskGraphBase):
         params["curr_node"] = sample_node
         params["available_nodes"] = available_nodes
         params["available_intents"] = available_intents
-        worker_class = WORKER_REGISTRY.get(worker_name)
-        # TODO: This will be used to check whether we skip the worker or not, which is handled by the task graph framework
-        skip = self._check_skip(worker_class, sample_node)
+        # check whether we skip the worker or not, following the skip_check policy of the node
+        skip = self._check_skip(sample_node, available_nodes)
         if skip:
             node_info = {"name": None, "attribute": None}
         else:
@@ -168,20 +205,32 @@ class TaskGraph(TaskGraphBase):
             real_intent = pred_intent.split("__<")[0]
         # get the idx
             idx = int(pred_intent.split("__<")[1].split(">")[0])
-        for item in available_intents:
-            if str_similarity(real_intent, item) > 0.9:
-                found_pred_in_avil = True
-                real_intent = item
-                break
+        # exact match, then normalized name, then fuzzy matching as the fallback
+        if real_intent in available_intents:
+            return True, real_intent, idx
+        intents = tuple(available_intents)
+        normalized_intent = normalize_intent(real_intent)
+        index = intent_index(intents)
+        if normalized_intent in index:
+            return True, index[normalized_intent], idx
+        match = process.extractOne(
+            real_intent, intents,
+            scorer=Levenshtein.normalized_similarity,
+            score_cutoff=INTENT_SIMILARITY_THRESHOLD
+        )
+        if match and match[1] > INTENT_SIMILARITY_THRESHOLD:
+            found_pred_in_avil = True
+            real_intent = match[0]
         return found_pred_in_avil, real_intent, idx
     
     # If the local intent is None, determine whether current global intent is finished
+    @span("switch_intent")
     def _switch_pred_intent(self, curr_pred_intent, avail_pred_intents):
         if not curr_pred_intent:
             return True
         other_pred_intents = [intent for intent in avail_pred_intents.keys() if intent != curr_pred_intent and intent != self.unsure_intent.get("intent")]
-        logger.info(f"_switch_pred_intent function: curr_pred_intent: {curr_pred_intent}")
-        logger.info(f"_switch_pred_intent function: avail_pred_intents: {other_pred_intents}")
+        logger.info("_switch_pred_intent function: curr_pred_intent: %s", curr_pred_intent)
+        logger.info("_switch_pred_intent function: avail_pred_intents: %s", other_pred_intents)
 
         prompt = f"The assistant is currently working on the task: {curr_pred_intent}\nOther available tasks are: {other_pred_intents}\nAccording to the conversation, decide whether the user wants to stop the current task and switch to another one.\nConversation:\n{self.chat_history_str}\nThe response should only be yes or no."
         response = self.model.invoke(prompt)        
@@ -190,19 +239,28 @@ class TaskGraph(TaskGraphBase):
         return True
             
     def get_node(self, inputs):
+        # the routing decisions are drawn from the generator of the conversation, so they can be replayed
+        params = inputs["parameters"]
+        self.rng = load_rng(params)
+        node_info, params = self._route(inputs)
+        params["rng_state"] = dump_rng(self.rng)
+        return node_info, params
+
+    def _route(self, inputs):
         self.text = inputs["text"]
         self.chat_history_str = inputs["chat_history_str"]
         params = inputs["parameters"]
+        self.dialog_states = params.get("dialog_states", [])
         nlu_records = []
 
         # get the current node
         curr_node = params.get("curr_node", None)
-        if not curr_node or curr_node not in self.graph.nodes:
+        if not curr_node or str(curr_node) not in self.graph:
             curr_node = self.start_node
             params["curr_node"] = curr_node
         else:
             curr_node = str(curr_node)
-        logger.info(f"Intial curr_node: {curr_node}")
+        logger.info("Intial curr_node: %s", curr_node)
 
         # get the current global intent
         curr_pred_intent = params.get("curr_pred_intent", None)
@@ -215,10 +273,11 @@ class TaskGraph(TaskGraphBase):
             
 
         # give a initial flow for the most common / important service, in case it miss the highest level intent information, it still have the chance to finally enter this from flow stack
-        if self.initial_node:
-            flow_stack = params.get("flow", [self.initial_node])
+        if "flow" in params:
+            flow_stack = params["flow"]
         else:
-            flow_stack = params.get("flow", [])
+            initial_node = self.get_initial_flow()
+            flow_stack = [initial_node] if initial_node else []
 
         # available global intents
         available_intents = params.get("available_intents", None)
@@ -226,39 +285,39 @@ class TaskGraph(TaskGraphBase):
             available_intents = copy.deepcopy(self.intents)
             if self.unsure_intent.get("intent") not in available_intents.keys():
                 available_intents[self.unsure_intent.get("intent")].append(self.unsure_intent)
-        logger.info(f"available_intents: {available_intents}")
+        logger.info("available_intents: %s", available_intents)
         
         if not params.get("available_nodes", None):
             available_nodes = {}
-            for node in self.graph.nodes.data():
-                available_nodes[node[0]] = {"limit": node[1]["limit"]}
+            for node_id, node_data in self.graph.nodes.items():
+                available_nodes[node_id] = {"limit": node_data["limit"]}
             params["available_nodes"] = available_nodes
         else:
             available_nodes = params.get("available_nodes")
         
-        if not list(self.graph.successors(curr_node)):  # leaf node
+        if not self.graph.out_degree(curr_node):  # leaf node
             if flow_stack:  # there is previous unfinished flow
                 curr_node = flow_stack.pop()
         
         next_node = curr_node  # initialize next node as curr node
         params["curr_node"] = next_node
-        logger.info(f"curr_node: {next_node}")
+        logger.info("curr_node: %s", next_node)
 
         # Get local intents of the curr_node
         candidates_intents = collections.defaultdict(list)
-        for u, v, data in self.graph.out_edges(curr_node, data=True):
-            intent = data.get("intent")
-            if intent != "none" and data.get("intent") and available_nodes[v]["limit"] >= 1:
-                edge_info = copy.deepcopy(data)
-                edge_info["source_node"] = u
-                edge_info["target_node"] = v
-                candidates_intents[intent].append(edge_info)
-        logger.info(f"candidates_intents: {candidates_intents}")
+        for intent in self.graph.local_intents[self.graph.node_index[curr_node]]:
+            if intent == "none" or not intent:
+                continue
+            for edge_idx in self.graph.intent_edges(curr_node, intent):
+                edge_info = self.graph.edges[edge_idx]
+                if available_nodes[edge_info["target_node"]]["limit"] >= 1:
+                    candidates_intents[intent].append(copy.deepcopy(edge_info))
+        logger.info("candidates_intents: %s", candidates_intents)
         # whether has checked global intent or not, since 1 turn only need to check global intent for 1 time
         global_intent_checked = False
 
         if not candidates_intents:  # no local intent under the current node
-            logger.info(f"no local intent under the current node")
+            logger.info("no local intent under the current node")
             # if there is no intents available in the whole graph except unsure_intent
             # Then there is no need to predict the intent
             # Direct move to the next node
@@ -266,10 +325,10 @@ class TaskGraph(TaskGraphBase):
                 pred_intent = self.unsure_intent.get("intent")
             else: # global intent prediction
                 if not self._switch_pred_intent(curr_pred_intent, available_intents):
-                    logger.info(f"User doesn't want to switch the current task: {curr_pred_intent}")
+                    logger.info("User doesn't want to switch the current task: %s", curr_pred_intent)
                     pred_intent = self.unsure_intent.get("intent")
                 else:
-                    logger.info(f"User wants to switch the current task: {curr_pred_intent}")
+                    logger.info("User wants to switch the current task: %s", curr_pred_intent)
                     global_intent_checked = True
                     # check other intent
                     # if match other intent, add flow, jump over
@@ -278,7 +337,7 @@ class TaskGraph(TaskGraphBase):
                     else:
                         available_intents_w_unsure = copy.deepcopy(available_intents)
                         available_intents_w_unsure[self.unsure_intent.get("intent")].append(self.unsure_intent)
-                    logger.info(f"available_intents_w_unsure: {available_intents_w_unsure}")
+                    logger.info("available_intents_w_unsure: %s", available_intents_w_unsure)
                     
                     pred_intent = self.nluapi.execute(self.text, available_intents_w_unsure, self.chat_history_str, params.get("metadata", {}))
                     nlu_records.append({"candidate_intents": available_intents_w_unsure, 
@@ -286,11 +345,11 @@ class TaskGraph(TaskGraphBase):
                     params["nlu_records"] = nlu_records
                     found_pred_in_avil, pred_intent, intent_idx = self._postprocess_intent(pred_intent, available_intents)
             if pred_intent.lower() != self.unsure_intent.get("intent") and found_pred_in_avil:  # found global intent
-                logger.info(f"Global intent changed from {curr_pred_intent} to {pred_intent}")
+                logger.info("Global intent changed from %s to %s", curr_pred_intent, pred_intent)
                 curr_pred_intent = pred_intent
                 params["curr_pred_intent"] = curr_pred_intent
                 next_node, next_intent = self.jump_to_node(pred_intent, intent_idx, available_nodes, curr_node)
-                logger.info(f"curr_node: {next_node}")
+                logger.info("curr_node: %s", next_node)
                 node_info, params, candidates_intents = \
                 self._get_node(next_node, available_nodes, available_intents, params, intent=next_intent)
                 if next_node != curr_node:
@@ -308,7 +367,7 @@ class TaskGraph(TaskGraphBase):
                 if next_node == curr_node:  # leaf node
                     break
                 
-                logger.info(f"curr_node: {next_node}")
+                logger.info("curr_node: %s", next_node)
 
                 node_info, params, candidates_intents = \
                 self._get_node(next_node, available_nodes, available_intents, params)
@@ -326,7 +385,7 @@ class TaskGraph(TaskGraphBase):
         curr_node = params["curr_node"]
         available_nodes = params["available_nodes"]
         next_node = curr_node
-        logger.info(f"curr_node: {curr_node}")
+        logger.info("curr_node: %s", curr_node)
 
         while candidates_intents:  # local intent prediction
             # there are local intent(s) to chooose from
@@ -335,24 +394,23 @@ class TaskGraph(TaskGraphBase):
             else:
                 candidates_intents_w_unsure = copy.deepcopy(candidates_intents)
                 candidates_intents_w_unsure[self.unsure_intent.get("intent")].append(self.unsure_intent)
-            logger.info(f"Check intent under current node: {candidates_intents_w_unsure}")
+            logger.info("Check intent under current node: %s", candidates_intents_w_unsure)
 
             pred_intent = self.nluapi.execute(self.text, candidates_intents_w_unsure, self.chat_history_str, params.get("metadata", {}))
             nlu_records.append({"candidate_intents": candidates_intents_w_unsure, 
                                 "pred_intent": pred_intent, "no_intent": False, "global_intent": False})
             params["nlu_records"] = nlu_records
             found_pred_in_avil, pred_intent, intent_idx = self._postprocess_intent(pred_intent, candidates_intents)
-            logger.info(f"found_pred_in_avil: {found_pred_in_avil}, pred_intent: {pred_intent}")
+            logger.info("found_pred_in_avil: %s, pred_intent: %s", found_pred_in_avil, pred_intent)
             if found_pred_in_avil:  # found local intent
                 if pred_intent.lower() != self.unsure_intent.get("intent") and pred_intent in available_intents.keys():
-                    logger.info(f"Global intent changed from {curr_pred_intent} to {pred_intent}")
+                    logger.info("Global intent changed from %s to %s", curr_pred_intent, pred_intent)
                     curr_pred_intent = pred_intent
                     params["curr_pred_intent"] = curr_pred_intent
-                for edge in self.graph.out_edges(curr_node, data="intent"):
-                    if edge[2] == pred_intent:
-                        next_node = edge[1]  # found intent under the current node
-                        break
-                logger.info(f"curr_node: {next_node}")
+                for edge_idx in self.graph.intent_edges(curr_node, pred_intent):
+                    next_node = self.graph.edges[edge_idx]["target_node"]  # found intent under the current node
+                    break
+                logger.info("curr_node: %s", next_node)
                 node_info, params, candidates_intents = \
                 self._get_node(next_node, available_nodes, available_intents, params, intent=pred_intent)
                 if node_info["name"]:
@@ -364,7 +422,7 @@ class TaskGraph(TaskGraphBase):
                     next_node = self.move_to_node(curr_node, available_nodes)
                     if next_node == curr_node:  # leaf node
                         break
-                    logger.info(f"curr_node: {next_node}")
+                    logger.info("curr_node: %s", next_node)
 
                     node_info, params, candidates_intents = \
                     self._get_node(next_node, available_nodes, available_intents, params)
@@ -381,7 +439,7 @@ class TaskGraph(TaskGraphBase):
                         other_intents[key] = value
                 if self.unsure_intent.get("intent") not in other_intents.keys():
                     other_intents[self.unsure_intent.get("intent")].append(self.unsure_intent)
-                logger.info(f"Check other intent (including unsure): {other_intents}")
+                logger.info("Check other intent (including unsure): %s", other_intents)
                 
                 pred_intent = self.nluapi.execute(self.text, other_intents, self.chat_history_str, params.get("metadata", {}))
                 nlu_records.append({"candidate_intents": other_intents, 
@@ -389,11 +447,11 @@ class TaskGraph(TaskGraphBase):
                 params["nlu_records"] = nlu_records
                 found_pred_in_avil, pred_intent, intent_idx = self._postprocess_intent(pred_intent, other_intents)
                 if pred_intent.lower() != self.unsure_intent.get("intent") and found_pred_in_avil:  # found global intent
-                    logger.info(f"Global intent changed from {curr_pred_intent} to {pred_intent}")
+                    logger.info("Global intent changed from %s to %s", curr_pred_intent, pred_intent)
                     curr_pred_intent = pred_intent
                     params["curr_pred_intent"] = curr_pred_intent
                     next_node, next_intent = self.jump_to_node(pred_intent, intent_idx, available_nodes, curr_node)
-                    logger.info(f"curr_node: {next_node}")
+                    logger.info("curr_node: %s", next_node)
                     node_info, params, candidates_intents = \
                     self._get_node(next_node, available_nodes, available_intents, params, intent=next_intent)
                     if next_node != curr_node:
@@ -402,14 +460,14 @@ class TaskGraph(TaskGraphBase):
                     if node_info["name"]:
                         return node_info, params
                     curr_node = params["curr_node"]
-                    logger.info(f"curr_node: {curr_node}")
+                    logger.info("curr_node: %s", curr_node)
                 else:  
                     # If user didn't indicate all the intent of children nodes under the current node, 
                     # then we could randomly choose one of Nones to continue the dialog flow
                     next_node = self.move_to_node(curr_node, available_nodes)
                     if next_node == curr_node:  # leaf node or no other nodes to choose from
                         break
-                    logger.info(f"curr_node: {next_node}")
+                    logger.info("curr_node: %s", next_node)
 
                     node_info, params, candidates_intents = \
                     self._get_node(next_node, available_nodes, available_intents, params)
@@ -0,0 +1,176 @@
+import io
+import re
+import wave
+import queue
+import logging
+import threading
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+import sounddevice as sd
+from openai import OpenAI
+
+
+logger = logging.getLogger(__name__)
+
+# raw PCM of the OpenAI speech api: 24kHz, 16-bit signed little-endian, mono
+TTS_SAMPLE_RATE = 24000
+RECORD_SAMPLE_RATE = 44100
+CHANNELS = 1
+DTYPE = "int16"
+PCM_CHUNK_SIZE = 4096
+# a sentence ends with . ! or ? followed by a space, or with a line break
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+MIN_SENTENCE_LENGTH = 20
+
+
+def split_sentences(tokens: Iterable[str], min_length: int = MIN_SENTENCE_LENGTH) -> Iterator[str]:
+    """Group a stream of tokens into sentences, so that each one can be spoken as soon as it
+    is complete. Short sentences are merged with the next one."""
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        parts = SENTENCE_END.split(buffer)
+        # the last part is still being generated
+        sentence = ""
+        for part in parts[:-1]:
+            sentence = f"{sentence} {part}".strip()
+            if len(sentence) >= min_length:
+                yield sentence
+                sentence = ""
+        buffer = f"{sentence} {parts[-1]}" if sentence else parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class OpenAITTS:
+    """Text to speech backend streaming raw PCM chunks from the OpenAI speech api."""
+
+    sample_rate = TTS_SAMPLE_RATE
+
+    def __init__(self, model: str = "tts-1", voice: str = "alloy", client: Optional[OpenAI] = None):
+        self.model = model
+        self.voice = voice
+        self.client = client or OpenAI()
+
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=self.voice,
+            input=text,
+            response_format="pcm",
+        ) as response:
+            yield from response.iter_bytes(PCM_CHUNK_SIZE)
+
+
+class SpeechPipeline:
+    """Speaks sentences as they arrive: the synthesis of a sentence and the playback of the
+    previous ones overlap with the generation of the rest of the response.
+
+    `tts` is any object with a `sample_rate` and a `synthesize(text)` method yielding 16-bit
+    mono PCM bytes, and `output_stream_factory` builds a started-on-enter raw output stream
+    (`sounddevice.RawOutputStream` by default).
+
+    An error of `sentences` is raised once the sentences before it have been spoken, an
+    error of the synthesis is only logged.
+    """
+
+    def __init__(self, tts=None, output_stream_factory: Optional[Callable] = None):
+        self.tts = tts or OpenAITTS()
+        self.output_stream_factory = output_stream_factory or sd.RawOutputStream
+
+    def speak(self, sentences: Iterable[str]):
+        # generation -> sentences -> synthesis -> pcm_chunks -> playback, each stage in its own thread
+        sentence_queue = queue.Queue()
+        pcm_chunks = queue.Queue()
+        done = object()
+        generate_errors = []
+        errors = []
+
+        def generate():
+            try:
+                for sentence in sentences:
+                    sentence_queue.put(sentence)
+            except Exception as e:
+                generate_errors.append(e)
+            finally:
+                sentence_queue.put(done)
+
+        def synthesize():
+            try:
+                while True:
+                    sentence = sentence_queue.get()
+                    if sentence is done:
+                        break
+                    for chunk in self.tts.synthesize(sentence):
+                        pcm_chunks.put(chunk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pcm_chunks.put(done)
+
+        generator = threading.Thread(target=generate, daemon=True)
+        synthesizer = threading.Thread(target=synthesize, daemon=True)
+        generator.start()
+        synthesizer.start()
+        remainder = b""
+        with self.output_stream_factory(samplerate=self.tts.sample_rate, channels=CHANNELS, dtype=DTYPE) as stream:
+            while True:
+                chunk = pcm_chunks.get()
+                if chunk is done:
+                    break
+                # the stream takes whole frames only
+                chunk = remainder + chunk
+                frame_bytes = len(chunk) - len(chunk) % np.dtype(DTYPE).itemsize
+                remainder = chunk[frame_bytes:]
+                if frame_bytes:
+                    stream.write(chunk[:frame_bytes])
+        synthesizer.join()
+        generator.join()
+        if errors:
+            logger.error("Error during text to speech: %s", errors[0])
+        if generate_errors:
+            raise generate_errors[0]
+
+
+class Recorder:
+    """Records from an input stream callback into an in-memory WAV file."""
+
+    def __init__(self, sample_rate: int = RECORD_SAMPLE_RATE, channels: int = CHANNELS, input_stream_factory: Optional[Callable] = None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.input_stream_factory = input_stream_factory or sd.InputStream
+        self.buffer = None
+        self.wav = None
+        self.stream = None
+
+    def _callback(self, indata, frames, time, status):
+        if status:
+            logger.warning("Recording status: %s", status)
+        self.wav.writeframes(indata.tobytes())
+
+    def start(self):
+        self.buffer = io.BytesIO()
+        self.wav = wave.open(self.buffer, "wb")
+        self.wav.setnchannels(self.channels)
+        self.wav.setsampwidth(np.dtype(DTYPE).itemsize)
+        self.wav.setframerate(self.sample_rate)
+        self.stream = self.input_stream_factory(
+            samplerate=self.sample_rate, channels=self.channels, dtype=DTYPE, callback=self._callback
+        )
+        self.stream.start()
+
+    def stop(self) -> io.BytesIO:
+        self.stream.stop()
+        self.stream.close()
+        self.wav.close()
+        audio = io.BytesIO(self.buffer.getvalue())
+        # the transcription api infers the format from the file name
+        audio.name = "speech.wav"
+        return audio
+
+
+def transcribe(audio: io.BytesIO, client: Optional[OpenAI] = None) -> str:
+    client = client or OpenAI()
+    response = client.audio.transcriptions.create(model="whisper-1", file=audio)
+    return response.text
@@ -0,0 +1,43 @@
+import threading
+from functools import lru_cache
+
+from openai import OpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from agentorg.utils.model_config import MODEL
+
+
+# The model clients are shared by the turns of the process: creating one builds its http
+# clients and their SSL contexts, which costs tens of milliseconds of CPU per turn. They are
+# keyed by their settings, so that a change of MODEL gets a new client.
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _chat_model(model: str, timeout: int) -> ChatOpenAI:
+    return ChatOpenAI(model=model, timeout=timeout)
+
+
+@lru_cache(maxsize=None)
+def _embedding_model(model: str) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(model=model)
+
+
+@lru_cache(maxsize=None)
+def _openai_client() -> OpenAI:
+    return OpenAI()
+
+
+def chat_model(timeout: int = 30000) -> ChatOpenAI:
+    with _lock:
+        return _chat_model(MODEL["model_type_or_path"], timeout)
+
+
+def embedding_model(model: str = "text-embedding-ada-002") -> OpenAIEmbeddings:
+    with _lock:
+        return _embedding_model(model)
+
+
+def openai_client() -> OpenAI:
+    with _lock:
+        return _openai_client()
@@ -0,0 +1,397 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from collections import deque
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+from bs4 import BeautifulSoup
+
+
+logger = logging.getLogger(__name__)
+
+CHROME_DRIVER_VERSION = "125.0.6422.7"
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.3 Safari/605.1.15'
+}
+# Pages whose visible text is shorter than this and that ship scripts are treated as rendered by JavaScript
+MIN_STATIC_TEXT_LENGTH = 200
+SPA_ROOT_IDS = ["root", "app", "__next", "__nuxt"]
+
+
+class FetchResult(NamedTuple):
+    html: Optional[str]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # the server answered 304 to a conditional request, `html` is None
+    not_modified: bool = False
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least `min_interval` seconds."""
+
+    def __init__(self, min_interval: float = 0.5):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._locks = {}
+
+    async def wait(self, url: str):
+        if self.min_interval <= 0:
+            return
+        host = urlparse(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            next_slot = self._next_slot.get(host, now)
+            if next_slot > now:
+                await asyncio.sleep(next_slot - now)
+            self._next_slot[host] = max(now, next_slot) + self.min_interval
+
+
+class BrowserPool:
+    """A fixed size pool of headless Chrome sessions, created on first use."""
+
+    def __init__(self, size: int = 2, page_load_timeout: float = 20):
+        self.size = size
+        self.page_load_timeout = page_load_timeout
+        self._drivers = queue.Queue()
+        self._created = 0
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _create_driver(self):
+        from webdriver_manager.chrome import ChromeDriverManager
+        from selenium import webdriver
+
+        options = webdriver.ChromeOptions()
+        options.add_argument("--no-sandbox")
+        options.add_argument("--headless")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-infobars")
+        options.add_argument("--remote-debugging-pipe")
+        chrome_driver_path = Path(ChromeDriverManager(driver_version=CHROME_DRIVER_VERSION).install())
+        options.binary_location = str(chrome_driver_path.parent.absolute())
+        logger.info(f"chrome binary location: {options.binary_location}")
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return driver
+
+    def _acquire(self):
+        with self._lock:
+            if self._drivers.empty() and self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                driver = self._create_driver()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            with self._lock:
+                self._all.append(driver)
+            return driver
+        return self._drivers.get()
+
+    def fetch(self, url: str) -> str:
+        """Load the url and return the page source once the document is ready."""
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = self._acquire()
+        try:
+            driver.get(url)
+            WebDriverWait(driver, self.page_load_timeout).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
+            return driver.page_source
+        finally:
+            self._drivers.put(driver)
+
+    def close(self):
+        with self._lock:
+            drivers, self._all = self._all, []
+            self._created = 0
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as err:
+                logger.error(f"Fail to quit the browser session: {err}")
+        self._drivers = queue.Queue()
+
+
+def needs_browser(html: str) -> bool:
+    """Guess whether the page content is rendered client side and needs a real browser."""
+    soup = BeautifulSoup(html, "html.parser")
+    has_scripts = soup.find("script") is not None
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    text = soup.get_text(" ", strip=True)
+    if has_scripts and len(text) < MIN_STATIC_TEXT_LENGTH:
+        return True
+    for root_id in SPA_ROOT_IDS:
+        root = soup.find(id=root_id)
+        if root is not None and not root.get_text(strip=True):
+            return True
+    return False
+
+
+def normalize_url(url: str) -> str:
+    return url.split("#")[0].rstrip("/")
+
+
+def extract_links(soup: BeautifulSoup, page_url: str) -> list[str]:
+    """Return the normalized absolute hrefs of all <a> tags in the page, in document order."""
+    links = []
+    for link in soup.find_all("a"):
+        href = link.get("href")
+        if not href:
+            continue
+        try:
+            links.append(normalize_url(urljoin(page_url, href)))
+        except Exception as err:
+            logger.error(f"Fail to process sub-url {href}: {err}")
+    return links
+
+
+def create_client(concurrency: int, timeout: float = 10) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        timeout=timeout,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+
+
+class ConcurrentCrawler:
+    """Fetches pages concurrently over async HTTP and falls back to a browser pool for JavaScript pages.
+
+    `use_browser` is one of "auto" (browser only when the static page looks client rendered or
+    cannot be fetched), "always" or "never".
+    """
+
+    def __init__(
+            self,
+            concurrency: int = 8,
+            browser_pool_size: int = 2,
+            min_host_interval: float = 0.5,
+            use_browser: str = "auto",
+            timeout: float = 10,
+        ):
+        self.concurrency = concurrency
+        self.use_browser = use_browser
+        self.timeout = timeout
+        self.rate_limiter = HostRateLimiter(min_host_interval)
+        self.browser_pool = BrowserPool(browser_pool_size) if use_browser != "never" else None
+        self.browser_semaphore = asyncio.Semaphore(browser_pool_size) if use_browser != "never" else None
+
+    async def _fetch_with_browser(self, url: str) -> str:
+        async with self.browser_semaphore:
+            await self.rate_limiter.wait(url)
+            logger.info(f"loading url with browser: {url}")
+            return await asyncio.to_thread(self.browser_pool.fetch, url)
+
+    async def fetch(self, client: httpx.AsyncClient, url: str, validators: Optional[dict] = None) -> FetchResult:
+        """Fetch the url, raising if neither static fetching nor the browser succeeds.
+
+        `validators` holds the "etag" and "last_modified" of a previous crawl, they are sent as
+        If-None-Match / If-Modified-Since so an unchanged page comes back as a 304 without a body.
+        """
+        if self.use_browser == "always":
+            return FetchResult(await self._fetch_with_browser(url))
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            await self.rate_limiter.wait(url)
+            logger.info(f"loading url: {url}")
+            response = await client.get(url, headers=headers)
+            if response.status_code == 304:
+                return FetchResult(
+                    None,
+                    etag=response.headers.get("ETag", headers.get("If-None-Match")),
+                    last_modified=response.headers.get("Last-Modified", headers.get("If-Modified-Since")),
+                    not_modified=True,
+                )
+            response.raise_for_status()
+            html = response.text
+        except Exception as err:
+            if self.use_browser == "never":
+                raise
+            if isinstance(err, httpx.HTTPStatusError) and err.response.status_code in (404, 410):
+                raise
+            logger.info(f"Static fetch failed for {url}, retry with browser: {err}")
+            return FetchResult(await self._fetch_with_browser(url))
+        result = FetchResult(
+            html,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        if self.use_browser == "auto" and needs_browser(html):
+            logger.info(f"Page {url} is rendered by JavaScript, retry with browser")
+            try:
+                return result._replace(html=await self._fetch_with_browser(url))
+            except Exception as err:
+                logger.error(f"Browser fetch failed for {url}, keep the static page: {err}")
+        return result
+
+    async def fetch_all(
+            self,
+            urls: list[str],
+            validators: Optional[dict] = None,
+        ) -> list[tuple[Optional[FetchResult], Optional[Exception]]]:
+        """Fetch all urls with bounded concurrency, results keep the order of the input.
+        `validators` optionally maps urls to the validators of their previous crawl."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        validators = validators or {}
+
+        async def _fetch(client, url):
+            async with semaphore:
+                try:
+                    return await self.fetch(client, url, validators.get(url)), None
+                except Exception as err:
+                    return None, err
+
+        try:
+            async with create_client(self.concurrency, self.timeout) as client:
+                return await asyncio.gather(*[_fetch(client, url) for url in urls])
+        finally:
+            if self.browser_pool:
+                await asyncio.to_thread(self.browser_pool.close)
+
+
+class LinkDiscoverer:
+    """Breadth first discovery of the pages under a base url.
+
+    The frontier is a deque, visited pages are tracked in a set and up to `concurrency`
+    pages are fetched at the same time over one pooled client, spaced out per host.
+    robots.txt and sitemaps are only consulted when asked for.
+    """
+
+    def __init__(
+            self,
+            check_url: Callable[[str, str], bool],
+            concurrency: int = 8,
+            min_host_interval: float = 0.2,
+            respect_robots: bool = False,
+            use_sitemap: bool = False,
+            timeout: float = 10,
+        ):
+        self.check_url = check_url
+        self.concurrency = concurrency
+        self.min_host_interval = min_host_interval
+        self.respect_robots = respect_robots
+        self.use_sitemap = use_sitemap
+        self.timeout = timeout
+        self.robots: Optional[RobotFileParser] = None
+
+    async def _load_robots(self, client: httpx.AsyncClient, base_url: str):
+        parsed = urlparse(base_url)
+        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+        robots = RobotFileParser(robots_url)
+        try:
+            response = await client.get(robots_url)
+            if response.status_code == 200:
+                robots.parse(response.text.splitlines())
+            else:
+                robots.allow_all = True
+        except Exception as err:
+            logger.error(f"Fail to get robots.txt from {robots_url}: {err}")
+            robots.allow_all = True
+        return robots
+
+    def _allowed(self, url: str) -> bool:
+        if self.robots is None:
+            return True
+        return self.robots.can_fetch(DEFAULT_HEADERS["User-Agent"], url)
+
+    async def _sitemap_urls(self, client: httpx.AsyncClient, base_url: str) -> list[str]:
+        parsed = urlparse(base_url)
+        sitemaps = (self.robots.site_maps() if self.robots else None) or [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+        urls = []
+        # a sitemap index points to other sitemaps, follow it one level deep
+        for depth in range(2):
+            nested = []
+            for sitemap_url in sitemaps:
+                try:
+                    response = await client.get(sitemap_url)
+                    if response.status_code != 200:
+                        continue
+                    soup = BeautifulSoup(response.text, "html.parser")
+                    for loc in soup.find_all("loc"):
+                        loc_url = normalize_url(loc.get_text(strip=True))
+                        if loc.find_parent("sitemap") is not None:
+                            nested.append(loc_url)
+                        else:
+                            urls.append(loc_url)
+                except Exception as err:
+                    logger.error(f"Fail to get the sitemap from {sitemap_url}: {err}")
+            if not nested:
+                break
+            sitemaps = nested
+        return urls
+
+    async def _get_links(self, client: httpx.AsyncClient, rate_limiter: HostRateLimiter, url: str, base_url: str) -> list[str]:
+        try:
+            await rate_limiter.wait(url)
+            response = await client.get(url)
+            if response.status_code != 200:
+                logger.error(f"Failed to retrieve page {url}, status code: {response.status_code}")
+                return []
+            soup = BeautifulSoup(response.text, "html.parser")
+            return [link for link in extract_links(soup, url) if self.check_url(link, base_url)]
+        except Exception as err:
+            logger.error(f"Fail to get the page from {url}: {err}")
+            return []
+
+    async def discover(self, base_url: str, max_num: int) -> list[str]:
+        base_url = normalize_url(base_url)
+        frontier = deque([base_url])
+        seen = {base_url}
+        visited = []
+        pending = set()
+        rate_limiter = HostRateLimiter(self.min_host_interval)
+        async with create_client(self.concurrency, self.timeout) as client:
+            if self.respect_robots:
+                self.robots = await self._load_robots(client, base_url)
+                crawl_delay = self.robots.crawl_delay(DEFAULT_HEADERS["User-Agent"])
+                if crawl_delay:
+                    rate_limiter.min_interval = max(rate_limiter.min_interval, float(crawl_delay))
+            if self.use_sitemap:
+                for url in await self._sitemap_urls(client, base_url):
+                    if url not in seen and self.check_url(url, base_url):
+                        seen.add(url)
+                        frontier.append(url)
+
+            try:
+                while (frontier or pending) and len(visited) < max_num:
+                    while frontier and len(pending) < self.concurrency and len(visited) < max_num:
+                        url = frontier.popleft()
+                        if not self._allowed(url):
+                            logger.info(f"Skip {url} disallowed by robots.txt")
+                            continue
+                        visited.append(url)
+                        pending.add(asyncio.create_task(self._get_links(client, rate_limiter, url, base_url)))
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        for link in task.result():
+                            if link not in seen:
+                                seen.add(link)
+                                frontier.append(link)
+            finally:
+                for task in pending:
+                    task.cancel()
+        return visited
@@ -0,0 +1,265 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Size of the memory map used for reads, SQLite serves pages straight from the mapped file
+MMAP_SIZE = 1024 * 1024 * 1024
+BATCH_SIZE = 500
+COLUMNS = ["id", "url", "content", "metadata", "is_chunk", "is_error", "error_message", "links"]
+SELECT_COLUMNS = ", ".join(COLUMNS)
+QUALIFIED_COLUMNS = ", ".join("d." + column for column in COLUMNS)
+PLACEHOLDERS = ", ".join("?" for _ in COLUMNS)
+UPSERT_COLUMNS = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS if column != "id")
+MANIFEST_COLUMNS = ["url", "doc_id", "etag", "last_modified", "content_hash", "crawled_at"]
+MANIFEST_SELECT_COLUMNS = ", ".join(MANIFEST_COLUMNS)
+
+
+class URLObject:
+    __slots__ = ("id", "url")
+
+    def __init__(self, id: str, url: str):
+        self.id = id
+        self.url = url
+
+
+class CrawledURLObject(URLObject):
+    __slots__ = ("content", "metadata", "is_chunk", "is_error", "error_message", "links")
+
+    def __init__(
+        self,
+        id: str,
+        url: str,
+        content: str,
+        metadata=None,
+        is_chunk=False,
+        is_error=False,
+        error_message=None,
+        links=None,
+    ):
+        super().__init__(id, url)
+        self.content = content
+        self.metadata = metadata if metadata is not None else {}
+        self.is_chunk = is_chunk
+        self.is_error = is_error
+        self.error_message = error_message
+        # normalized urls of the outgoing <a> hrefs of the page
+        self.links = links if links is not None else []
+
+
+def content_hash(content: Optional[str]) -> Optional[str]:
+    if content is None:
+        return None
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class DocumentStore:
+    """SQLite backed store of crawled documents and chunks.
+
+    Documents are addressable by id, can be streamed without loading the whole
+    collection and are read through a memory map. The content is also indexed
+    in an FTS5 table for keyword search.
+
+    Crawled (not chunked) documents are also recorded in a crawl manifest with
+    their HTTP validators (ETag, Last-Modified) and a hash of their content, so
+    that a refresh only has to re-process the pages that changed.
+    """
+
+    def __init__(self, path: str, mmap_size: int = MMAP_SIZE):
+        self.path = path
+        directory_name = os.path.dirname(path)
+        if directory_name and not os.path.exists(directory_name):
+            os.makedirs(directory_name)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                url TEXT,
+                content TEXT,
+                metadata TEXT,
+                is_chunk INTEGER DEFAULT 0,
+                is_error INTEGER DEFAULT 0,
+                error_message TEXT,
+                links TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_url ON documents(url);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                content, content='documents', content_rowid='rowid'
+            );
+            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                INSERT INTO documents_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TABLE IF NOT EXISTS manifest (
+                url TEXT PRIMARY KEY,
+                doc_id TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                crawled_at TIMESTAMP
+            );
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]
+        if "links" not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN links TEXT")
+        self.conn.commit()
+
+    @staticmethod
+    def _to_row(doc: CrawledURLObject):
+        return (
+            doc.id,
+            doc.url,
+            doc.content,
+            json.dumps(doc.metadata),
+            int(doc.is_chunk),
+            int(doc.is_error),
+            doc.error_message,
+            json.dumps(doc.links) if doc.links else None,
+        )
+
+    @staticmethod
+    def _from_row(row) -> CrawledURLObject:
+        return CrawledURLObject(
+            id=row[0],
+            url=row[1],
+            content=row[2],
+            metadata=json.loads(row[3]) if row[3] else {},
+            is_chunk=bool(row[4]),
+            is_error=bool(row[5]),
+            error_message=row[6],
+            links=json.loads(row[7]) if row[7] else [],
+        )
+
+    @staticmethod
+    def _to_manifest_row(doc: CrawledURLObject):
+        return (
+            doc.url,
+            doc.id,
+            doc.metadata.get("etag"),
+            doc.metadata.get("last_modified"),
+            content_hash(doc.content),
+            datetime.now().isoformat(),
+        )
+
+    def add(self, docs: Iterable[CrawledURLObject], batch_size: int = BATCH_SIZE) -> int:
+        """Insert or replace documents, consuming the iterable in batches."""
+        # an upsert rather than INSERT OR REPLACE: the REPLACE deletes do not fire the
+        # delete trigger, which would leave the old content in the FTS index
+        query = f"""
+            INSERT INTO documents ({SELECT_COLUMNS})
+            VALUES ({PLACEHOLDERS})
+            ON CONFLICT(id) DO UPDATE SET {UPSERT_COLUMNS}
+        """
+        manifest_query = f"""
+            INSERT OR REPLACE INTO manifest ({MANIFEST_SELECT_COLUMNS})
+            VALUES (?, ?, ?, ?, ?, ?)
+        """
+        count = 0
+        batch = []
+        manifest_batch = []
+        for doc in docs:
+            batch.append(self._to_row(doc))
+            if not doc.is_chunk and not doc.is_error:
+                manifest_batch.append(self._to_manifest_row(doc))
+            if len(batch) >= batch_size:
+                self.conn.executemany(query, batch)
+                self.conn.executemany(manifest_query, manifest_batch)
+                count += len(batch)
+                batch = []
+                manifest_batch = []
+        if batch:
+            self.conn.executemany(query, batch)
+            self.conn.executemany(manifest_query, manifest_batch)
+            count += len(batch)
+        self.conn.commit()
+        return count
+
+    def get_manifest(self, url: str) -> Optional[dict]:
+        row = self.conn.execute(
+            f"SELECT {MANIFEST_SELECT_COLUMNS} FROM manifest WHERE url = ?",
+            (url,)
+        ).fetchone()
+        return dict(zip(MANIFEST_COLUMNS, row)) if row else None
+
+    def iter_manifest(self) -> Iterator[dict]:
+        cursor = self.conn.execute(f"SELECT {MANIFEST_SELECT_COLUMNS} FROM manifest ORDER BY url")
+        for row in cursor:
+            yield dict(zip(MANIFEST_COLUMNS, row))
+
+    def get(self, id: str) -> Optional[CrawledURLObject]:
+        row = self.conn.execute(
+            f"SELECT {SELECT_COLUMNS} FROM documents WHERE id = ?",
+            (id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def get_by_url(self, url: str) -> List[CrawledURLObject]:
+        rows = self.conn.execute(
+            f"SELECT {SELECT_COLUMNS} FROM documents WHERE url = ? ORDER BY rowid",
+            (url,)
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def delete_by_url(self, url: str):
+        self.conn.execute("DELETE FROM documents WHERE url = ?", (url,))
+        self.conn.commit()
+
+    def iter_docs(self, batch_size: int = BATCH_SIZE) -> Iterator[CrawledURLObject]:
+        """Stream the documents in insertion order without materializing the whole table."""
+        cursor = self.conn.execute(
+            f"SELECT {SELECT_COLUMNS} FROM documents ORDER BY rowid"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._from_row(row)
+
+    def search(self, query: str, k: int = 4) -> List[CrawledURLObject]:
+        """Full text search over the document content, best matches first."""
+        rows = self.conn.execute(
+            f"""
+            SELECT {QUALIFIED_COLUMNS}
+            FROM documents_fts f JOIN documents d ON d.rowid = f.rowid
+            WHERE documents_fts MATCH ? ORDER BY rank LIMIT ?
+            """,
+            (query, k)
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def __iter__(self) -> Iterator[CrawledURLObject]:
+        return self.iter_docs()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def __contains__(self, id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM documents WHERE id = ?", (id,)).fetchone() is not None
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
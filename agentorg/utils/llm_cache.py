@@ -0,0 +1,82 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from agentorg.utils.timing import record_cache_hit
+
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    # llm_string holds the model name and the generation parameters
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMCache(BaseCache):
+    """On-disk cache of LLM responses, addressed by the hash of (model, params, prompt).
+
+    Every response is committed as soon as it is received, so a run that crashes
+    halfway through can be resumed without re-issuing the calls that completed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory_name = os.path.dirname(path)
+        if directory_name and not os.path.exists(directory_name):
+            os.makedirs(directory_name)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        # the cache is shared by the threads of the generator, the counters are updated under the lock
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ?",
+                (cache_key(prompt, llm_string),)
+            ).fetchone()
+            generations = None
+            if row is not None:
+                try:
+                    generations = loads(row[0])
+                except Exception as e:
+                    logger.warning("Failed to load cached LLM response, it will be regenerated: %s", e)
+            if generations is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        record_cache_hit(llm=True)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response) VALUES (?, ?)",
+                (cache_key(prompt, llm_string), dumps(list(return_val)))
+            )
+            self.conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -1,20 +1,22 @@
+import asyncio
 import logging
-import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from pathlib import Path
-from typing import List
-import requests
-import pickle
+from typing import Iterable, Iterator, List, Optional, Tuple
 import uuid
 import argparse
 import os
 
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium import webdriver
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
-import networkx as nx
+import numpy as np
+import scipy.sparse
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
+
+from agentorg.utils.doc_store import URLObject, CrawledURLObject, DocumentStore, content_hash
+from agentorg.utils.crawler import ConcurrentCrawler, LinkDiscoverer, extract_links, normalize_url
 
 
 # Configure logging
@@ -25,32 +27,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-CHROME_DRIVER_VERSION = "125.0.6422.7"
-
-class URLObject:
-    def __init__(self, id: str, url: str):
-        self.id = id
-        self.url = url
-
-
-class CrawledURLObject(URLObject):
-    def __init__(
-        self,
-        id: str,
-        url: str,
-        content: str,
-        metadata={},
-        is_chunk=False,
-        is_error=False,
-        error_message=None,
-    ):
-        super().__init__(id, url)
-        self.content = content
-        self.metadata = metadata
-        self.is_chunk = is_chunk
-        self.is_error = is_error
-        self.error_message = error_message
 
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 40
+CHUNK_BATCH_SIZE = 64
+
+# one splitter per process, the tiktoken encoding is loaded once
+_text_splitter = None
+
+
+def _init_text_splitter():
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name="cl100k_base", chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+        )
+    return _text_splitter
+
+
+def _chunk_document(url_obj: CrawledURLObject) -> List[CrawledURLObject]:
+    if url_obj.is_error or url_obj.content is None:
+        logger.info(f"Skip url: {url_obj.url} because of error or no content")
+        return []
+    if url_obj.is_chunk:
+        logger.info(f"Skip url: {url_obj.url} because it has been chunked")
+        return [url_obj]
+    splitted_text = _init_text_splitter().split_text(url_obj.content)
+    return [
+        CrawledURLObject(
+            id=url_obj.id + "_" + str(i),
+            url=url_obj.url,
+            content=txt,
+            metadata=url_obj.metadata,
+            is_chunk=True,
+        )
+        for i, txt in enumerate(splitted_text)
+    ]
+
+
+def _chunk_batch(url_objs: List[CrawledURLObject]) -> List[CrawledURLObject]:
+    return [chunk for url_obj in url_objs for chunk in _chunk_document(url_obj)]
+
+
+def pagerank(num_nodes: int, sources: List[int], targets: List[int], alpha: float = 0.85, max_iter: int = 100, tol: float = 1.0e-6) -> np.ndarray:
+    """Power iteration PageRank over a sparse adjacency matrix, with the same conventions as networkx:
+    duplicate edges count once and the rank of dangling nodes is spread uniformly."""
+    if num_nodes == 0:
+        return np.zeros(0)
+    adjacency = scipy.sparse.csr_array(
+        (np.ones(len(sources)), (np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64))),
+        shape=(num_nodes, num_nodes),
+    )
+    adjacency.data[:] = 1.0  # duplicate edges were summed when the matrix was built
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    inv_out_degree = np.divide(1.0, out_degree, out=np.zeros(num_nodes), where=out_degree != 0)
+    transition = scipy.sparse.diags_array(inv_out_degree) @ adjacency
+    transition_t = transition.T.tocsr()
+    dangling = out_degree == 0
+    uniform = np.full(num_nodes, 1.0 / num_nodes)
+    x = uniform.copy()
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (transition_t @ x_last + x_last[dangling].sum() * uniform) + (1 - alpha) * uniform
+        if np.abs(x - x_last).sum() < num_nodes * tol:
+            break
+    return x
 
 class Loader:
     def __init__(self):
@@ -61,57 +102,45 @@ class Loader:
         crawled_url_objs = self.crawl_urls(url_objs)
         return crawled_url_objs
 
-    def crawl_urls(self, url_objects: list[URLObject]) -> List[CrawledURLObject]:
-        logger.info(f"Start crawling {len(url_objects)} urls")
-        options = webdriver.ChromeOptions()
-        options.add_argument("--no-sandbox")
-        options.add_argument("--headless")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-infobars")
-        options.add_argument("--remote-debugging-pipe")
-        chrome_driver_path = Path(ChromeDriverManager(driver_version=CHROME_DRIVER_VERSION).install())
-        options.binary_location = str(chrome_driver_path.parent.absolute())
-        logger.info(f"chrome binary location: {options.binary_location}")
-        driver = webdriver.Chrome(options=options)
-
-        docs: List[CrawledURLObject] = []
-        for url_obj in url_objects:
-            try:
-                logger.info(f"loading url: {url_obj.url}")
-                driver.get(url_obj.url)
-                time.sleep(2)
-                html = driver.page_source
-                soup = BeautifulSoup(html, "html.parser")
-
-                text_list = []
-                for string in soup.strings:        
-                    if string.find_parent("a"):
-                        href = urljoin(url_obj.url, string.find_parent("a").get("href"))
-                        if href.startswith(url_obj.url):
-                            text = f"{string} {href}"
-                            text_list.append(text)
-                    elif string.strip():
-                        text_list.append(string)
-                text_output = "\n".join(text_list)
-                
-                title = url_obj.url
-                for title in soup.find_all("title"):
-                    title = title.get_text()
-                    break
+    def crawl_urls(
+            self,
+            url_objects: list[URLObject],
+            concurrency: int = 8,
+            browser_pool_size: int = 2,
+            min_host_interval: float = 0.5,
+            use_browser: str = "auto",
+        ) -> List[CrawledURLObject]:
+        return self._crawl(
+            url_objects,
+            concurrency=concurrency,
+            browser_pool_size=browser_pool_size,
+            min_host_interval=min_host_interval,
+            use_browser=use_browser,
+        )
 
-                docs.append(
-                    CrawledURLObject(
-                        id=url_obj.id,
-                        url=url_obj.url,
-                        content=text_output,
-                        metadata={"title": title, "source": url_obj.url},
-                    )
-                )
+    def _crawl(self, url_objects: list[URLObject], validators: dict = None, **crawler_kwargs) -> List[Optional[CrawledURLObject]]:
+        """Crawl and parse the urls. With `validators` (url -> etag / last_modified of the previous crawl)
+        the requests are conditional and pages the server reports as not modified come back as None."""
+        logger.info(f"Start crawling {len(url_objects)} urls")
+        crawler = ConcurrentCrawler(**crawler_kwargs)
+        results = asyncio.run(crawler.fetch_all([url_obj.url for url_obj in url_objects], validators))
 
+        docs: List[Optional[CrawledURLObject]] = []
+        for url_obj, (result, fetch_err) in zip(url_objects, results):
+            try:
+                if fetch_err is not None:
+                    raise fetch_err
+                if result.not_modified:
+                    docs.append(None)
+                    continue
+                doc = self._parse_page(url_obj, result.html)
+                if result.etag:
+                    doc.metadata["etag"] = result.etag
+                if result.last_modified:
+                    doc.metadata["last_modified"] = result.last_modified
+                docs.append(doc)
             except Exception as err:
-                logger.info(f"error crawling {url_obj}")
+                logger.info(f"error crawling {url_obj.url}")
                 logger.error(err)
                 docs.append(
                     CrawledURLObject(
@@ -123,121 +152,181 @@ class Loader:
                         error_message=str(err),
                     )
                 )
-        driver.quit()
         return docs
 
-    def get_all_urls(self, base_url: str, max_num: int) -> List[str]:
-        logger.info(f"Getting all pages for base url: {base_url}, maximum number is: {max_num}")
-        urls_visited = []
-        base_url = base_url.split("#")[0].rstrip("/")
-        urls_to_visit = [base_url]
+    def refresh(self, store: DocumentStore, **crawler_kwargs) -> List[str]:
+        """Re-crawl the pages in the crawl manifest of the store with conditional requests.
+        Only pages whose parsed content changed are written back, their urls are returned."""
+        entries = list(store.iter_manifest())
+        url_objs = [URLObject(entry["doc_id"], entry["url"]) for entry in entries]
+        validators = {entry["url"]: entry for entry in entries}
+        docs = self._crawl(url_objs, validators=validators, **crawler_kwargs)
+
+        changed_docs = []
+        for entry, doc in zip(entries, docs):
+            if doc is None:
+                continue
+            if doc.is_error:
+                logger.warning(f"Keep the previous version of {doc.url} because the refresh failed: {doc.error_message}")
+                continue
+            # also records the new validators in the manifest
+            store.add([doc])
+            if content_hash(doc.content) != entry["content_hash"]:
+                changed_docs.append(doc.url)
+        logger.info(f"Refreshed {len(entries)} pages, {len(changed_docs)} changed: {changed_docs}")
+        return changed_docs
+
+    def load_or_crawl(self, file_path: str, docs_config: List[dict], refresh: bool = False) -> Tuple[DocumentStore, List[str]]:
+        """Open the document store at `file_path`, crawling the configured sources if it does not exist yet.
+        With `refresh`, the pages of an existing store are re-crawled conditionally. Returns the store and
+        the urls of the pages that are new or changed."""
+        if Path(file_path).exists():
+            store = Loader.load(file_path)
+            if not refresh:
+                logger.warning(f"Loading existing documents from {file_path}! If you want to recrawl, please delete the file or refresh the documents.")
+                return store, []
+            return store, self.refresh(store)
+
+        crawled_urls_full = []
+        for doc in docs_config:
+            source = doc.get("source")
+            num_docs = doc.get("num") if doc.get("num") else 1
+            urls = self.get_all_urls(source, num_docs)
+            crawled_urls = self.to_crawled_obj(urls)
+            crawled_urls_full.extend(crawled_urls)
+        Loader.save(file_path, crawled_urls_full)
+        return Loader.load(file_path), [doc.url for doc in crawled_urls_full if not doc.is_error]
+
+    def _parse_page(self, url_obj: URLObject, html: str) -> CrawledURLObject:
+        soup = BeautifulSoup(html, "html.parser")
+
+        text_list = []
+        for string in soup.strings:        
+            if string.find_parent("a"):
+                href = urljoin(url_obj.url, string.find_parent("a").get("href"))
+                if href.startswith(url_obj.url):
+                    text = f"{string} {href}"
+                    text_list.append(text)
+            elif string.strip():
+                text_list.append(string)
+        text_output = "\n".join(text_list)
         
-        while urls_to_visit:
-            if len(urls_visited) >= max_num:
-                break
-            current_url = urls_to_visit.pop(0)
-            if current_url not in urls_visited:
-                urls_visited.append(current_url)
-                new_urls = self.get_outsource_urls(current_url, base_url)
-                urls_to_visit.extend(new_urls)
-                urls_to_visit = list(set(urls_to_visit))
+        title = url_obj.url
+        for title in soup.find_all("title"):
+            title = title.get_text()
+            break
+
+        return CrawledURLObject(
+            id=url_obj.id,
+            url=url_obj.url,
+            content=text_output,
+            metadata={"title": title, "source": url_obj.url},
+            links=list(dict.fromkeys(extract_links(soup, url_obj.url))),
+        )
+
+    def get_all_urls(
+            self,
+            base_url: str,
+            max_num: int,
+            concurrency: int = 8,
+            respect_robots: bool = False,
+            use_sitemap: bool = False,
+        ) -> List[str]:
+        logger.info(f"Getting all pages for base url: {base_url}, maximum number is: {max_num}")
+        discoverer = LinkDiscoverer(
+            check_url=self._check_url,
+            concurrency=concurrency,
+            respect_robots=respect_robots,
+            use_sitemap=use_sitemap,
+        )
+        urls_visited = asyncio.run(discoverer.discover(base_url, max_num))
         logger.info(f"URLs visited: {urls_visited}")
         return sorted(urls_visited[:max_num])
     
-    def get_outsource_urls(self, curr_url: str, base_url: str):
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.3 Safari/605.1.15'
-        } 
-        new_urls = list()
-        try:
-            response = requests.get(curr_url, headers=headers, timeout=10)
-            # Check if the request was successful
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                for link in soup.find_all("a"):
-                    try:
-                        full_url = urljoin(curr_url, link.get("href"))
-                        full_url = full_url.split("#")[0].rstrip("/")
-                        if self._check_url(full_url, base_url):
-                            new_urls.append(full_url)
-                    except Exception as err:
-                        logger.error(f"Fail to process sub-url {link.get('href')}: {err}")
-            else:
-                logger.error(f"Failed to retrieve page {curr_url}, status code: {response.status_code}")
-        except Exception as err:
-            logger.error(f"Fail to get the page from {curr_url}: {err}")
-        return list(set(new_urls))
-    
     def _check_url(self, full_url, base_url):
         kw_list = ['.pdf', '.jpg', '.png', '.docx', '.xlsx', '.pptx', '.zip', ".jpeg"]
         if full_url.startswith(base_url) and full_url and not any(kw in full_url for kw in kw_list) and full_url != base_url:
             return True
         return False
 
-    def get_candidates_websites(self, urls: List[CrawledURLObject], top_k: int) -> List[str]:
-        """Based on the pagerank algorithm of the crawled websites, return the top 10 websites. 
-        The reason why we can do that is because we have the hreqs of the including <a> tags in the content of the website.
-        So we can use that to construct the edges and then use the tool from networkx to get the pagerank of the websites.
+    def get_candidates_websites(self, urls: Iterable[CrawledURLObject], top_k: int) -> List[dict]:
+        """Based on the pagerank algorithm of the crawled websites, return the top k websites. 
+        The edges of the link graph are the outgoing hrefs recorded for each page when it was parsed,
+        resolved to the crawled pages with a dict lookup. `urls` is iterated twice, once to build the
+        graph and once to collect the content of the selected pages, so it can be a DocumentStore.
         """
-        
-        nodes = []
-        edges = []
-        url_to_id_mapping = {}
-        for url in urls:
-            url_to_id_mapping[url.url] = url.id
-
+        node_ids = []
+        node_by_url = {}
+        page_links = []
         for url in urls:
             if url.is_error:
                 continue
-            for url_key in url_to_id_mapping:
-                if url_key in url.content:
-                    edge = [url.id, url_to_id_mapping[url_key]]
-                    edges.append(edge)
+            node_by_url[normalize_url(url.url)] = len(node_ids)
+            node_ids.append(url.id)
+            page_links.append(url.links)
 
-            node = [url.id, {"url": url.url, "content": url.content, "metadata": url.metadata}]
-            nodes.append(node)
-        
-        self.graph = nx.DiGraph(name="website graph")
-        self.graph.add_nodes_from(nodes)
-        self.graph.add_edges_from(edges)
-        pr = nx.pagerank(self.graph, alpha=0.9)
+        sources, targets = [], []
+        for source, links in enumerate(page_links):
+            for link in links:
+                target = node_by_url.get(link)
+                if target is not None:
+                    sources.append(source)
+                    targets.append(target)
+
+        pr = pagerank(len(node_ids), sources, targets, alpha=0.9)
         # sort the pagerank values in descending order
-        sorted_pr = sorted(pr.items(), key=lambda x: x[1], reverse=True)
-        logger.info(f"pagerank results: {sorted_pr}")
+        ranking = np.argsort(-pr, kind="stable")[:top_k]
+        logger.info(f"pagerank results: {[(node_ids[idx], float(pr[idx])) for idx in ranking]}")
         # get the top websites
-        top_k_websites = sorted_pr[:top_k]
-        urls_candidates = [self.graph.nodes[url_id] for url_id, _ in top_k_websites]
+        top_k_ids = {node_ids[idx]: rank for rank, idx in enumerate(ranking)}
+        urls_candidates = [None] * len(top_k_ids)
+        for url in urls:
+            rank = top_k_ids.get(url.id)
+            if rank is not None and not url.is_error:
+                urls_candidates[rank] = {"url": url.url, "content": url.content, "metadata": url.metadata}
         urls_cleaned = [doc for doc in urls_candidates if doc]
         return urls_cleaned
     
     @staticmethod
-    def save(file_path: str, docs: List[CrawledURLObject]):
-        with open(file_path, "wb") as f:
-            pickle.dump(docs, f)
+    def save(file_path: str, docs: Iterable[CrawledURLObject]):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        with DocumentStore(file_path) as store:
+            count = store.add(docs)
+        logger.info(f"Saved {count} documents to {file_path}")
+
+    @staticmethod
+    def load(file_path: str) -> DocumentStore:
+        return DocumentStore(file_path)
     
     @classmethod
-    def chunk(cls, url_objs: List[CrawledURLObject]) -> List[CrawledURLObject]:
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(encoding_name="cl100k_base", chunk_size=200, chunk_overlap=40)
-        docs = []
-        langchain_docs = []
-        for url_obj in url_objs:
-            if url_obj.is_error or url_obj.content is None:
-                logger.info(f"Skip url: {url_obj.url} because of error or no content")
-                continue
-            elif url_obj.is_chunk:
-                logger.info(f"Skip url: {url_obj.url} because it has been chunked")
-                docs.append(url_obj)
-                continue
-            splitted_text = text_splitter.split_text(url_obj.content)
-            for i, txt in enumerate(splitted_text):
-                doc = CrawledURLObject(
-                    id=url_obj.id+"_"+str(i),
-                    url=url_obj.url,
-                    content=txt,
-                    metadata=url_obj.metadata,
-                    is_chunk=True,
-                )
-                docs.append(doc)
-                langchain_docs.append(Document(page_content=txt, metadata={"source": url_obj.url}))
-        return langchain_docs
+    def chunk(
+        cls,
+        url_objs: Iterable[CrawledURLObject],
+        num_workers: Optional[int] = None,
+        batch_size: int = CHUNK_BATCH_SIZE,
+    ) -> Iterator[CrawledURLObject]:
+        """Stream the chunks of the documents, in input order.
+
+        The documents are split in batches across a process pool, with at most
+        two batches per worker in flight, so the memory use does not grow with
+        the size of the corpus. Inputs that fit in a single batch, or
+        `num_workers=1`, are split in the current process.
+        """
+        num_workers = num_workers or os.cpu_count() or 1
+        url_objs = iter(url_objs)
+        first_batch = list(islice(url_objs, batch_size))
+        if num_workers <= 1 or len(first_batch) < batch_size:
+            for url_obj in chain(first_batch, url_objs):
+                yield from _chunk_document(url_obj)
+            return
 
+        batches = chain([first_batch], iter(lambda: list(islice(url_objs, batch_size)), []))
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_text_splitter) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(_chunk_batch, batch))
+                if len(pending) >= 2 * num_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
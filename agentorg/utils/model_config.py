@@ -3,4 +3,11 @@ MODEL = {
     "context": 16000,
     "max_tokens": 4096,
     "tokenizer": "o200k_base"
-}
\ No newline at end of file
+}
+
+# port of the NLU and slot filling api started by start_apis()
+API_PORT = "55135"
+NLUAPI_ADDR = f"http://localhost:{API_PORT}/nlu/predict"
+SLOTFILLAPI_ADDR = f"http://localhost:{API_PORT}/slotfill/predict"
+# `nluapi` and `slotfillapi` of the task graphs that run the NLU and slot filling models in process
+INPROC_ADDR = "inproc://"
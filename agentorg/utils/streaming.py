@@ -0,0 +1,37 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# receives the tokens of the user facing response of the current turn, when the turn is streamed
+_token_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("token_sink", default=None)
+
+
+@contextmanager
+def token_sink(callback: Optional[Callable[[str], None]]):
+    """Send the tokens generated in this context to `callback`. `None` disables streaming,
+    e.g. for intermediate generations that are not shown to the user."""
+    token = _token_sink.set(callback)
+    try:
+        yield
+    finally:
+        _token_sink.reset(token)
+
+
+def is_streaming() -> bool:
+    return _token_sink.get() is not None
+
+
+def invoke_or_stream(chain, chain_input) -> str:
+    """Invoke a chain that outputs a string, streaming its tokens to the active token sink."""
+    sink = _token_sink.get()
+    if sink is None:
+        return chain.invoke(chain_input)
+    chunks = []
+    for chunk in chain.stream(chain_input):
+        chunks.append(chunk)
+        sink(chunk)
+    return "".join(chunks)
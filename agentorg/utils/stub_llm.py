@@ -0,0 +1,357 @@
+"""OpenAI compatible stub server, to run the agents without the live OpenAI api.
+
+It serves the chat completions (plain, streamed and structured outputs),
+moderations and embeddings endpoints with a configurable latency and
+deterministic or scripted responses. Point the clients to it with the base url:
+
+    python -m agentorg.utils.stub_llm --port 8089 --latency lognormal --latency-mean 0.8
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python run.py --input-dir ./examples/customer_service
+"""
+import re
+import ast
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 1536
+RESPONSE_WORDS = 30
+# the model reads roughly four characters per token
+CHARS_PER_TOKEN = 4
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+MODERATION_CATEGORIES = (
+    "harassment", "harassment/threatening", "hate", "hate/threatening", "self-harm",
+    "self-harm/instructions", "self-harm/intent", "sexual", "sexual/minors", "violence", "violence/graphic",
+)
+WORDS = (
+    "the", "assistant", "can", "help", "you", "with", "your", "request", "please", "let", "me", "know",
+    "more", "about", "what", "need", "order", "product", "service", "account", "details", "today",
+)
+
+NLU_CHOICES = re.compile(r"Only choose from the following options\.\n(.*?)\n\nAnswer:", re.S)
+SLOTS_STATES = re.compile(r"Dialogue Statues:\n(.*?)\nConversation:\n", re.S)
+YES_NO = re.compile(r"Reply with 'yes'|should only be yes or no", re.I)
+
+
+class Latency:
+    """Samples the latency of a response, in seconds.
+
+    `constant` always waits `mean`, `uniform` draws from [low, high] and `lognormal` draws
+    around the median `mean` with the log-space spread `sigma`. `per_token` is added for
+    every generated token, and paces the chunks of a streamed response.
+    """
+
+    def __init__(self, distribution: str = "constant", mean: float = 0.0, low: float = 0.0, high: float = 0.0,
+                 sigma: float = 0.5, per_token: float = 0.0, seed: Optional[int] = None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution}, expected one of {LATENCY_DISTRIBUTIONS}")
+        self.distribution = distribution
+        self.mean = mean
+        self.low = low
+        self.high = high
+        self.sigma = sigma
+        self.per_token = per_token
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self.lock:
+            if self.distribution == "uniform":
+                return self.rng.uniform(self.low, self.high)
+            if self.distribution == "lognormal":
+                return self.rng.lognormvariate(np.log(self.mean), self.sigma) if self.mean > 0 else 0.0
+            return self.mean
+
+
+class Script:
+    """Scripted responses: the first rule whose `pattern` matches the prompt gives the response.
+
+    The script is a JSON list of {"pattern": <regex>, "response": <str or JSON object>}.
+    """
+
+    def __init__(self, rules: Optional[List[dict]] = None):
+        self.rules = [(re.compile(rule["pattern"], re.S), rule["response"]) for rule in rules or []]
+
+    @classmethod
+    def from_file(cls, path: Optional[str]) -> "Script":
+        if not path:
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def match(self, prompt: str) -> Optional[Any]:
+        for pattern, response in self.rules:
+            if pattern.search(prompt):
+                return response
+        return None
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def prompt_text(messages: List[dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def deterministic_text(prompt: str, num_words: int = RESPONSE_WORDS) -> str:
+    rng = random.Random(_digest(prompt))
+    words = [rng.choice(WORDS) for _ in range(num_words)]
+    return " ".join(words).capitalize() + "."
+
+
+def default_response(prompt: str, num_words: int = RESPONSE_WORDS) -> str:
+    """Deterministic response to the prompts of the agents: an option of the NLU multiple
+    choice, `no` to the yes or no questions, and filler text otherwise."""
+    choices = NLU_CHOICES.search(prompt)
+    if choices:
+        options = [line.strip() for line in choices.group(1).splitlines() if line.strip()]
+        if options:
+            return options[_digest(prompt) % len(options)]
+    if YES_NO.search(prompt):
+        return "no"
+    return deterministic_text(prompt, num_words)
+
+
+def value_from_schema(schema: dict, defs: dict) -> Any:
+    """Minimal value that validates against a JSON schema."""
+    if "$ref" in schema:
+        return value_from_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return value_from_schema(schema[key][0], defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type", "object")
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if schema_type == "object":
+        return {name: value_from_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return []
+    return {"string": "", "integer": 0, "number": 0, "boolean": False, "null": None}.get(schema_type)
+
+
+def structured_response(prompt: str, json_schema: dict) -> str:
+    """JSON content for a structured output request. The slot filling prompt gets its
+    dialogue states back unchanged."""
+    schema = json_schema.get("schema", {})
+    value = value_from_schema(schema, schema.get("$defs", {}))
+    states = SLOTS_STATES.search(prompt)
+    if states and isinstance(value, dict) and "slots" in value:
+        try:
+            value["slots"] = [
+                slot if isinstance(slot, dict) else dict(slot)
+                for slot in ast.literal_eval(states.group(1).strip())
+            ]
+        except (ValueError, SyntaxError, TypeError):
+            logger.warning("Failed to parse the dialogue states of the slot filling prompt")
+    return json.dumps(value)
+
+
+def embed(item, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Deterministic unit vector of a text or of a list of token ids."""
+    rng = np.random.default_rng(_digest(item if isinstance(item, str) else json.dumps(item)))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.requests = {}
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, endpoint: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "uptime": time.time() - self.started,
+                "requests": dict(self.requests),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+def create_app(latency: Optional[Latency] = None, script: Optional[Script] = None,
+               embedding_dim: int = EMBEDDING_DIM, response_words: int = RESPONSE_WORDS) -> FastAPI:
+    latency = latency or Latency()
+    script = script or Script()
+    stats = Stats()
+    app = FastAPI()
+    app.state.stats = stats
+
+    def completion_body(model: str, choices: List[dict], prompt_tokens: int, completion_tokens: int, obj: str = "chat.completion") -> dict:
+        return {
+            "id": f"chatcmpl-stub-{_digest(str(time.time_ns())):x}",
+            "object": obj,
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        data = await request.json()
+        model = data.get("model", "stub")
+        prompt = prompt_text(data.get("messages", []))
+        response_format = data.get("response_format") or {}
+        scripted = script.match(prompt)
+        if scripted is not None:
+            content = scripted if isinstance(scripted, str) else json.dumps(scripted)
+        elif response_format.get("type") == "json_schema":
+            content = structured_response(prompt, response_format.get("json_schema", {}))
+        elif response_format.get("type") == "json_object":
+            content = "{}"
+        else:
+            content = default_response(prompt, response_words)
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = count_tokens(content)
+        stats.record("chat.completions", prompt_tokens, completion_tokens)
+
+        if not data.get("stream"):
+            await asyncio.sleep(latency.sample() + latency.per_token * completion_tokens)
+            choices = [
+                {"index": idx, "message": {"role": "assistant", "content": content, "refusal": None}, "finish_reason": "stop", "logprobs": None}
+                for idx in range(data.get("n") or 1)
+            ]
+            return completion_body(model, choices, prompt_tokens, completion_tokens)
+
+        include_usage = (data.get("stream_options") or {}).get("include_usage", False)
+
+        async def events():
+            await asyncio.sleep(latency.sample())
+            # split on spaces, keeping them, so that the chunks join back into the content
+            for piece in re.findall(r"\S+\s*|\s+", content):
+                chunk = completion_body(model, [{"index": 0, "delta": {"content": piece}, "finish_reason": None}], 0, 0, "chat.completion.chunk")
+                del chunk["usage"]
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(latency.per_token * count_tokens(piece))
+            last = completion_body(model, [{"index": 0, "delta": {}, "finish_reason": "stop"}], prompt_tokens, completion_tokens, "chat.completion.chunk")
+            if not include_usage:
+                del last["usage"]
+            yield f"data: {json.dumps(last)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/moderations")
+    async def moderations(request: Request):
+        data = await request.json()
+        inputs = data.get("input", "")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        stats.record("moderations")
+        await asyncio.sleep(latency.sample())
+        return {
+            "id": "modr-stub",
+            "model": data.get("model") or "text-moderation-latest",
+            "results": [
+                {
+                    "flagged": False,
+                    "categories": {category: False for category in MODERATION_CATEGORIES},
+                    "category_scores": {category: 0.0 for category in MODERATION_CATEGORIES},
+                }
+                for _ in inputs
+            ],
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        data = await request.json()
+        inputs = data.get("input", "")
+        # a single text, or a single list of token ids
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = data.get("dimensions") or embedding_dim
+        prompt_tokens = sum(count_tokens(item) if isinstance(item, str) else len(item) for item in inputs)
+        stats.record("embeddings", prompt_tokens)
+        await asyncio.sleep(latency.sample())
+        vectors = [embed(item, dim) for item in inputs]
+        if data.get("encoding_format") == "base64":
+            vectors = [base64.b64encode(vector.tobytes()).decode("ascii") for vector in vectors]
+        else:
+            vectors = [vector.tolist() for vector in vectors]
+        return {
+            "object": "list",
+            "model": data.get("model", "stub"),
+            "data": [{"object": "embedding", "index": idx, "embedding": vector} for idx, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.snapshot()
+
+    @app.delete("/stats")
+    async def reset_stats():
+        stats.reset()
+        return stats.snapshot()
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=str, default="constant", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--latency-mean", type=float, default=0.0, help="Constant latency, or median of the lognormal latency, in seconds")
+    parser.add_argument("--latency-low", type=float, default=0.0)
+    parser.add_argument("--latency-high", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--latency-per-token", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--script", type=str, default=None, help="JSON list of {pattern, response} rules")
+    parser.add_argument("--embedding-dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--response-words", type=int, default=RESPONSE_WORDS)
+    args = parser.parse_args()
+
+    app = create_app(
+        latency=Latency(args.latency, args.latency_mean, args.latency_low, args.latency_high,
+                        args.latency_sigma, args.latency_per_token, args.seed),
+        script=Script.from_file(args.script),
+        embedding_dim=args.embedding_dim,
+        response_words=args.response_words,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
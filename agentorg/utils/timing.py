@@ -0,0 +1,204 @@
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+
+logger = logging.getLogger(__name__)
+
+# stage of the LLM calls made outside of any span
+DEFAULT_STAGE = "other"
+TURN_STAGE = "turn"
+TURN_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_FIELDS = ("time", "count", "llm_calls", "prompt_tokens", "completion_tokens", "cache_hits")
+
+
+class TimingRecorder:
+    """Per-stage wall time, LLM calls, tokens and cache hits of one turn, in `stages`:
+    {stage: {"time", "count", "llm_calls", "prompt_tokens", "completion_tokens", "cache_hits"}}.
+    Stages nest: the time of a stage includes its inner stages, while the LLM calls and the
+    cache hits go to the innermost stage only."""
+
+    def __init__(self, stages: Optional[dict] = None):
+        self.stages = stages if stages is not None else {}
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, **increments):
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = {field: 0 for field in STAGE_FIELDS}
+            for field, value in increments.items():
+                stats[field] += value
+
+
+# recorder of the current turn, and the innermost stage
+_recorder: ContextVar[Optional[TimingRecorder]] = ContextVar("timing_recorder", default=None)
+_stage: ContextVar[str] = ContextVar("timing_stage", default=DEFAULT_STAGE)
+# set by a cache hit until the end of the LLM call it answered
+_cache_hit: ContextVar[bool] = ContextVar("timing_cache_hit", default=False)
+
+
+class LLMUsageHandler(BaseCallbackHandler):
+    """Records the langchain model calls and their token usage into the current stage."""
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        recorder = _recorder.get()
+        if recorder is None:
+            return
+        if _cache_hit.get():
+            # served by the cache, already recorded as a cache hit
+            _cache_hit.set(False)
+            return
+        prompt_tokens, completion_tokens = 0, 0
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if token_usage:
+            prompt_tokens = token_usage.get("prompt_tokens") or 0
+            completion_tokens = token_usage.get("completion_tokens") or 0
+        else:
+            # streamed responses report their usage on the message, when the model sends it
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        recorder.add(_stage.get(), llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+# the handler is added to every langchain run started while a turn is recorded
+_usage_handler: ContextVar[Optional[LLMUsageHandler]] = ContextVar("timing_usage_handler", default=None)
+register_configure_hook(_usage_handler, inheritable=True)
+usage_handler = LLMUsageHandler()
+
+
+class span:
+    """Time a stage of the turn, as a context manager or a decorator:
+
+        with span("moderation"):
+            ...
+
+        @span("nlu")
+        def execute(...):
+
+    It costs a context variable lookup when no turn is recorded."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.recorder = None
+        self.start_time = None
+        self.token = None
+
+    def __enter__(self):
+        self.recorder = _recorder.get()
+        if self.recorder is not None:
+            self.token = _stage.set(self.name)
+            self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.recorder is not None:
+            self.recorder.add(self.name, time=time.perf_counter() - self.start_time, count=1)
+            _stage.reset(self.token)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # a new span per call, so that the decorated function can be reentered
+            with span(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def record_llm_call(prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Record a model call made without langchain, e.g. with the OpenAI client."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.add(_stage.get(), llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def record_cache_hit(llm: bool = False):
+    """Record a cache hit in the current stage. `llm` marks a cached LLM response, which is
+    then not counted as a model call."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.add(_stage.get(), cache_hits=1)
+        if llm:
+            _cache_hit.set(True)
+
+
+class StageMetrics:
+    """Totals of the recorded turns of the process, exported in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.turn_buckets = [0] * len(TURN_BUCKETS)
+        self.turn_count = 0
+        self.turn_sum = 0.0
+
+    def observe(self, stages: dict):
+        with self.lock:
+            for stage, stats in stages.items():
+                totals = self.stages.setdefault(stage, {field: 0 for field in STAGE_FIELDS})
+                for field in STAGE_FIELDS:
+                    totals[field] += stats.get(field, 0)
+            turn_time = stages.get(TURN_STAGE, {}).get("time")
+            if turn_time is not None:
+                self.turn_count += 1
+                self.turn_sum += turn_time
+                for idx, bound in enumerate(TURN_BUCKETS):
+                    if turn_time <= bound:
+                        self.turn_buckets[idx] += 1
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [
+                "# HELP agentorg_turn_duration_seconds Latency of the chatbot turns.",
+                "# TYPE agentorg_turn_duration_seconds histogram",
+            ]
+            for bound, count in zip(TURN_BUCKETS, self.turn_buckets):
+                lines.append(f'agentorg_turn_duration_seconds_bucket{{le="{bound}"}} {count}')
+            lines.append(f'agentorg_turn_duration_seconds_bucket{{le="+Inf"}} {self.turn_count}')
+            lines.append(f"agentorg_turn_duration_seconds_sum {self.turn_sum}")
+            lines.append(f"agentorg_turn_duration_seconds_count {self.turn_count}")
+            counters = (
+                ("agentorg_stage_duration_seconds_total", "time", "Wall time spent in the stage."),
+                ("agentorg_stage_calls_total", "count", "Number of times the stage ran."),
+                ("agentorg_llm_calls_total", "llm_calls", "LLM calls made in the stage."),
+                ("agentorg_llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent in the stage."),
+                ("agentorg_llm_completion_tokens_total", "completion_tokens", "Completion tokens received in the stage."),
+                ("agentorg_cache_hits_total", "cache_hits", "Cache hits in the stage."),
+            )
+            for name, field, description in counters:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} counter")
+                for stage, totals in sorted(self.stages.items()):
+                    lines.append(f'{name}{{stage="{stage}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = StageMetrics()
+
+
+@contextmanager
+def record_timing(stages: Optional[dict] = None):
+    """Record the stages of a turn into `stages` (e.g. params["timing"]), and add them to the
+    process metrics at the end of the turn."""
+    recorder = TimingRecorder(stages)
+    recorder_token = _recorder.set(recorder)
+    handler_token = _usage_handler.set(usage_handler)
+    try:
+        with span(TURN_STAGE):
+            yield recorder.stages
+    finally:
+        _usage_handler.reset(handler_token)
+        _recorder.reset(recorder_token)
+        metrics.observe(recorder.stages)
@@ -1,8 +1,186 @@
+import os
+import re
+import uuid
+import atexit
+import time
+import queue
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
 from enum import Enum
+from typing import Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# fraction of the conversations that are traced, all the runs of a sampled conversation are kept
+TRACE_SAMPLE_RATE = "AGENTORG_TRACE_SAMPLE_RATE"
+# runs waiting for the exporter, the new runs are dropped when it is full
+TRACE_QUEUE_SIZE = "AGENTORG_TRACE_QUEUE_SIZE"
+# size caps of the traced payloads
+TRACE_MAX_CHARS = "AGENTORG_TRACE_MAX_CHARS"
+MAX_ITEMS = 50
+MAX_DEPTH = 6
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0
+SHUTDOWN_TIMEOUT = 5.0
+
+REDACTED = "[REDACTED]"
+REDACTED_KEYS = re.compile(
+    r"api_?key|password|passwd|secret|access_?token|auth_?token|authorization|cookie|ssn|credit_?card|card_?number",
+    re.I
+)
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
 
 class TraceRunName(str, Enum):
     TaskGraph = "TaskGraph"
     ExecutionResult = "ExecutionResult"
     OrchestResponse = "OrchestResponse"
     NLU = "NLU"
-    SlotFilling = "SlotFilling"
\ No newline at end of file
+    SlotFilling = "SlotFilling"
+
+
+def sanitize(value: Any, max_chars: int, depth: int = 0) -> Any:
+    """JSON-able copy of a payload with the secrets and e-mail addresses redacted, long
+    strings truncated and the containers capped, so that its cost is bounded."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Enum):
+        return sanitize(value.value, max_chars, depth)
+    if depth >= MAX_DEPTH:
+        return "[...]"
+    if isinstance(value, str):
+        value = EMAIL.sub(REDACTED, value)
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}...[{len(value) - max_chars} more chars]"
+        return value
+    if isinstance(value, dict):
+        sanitized = {}
+        for idx, (key, item) in enumerate(value.items()):
+            if idx >= MAX_ITEMS:
+                sanitized["..."] = f"[{len(value) - MAX_ITEMS} more items]"
+                break
+            key = str(key)
+            sanitized[key] = REDACTED if REDACTED_KEYS.search(key) else sanitize(item, max_chars, depth + 1)
+        return sanitized
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        sanitized = [sanitize(item, max_chars, depth + 1) for item in items[:MAX_ITEMS]]
+        if len(items) > MAX_ITEMS:
+            sanitized.append(f"[{len(items) - MAX_ITEMS} more items]")
+        return sanitized
+    if hasattr(value, "model_dump"):
+        return sanitize(value.model_dump(), max_chars, depth)
+    return sanitize(str(value), max_chars, depth)
+
+
+class BackgroundTracer:
+    """Exports the LangSmith runs of the orchestrator from a background thread.
+
+    Tracing follows `LANGCHAIN_TRACING_V2`: when it is not `true`, `enabled` is False and
+    the call sites skip building their payloads. Otherwise the request path only samples
+    the conversation and takes a size-capped, redacted copy of the payload, and the runs
+    are sent in batches by the exporter thread. When the queue is full, runs are dropped
+    rather than blocking the request.
+    """
+
+    def __init__(self):
+        self._enabled = None
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        # read once, after the modules had the chance to load their .env
+        if self._enabled is None:
+            self._enabled = os.environ.get("LANGCHAIN_TRACING_V2", "").lower() == "true"
+            self.sample_rate = float(os.environ.get(TRACE_SAMPLE_RATE, "1.0"))
+            self.max_chars = int(os.environ.get(TRACE_MAX_CHARS, "2000"))
+            self.queue_size = int(os.environ.get(TRACE_QUEUE_SIZE, "1000"))
+        return self._enabled
+
+    def sampled(self, conv_id: Optional[str]) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        digest = hashlib.sha256(str(conv_id).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64 < self.sample_rate
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.queue = queue.Queue(maxsize=self.queue_size)
+                self.thread = threading.Thread(target=self._export, name="trace-exporter", daemon=True)
+                self.thread.start()
+                atexit.register(self.shutdown)
+
+    def record(self, name: str, inputs: Optional[dict] = None, outputs: Optional[dict] = None, metadata: Optional[dict] = None):
+        if not self.enabled or not self.sampled((metadata or {}).get("conv_id")):
+            return
+        if self.thread is None:
+            self._start()
+        now = datetime.now(timezone.utc)
+        run_id = uuid.uuid4()
+        run = {
+            "id": str(run_id),
+            "trace_id": str(run_id),
+            "dotted_order": f"{now.strftime('%Y%m%dT%H%M%S%fZ')}{run_id}",
+            "name": str(getattr(name, "value", name)),
+            "run_type": "chain",
+            "start_time": now,
+            "end_time": now,
+            "inputs": sanitize(inputs or {}, self.max_chars),
+            "outputs": sanitize(outputs or {}, self.max_chars),
+            "extra": {"metadata": sanitize(metadata or {}, self.max_chars)},
+            "session_name": os.environ.get("LANGCHAIN_PROJECT", "default"),
+        }
+        try:
+            self.queue.put_nowait(run)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning("Trace queue is full, %d runs dropped so far", self.dropped)
+
+    def _export(self):
+        from langsmith import Client
+
+        client = Client(auto_batch_tracing=False)
+        stop = False
+        while not stop:
+            # a batch is sent when it is full, or FLUSH_INTERVAL after its first run
+            run = self.queue.get()
+            if run is None:
+                break
+            batch = [run]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    run = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if run is None:
+                    stop = True
+                    break
+                batch.append(run)
+            try:
+                client.batch_ingest_runs(create=batch)
+            except Exception as e:
+                logger.warning("Failed to export %d trace runs: %s", len(batch), e)
+
+    def shutdown(self):
+        """Flush the pending runs, waiting at most SHUTDOWN_TIMEOUT seconds."""
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=SHUTDOWN_TIMEOUT)
+        except queue.Full:
+            return
+        self.thread.join(SHUTDOWN_TIMEOUT)
+
+
+tracer = BackgroundTracer()
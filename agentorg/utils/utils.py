@@ -1,8 +1,14 @@
 import os
 import sys
+import copy
 import json
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import reprlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 import tiktoken
 import Levenshtein
@@ -10,12 +16,123 @@ import Levenshtein
 logger = logging.getLogger(__name__)
 
 
-def init_logger(log_level=logging.INFO, filename=None):
+LOG_FORMAT = "[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s"
+LOG_DATE_FORMAT = "%m/%d/%Y %H:%M:%S"
+# longest logged message, and longest logged argument
+MAX_LOG_LENGTH = 4000
+MAX_LOG_FIELD_LENGTH = 2000
+
+# fields of the current conversation turn attached to the log records
+_log_context = ContextVar("log_context", default={})
+_listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (e.g. conv_id, turn_id) to the records logged in this context."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def truncate(text: str, max_length: int) -> str:
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}...[{len(text) - max_length} more chars]"
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _log_context.get()
+        record.conv_id = context.get("conv_id", "")
+        record.turn_id = context.get("turn_id", "")
+        return True
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, fmt=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, max_length=MAX_LOG_LENGTH):
+        super().__init__(fmt=fmt, datefmt=datefmt)
+        self.max_length = max_length
+
+    def format(self, record):
+        msg, args = record.msg, record.args
+        record.msg, record.args = truncate(record.getMessage(), self.max_length), None
+        try:
+            return super().format(record)
+        finally:
+            record.msg, record.args = msg, args
+
+
+class JsonFormatter(TruncatingFormatter):
+    """One JSON object per record, with the conv_id and turn_id of the turn."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "conv_id": getattr(record, "conv_id", ""),
+            "turn_id": getattr(record, "turn_id", ""),
+            "message": truncate(record.getMessage(), self.max_length),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Hands the records to the listener thread, which formats and writes them.
+
+    The message is not formatted on the calling thread: the arguments are only
+    snapshotted, containers through a size bounded repr, so that the logged values
+    cannot change before they are written and large values cost little."""
+
+    def __init__(self, queue, max_length=MAX_LOG_FIELD_LENGTH):
+        super().__init__(queue)
+        self.max_length = max_length
+        self.repr = reprlib.Repr()
+        self.repr.maxlevel = 4
+        self.repr.maxdict = self.repr.maxlist = self.repr.maxtuple = self.repr.maxset = 50
+        self.repr.maxstring = self.repr.maxother = max_length
+
+    def snapshot(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, (dict, list, tuple, set, frozenset)):
+            return self.repr.repr(value)
+        return truncate(str(value), self.max_length)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = {key: self.snapshot(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(self.snapshot(arg) for arg in record.args)
+        return record
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def init_logger(log_level=logging.INFO, filename=None, json_format=False, use_queue=True):
+    """Log to the terminal, and to a rotating file if `filename` is given. With `use_queue`,
+    the records are written by a background listener thread instead of the logging thread.
+    `json_format` writes one JSON object per record, with the conv_id and turn_id of the turn."""
     root_logger = logging.getLogger()  # Root logger
 
     # Remove existing handlers to reconfigure them
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
+    _stop_listener()
+    formatter = JsonFormatter() if json_format else TruncatingFormatter()
     handlers = []
     # File handler
     if filename is not None:
@@ -31,23 +148,26 @@ def init_logger(log_level=logging.INFO, filename=None):
             delay=0
         )
         file_handler.setLevel(log_level)  # Set log level for the file
-        file_handler.setFormatter(logging.Formatter(
-            "[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s",
-            datefmt="%m/%d/%Y %H:%M:%S"
-        ))
+        file_handler.setFormatter(formatter)
         handlers.append(file_handler)
 
     # Stream (terminal) handler
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setLevel(log_level)  # Set log level for the terminal
-    stream_handler.setFormatter(logging.Formatter(
-        "[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s",
-        datefmt="%m/%d/%Y %H:%M:%S"
-    ))
+    stream_handler.setFormatter(formatter)
     handlers.append(stream_handler)
 
-    for handler in handlers:
-        root_logger.addHandler(handler)
+    if use_queue:
+        global _listener
+        queue_handler = LazyQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(ContextFilter())
+        root_logger.addHandler(queue_handler)
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            handler.addFilter(ContextFilter())
+            root_logger.addHandler(handler)
     root_logger.setLevel(log_level)
 
     # Suppress noisy loggers
@@ -57,6 +177,9 @@ def init_logger(log_level=logging.INFO, filename=None):
     return logging.getLogger(__name__)
 
 
+atexit.register(_stop_listener)
+
+
 def chunk_string(text, tokenizer, max_length, from_end=True):
     # Initialize the tokenizer
 	encoding = tiktoken.get_encoding(tokenizer)
@@ -68,7 +191,8 @@ def chunk_string(text, tokenizer, max_length, from_end=True):
 	return chunks
 
 def normalize(lst):
-		return [float(num)/sum(lst) for num in lst]
+	total = sum(lst)
+	return [float(num)/total for num in lst]
 
 def str_similarity(string1, string2):
 	try:
@@ -76,7 +200,7 @@ def str_similarity(string1, string2):
 		max_length = max(len(string1), len(string2))
 		similarity = 1 - (distance / max_length)
 	except Exception as err:
-		print(err)
+		logger.error(f"Error computing the similarity of {string1!r} and {string2!r}: {err}")
 		similarity = 0
 	return similarity
 
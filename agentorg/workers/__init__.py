@@ -1,10 +1,29 @@
-import os
-import importlib
+from agentorg.workers.worker import WORKER_REGISTRY
 
-# Dynamically import all Python files in the current directory
-module_dir = os.path.dirname(__file__)
-
-for file in os.listdir(module_dir):
-    if file.endswith(".py") and file != "__init__.py":
-        module_name = file[:-3]  # Strip off '.py' to get the module name
-        importlib.import_module(f'.{module_name}', package=__name__)
\ No newline at end of file
+# The workers of this package, imported by the registry when a task graph uses them.
+# The descriptions are the ones of the worker classes, so that they can be listed without
+# importing the workers.
+WORKER_REGISTRY.add_spec(
+    "MessageWorker", "agentorg.workers.message_worker",
+    "The worker that used to deliver the message to the user, either a question or provide some information."
+)
+WORKER_REGISTRY.add_spec(
+    "RAGWorker", "agentorg.workers.rag_worker",
+    "Answer the user's questions based on the company's internal documentations (unstructured text data), such as the policies, FAQs, and product information"
+)
+WORKER_REGISTRY.add_spec(
+    "RagMsgWorker", "agentorg.workers.rag_message_worker",
+    "A combination of RAG and Message Workers"
+)
+WORKER_REGISTRY.add_spec(
+    "SearchWorker", "agentorg.workers.search_worker",
+    "Answer the user's questions based on real-time online search results"
+)
+WORKER_REGISTRY.add_spec(
+    "DataBaseWorker", "agentorg.workers.database_worker",
+    "Help the user with actions related to customer support like a booking system with structured data, always involving search, insert, update, and delete operations."
+)
+WORKER_REGISTRY.add_spec(
+    "DefaultWorker", "agentorg.workers.default_worker",
+    "Default worker decided by chat records if there is no specific worker for the user's query"
+)
@@ -1,7 +1,6 @@
 import logging
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -12,6 +11,7 @@ from agentorg.workers.tools.database.utils import DatabaseActions
 from agentorg.utils.utils import chunk_string
 from agentorg.utils.graph_state import MessageState
 from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
 
 
 
@@ -24,7 +24,7 @@ class DataBaseWorker(BaseWorker):
     description = "Help the user with actions related to customer support like a booking system with structured data, always involving search, insert, update, and delete operations."
 
     def __init__(self):
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
         self.actions = {
             "SearchShow": "Search for shows", 
             "BookShow": "Book a show", 
@@ -55,18 +55,18 @@ class DataBaseWorker(BaseWorker):
         prompt = PromptTemplate.from_template(database_action_prompt)
         input_prompt = prompt.invoke({"user_intent": user_intent, "actions_info": actions_info, "actions_name": actions_name})
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
-        logger.info(f"Chunked prompt for deciding choosing DB action: {chunked_prompt}")
+        logger.info("Chunked prompt for deciding choosing DB action: %s", chunked_prompt)
         final_chain = self.llm | StrOutputParser()
         try:
             answer = final_chain.invoke(chunked_prompt)
             for action_name in self.actions.keys():
                 if action_name in answer:
-                    logger.info(f"Chosen action in the database worker: {action_name}")
+                    logger.info("Chosen action in the database worker: %s", action_name)
                     return action_name
-            logger.info(f"Base action chosen in the database worker: Others")
+            logger.info("Base action chosen in the database worker: Others")
             return "Others"
         except Exception as e:
-            logger.error(f"Error occurred while choosing action in the database worker: {e}")
+            logger.error("Error occurred while choosing action in the database worker: %s", e)
             return "Others"
 
         
@@ -86,9 +86,13 @@ class DataBaseWorker(BaseWorker):
         workflow.add_edge("CancelBooking", "tool_generator")
         return workflow
 
+    def prepare(self, msg_state: MessageState):
+        # the catalog of values of every slot, used to verify the slots
+        return self.DBActions.get_slot_values(msg_state["slots"])
+
     def execute(self, msg_state: MessageState):
         self.DBActions.log_in()
-        msg_state["slots"] = self.DBActions.init_slots(msg_state["slots"])
+        msg_state["slots"] = self.DBActions.init_slots(msg_state["slots"], slot_values=self.prepared)
         graph = self.action_graph.compile()
         result = graph.invoke(msg_state)
         return result
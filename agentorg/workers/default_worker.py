@@ -2,7 +2,6 @@ import logging
 import os
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 
 from agentorg.workers.worker import BaseWorker, register_worker, WORKER_REGISTRY
@@ -10,6 +9,7 @@ from agentorg.workers.prompts import choose_worker_prompt
 from agentorg.utils.utils import chunk_string
 from agentorg.utils.graph_state import MessageState
 from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
 
 
 logger = logging.getLogger(__name__)
@@ -22,10 +22,10 @@ class DefaultWorker(BaseWorker):
 
     def __init__(self):
         super().__init__()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
         self.base_choice = "MessageWorker"
         available_workers = os.getenv("AVAILABLE_WORKERS", "").split(",")
-        self.available_workers = {name: WORKER_REGISTRY[name].description for name in available_workers if name != "DefaultWorker"}
+        self.available_workers = {name: WORKER_REGISTRY.description(name) for name in available_workers if name != "DefaultWorker"}
 
     def _choose_worker(self, state: MessageState, limit=2):
         user_message = state['user_message']
@@ -41,10 +41,10 @@ class DefaultWorker(BaseWorker):
             answer = final_chain.invoke(chunked_prompt)
             for worker_name in self.available_workers.keys():
                 if worker_name in answer:
-                    logger.info(f"Chosen worker for the default worker: {worker_name}")
+                    logger.info("Chosen worker for the default worker: %s", worker_name)
                     return worker_name
             limit -= 1
-        logger.info(f"Base worker chosen for the default worker: {self.base_choice}")
+        logger.info("Base worker chosen for the default worker: %s", self.base_choice)
         return self.base_choice
     
     def execute(self, msg_state: MessageState):
@@ -2,14 +2,16 @@ import logging
 
 from langgraph.graph import StateGraph, START
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 
 from agentorg.workers.worker import BaseWorker, register_worker
 from agentorg.workers.prompts import message_generator_prompt, message_flow_generator_prompt
 from agentorg.utils.utils import chunk_string
+from agentorg.utils.streaming import invoke_or_stream
+from agentorg.utils.timing import span
 from agentorg.utils.graph_state import MessageState
 from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
 
 
 logger = logging.getLogger(__name__)
@@ -22,9 +24,10 @@ class MessageWorker(BaseWorker):
 
     def __init__(self):
         super().__init__()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
         self.action_graph = self._create_action_graph()
 
+    @span("generation")
     def generator(self, state: MessageState) -> MessageState:
         # get the input message
         user_message = state['user_message']
@@ -44,10 +47,10 @@ class MessageWorker(BaseWorker):
         else:
             prompt = PromptTemplate.from_template(message_generator_prompt)
             input_prompt = prompt.invoke({"sys_instruct": state["sys_instruct"], "message": orch_msg_content, "formatted_chat": user_message.history})
-        logger.info(f"Prompt: {input_prompt.text}")
+        logger.info("Prompt: %s", input_prompt.text)
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
         final_chain = self.llm | StrOutputParser()
-        answer = final_chain.invoke(chunked_prompt)
+        answer = invoke_or_stream(final_chain, chunked_prompt)
 
         state["message_flow"] = ""
         state["response"] = answer
@@ -1,13 +1,13 @@
 import logging
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
 
 from agentorg.workers.worker import BaseWorker, register_worker
 from agentorg.workers.message_worker import MessageWorker
 from agentorg.workers.rag_worker import RAGWorker
 from agentorg.utils.graph_state import MessageState
-from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
+from agentorg.utils.streaming import token_sink
 
 
 logger = logging.getLogger(__name__)
@@ -21,21 +21,34 @@ class RagMsgWorker(BaseWorker):
     def __init__(self):
         super().__init__()
         self.action_graph = self._create_action_graph()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
      
     def _create_action_graph(self):
         workflow = StateGraph(MessageState)
         # Add nodes for each worker
-        rag_wkr = RAGWorker()
+        self.rag_wkr = RAGWorker()
         msg_wkr = MessageWorker()
-        workflow.add_node("rag_worker", rag_wkr.execute)
+        workflow.add_node("rag_worker", self.rag_execute)
         workflow.add_node("message_worker", msg_wkr.execute)
         # Add edges
         workflow.add_edge(START, "rag_worker")
         workflow.add_edge("rag_worker", "message_worker")
         return workflow
 
+    def rag_execute(self, msg_state: MessageState):
+        # the RAG answer is only the draft of the message worker, it is not streamed to the user
+        with token_sink(None):
+            return self.rag_wkr.execute(msg_state)
+
+    @classmethod
+    def warm_up(cls):
+        RAGWorker.warm_up()
+
+    def prepare(self, msg_state: MessageState):
+        return self.rag_wkr.prepare(msg_state)
+
     def execute(self, msg_state: MessageState):
+        self.rag_wkr.prepared = self.prepared
         graph = self.action_graph.compile()
         result = graph.invoke(msg_state)
         return result
@@ -1,12 +1,11 @@
 import logging
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
 
 from agentorg.workers.worker import BaseWorker, register_worker
 from agentorg.utils.graph_state import MessageState
 from agentorg.workers.tools.RAG.utils import RetrieveEngine, ToolGenerator
-from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
 
 
 logger = logging.getLogger(__name__)
@@ -20,18 +19,31 @@ class RAGWorker(BaseWorker):
     def __init__(self):
         super().__init__()
         self.action_graph = self._create_action_graph()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
      
     def _create_action_graph(self):
         workflow = StateGraph(MessageState)
         # Add nodes for each worker
-        workflow.add_node("retriever", RetrieveEngine.retrieve)
+        workflow.add_node("retriever", self.retrieve)
         workflow.add_node("tool_generator", ToolGenerator.context_generate)
         # Add edges
         workflow.add_edge(START, "retriever")
         workflow.add_edge("retriever", "tool_generator")
         return workflow
 
+    @classmethod
+    def warm_up(cls):
+        RetrieveEngine.warm_up()
+
+    def prepare(self, msg_state: MessageState):
+        return RetrieveEngine.search(msg_state)
+
+    def retrieve(self, msg_state: MessageState):
+        if self.prepared is not None:
+            msg_state["message_flow"] = self.prepared
+            return msg_state
+        return RetrieveEngine.retrieve(msg_state)
+
     def execute(self, msg_state: MessageState):
         graph = self.action_graph.compile()
         result = graph.invoke(msg_state)
@@ -1,12 +1,11 @@
 import logging
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
 
 from agentorg.workers.worker import BaseWorker, register_worker
 from agentorg.utils.graph_state import MessageState
 from agentorg.workers.tools.RAG.utils import SearchEngine, ToolGenerator
-from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +19,7 @@ class SearchWorker(BaseWorker):
     def __init__(self):
         super().__init__()
         self.action_graph = self._create_action_graph()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
      
     def _create_action_graph(self):
         workflow = StateGraph(MessageState)
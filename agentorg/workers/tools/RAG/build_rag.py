@@ -1,37 +1,40 @@
 import os
 import argparse
-import pickle
 from pathlib import Path
 import logging
 
 from agentorg.utils.loader import Loader
+from agentorg.workers.tools.RAG.utils import FaissRetriever
 
 logger = logging.getLogger(__name__)
 
 
-def build_rag(folder_path, docs):
+def build_rag(folder_path, docs, refresh=False):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
-    filepath = os.path.join(folder_path, "documents.pkl")
+    filepath = os.path.join(folder_path, "documents.db")
     loader = Loader()
-    if Path(filepath).exists():
-        logger.warning(f"Loading existing documents from {os.path.join(folder_path, 'documents.pkl')}! If you want to recrawl, please delete the file or specify a new --output-dir when initiate Generator.")
-        crawled_urls = pickle.load(open(os.path.join(folder_path, "documents.pkl"), "rb"))
-    else:
-        crawled_urls_full = []
-        for doc in docs:
-            source = doc.get("source")
-            num_docs = doc.get("num") if doc.get("num") else 1
-            urls = loader.get_all_urls(source, num_docs)
-            crawled_urls = loader.to_crawled_obj(urls)
-            crawled_urls_full.extend(crawled_urls)
-        Loader.save(filepath, crawled_urls_full)
-
-    chunked_docs = Loader.chunk(crawled_urls)
-    filepath_chunk = os.path.join(folder_path, "chunked_documents.pkl")
-    Loader.save(filepath_chunk, chunked_docs)
-
+    crawled_urls, changed_urls = loader.load_or_crawl(filepath, docs, refresh=refresh)
+
+    # only the pages that are new or changed are re-chunked and re-embedded
+    filepath_chunk = os.path.join(folder_path, "chunked_documents.db")
+    rebuild = not Path(filepath_chunk).exists()
+    removed_ids = []
+    with Loader.load(filepath_chunk) as chunk_store:
+        if rebuild:
+            # the index is then built from the whole chunk store, the chunks are streamed
+            chunk_store.add(Loader.chunk(crawled_urls))
+            chunked_docs = []
+        else:
+            changed = set(changed_urls)
+            for url in changed:
+                removed_ids.extend(chunk.id for chunk in chunk_store.get_by_url(url))
+                chunk_store.delete_by_url(url)
+            chunked_docs = list(Loader.chunk(doc for doc in crawled_urls if doc.url in changed))
+            chunk_store.add(chunked_docs)
+    crawled_urls.close()
+    FaissRetriever.update_index(folder_path, removed_ids, chunked_docs, rebuild=rebuild)
 
 
 if __name__ == "__main__":
@@ -40,6 +43,7 @@ if __name__ == "__main__":
     parser.add_argument("--base_url", required=True, type=str, help="base url to crawl")
     parser.add_argument("--folder_path", required=True, type=str, help="location to save the documents")
     parser.add_argument("--max_num", type=int, default=10, help="maximum number of urls to crawl")
+    parser.add_argument("--refresh", action="store_true", help="re-crawl the saved pages and only update the ones that changed")
     args = parser.parse_args()
 
-    build_rag(folder_path=args.folder_path, docs=[{"source": args.base_url, "num": args.max_num}])
\ No newline at end of file
+    build_rag(folder_path=args.folder_path, docs=[{"source": args.base_url, "num": args.max_num}], refresh=args.refresh)
\ No newline at end of file
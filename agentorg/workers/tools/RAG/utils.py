@@ -1,24 +1,32 @@
 import os
+import shutil
+import pickle
 import logging
+import threading
 from typing import List
-import pickle
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
-from langchain_community.vectorstores.faiss import FAISS
-from langchain_openai import OpenAIEmbeddings
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
 from langchain_community.tools import TavilySearchResults
 
 from agentorg.workers.prompts import context_generator_prompt, retrieve_contextualize_q_prompt, generator_prompt
 from agentorg.utils.utils import chunk_string
+from agentorg.utils.streaming import invoke_or_stream
+from agentorg.utils.timing import span
 from agentorg.utils.graph_state import MessageState
 from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model, embedding_model
+from agentorg.utils.doc_store import CrawledURLObject, DocumentStore
 
 
 logger = logging.getLogger(__name__)
 
+# retrievers of the persisted indexes, shared by the turns of the process
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
 
 class FaissRetriever:
     def __init__(
@@ -30,18 +38,42 @@ class FaissRetriever:
         self.texts = texts
         self.index_path = index_path
         self.embedding_model_name = embedding_model_name
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
         self.retriever = self._init_retriever()
 
     def _init_retriever(self, **kwargs):
         # initiate FAISS retriever
-        embedding_model = OpenAIEmbeddings(
-            model=self.embedding_model_name,
-        )
-        docsearch = FAISS.from_documents(self.texts, embedding_model)
+        embeddings = embedding_model(self.embedding_model_name)
+        if FaissRetriever.index_exists(self.index_path):
+            docsearch = FaissRetriever.load_index(self.index_path, embeddings)
+        else:
+            docsearch = FAISS.from_documents(self.texts, embeddings)
         retriever = docsearch.as_retriever(**kwargs)
         return retriever     
 
+    @staticmethod
+    def index_exists(index_path: str) -> bool:
+        return os.path.exists(os.path.join(index_path, "index.faiss"))
+
+    @staticmethod
+    def load_index(index_path: str, embeddings) -> FAISS:
+        """Load the persisted index read-only, memory mapped where faiss supports it (the
+        inverted lists of the IVF indexes), so that the workers of a server share its pages."""
+        faiss = dependable_faiss_import()
+        index_file = os.path.join(index_path, "index.faiss")
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning("Failed to map the index %s, reading it in memory: %s", index_file, e)
+            index = faiss.read_index(index_file)
+        with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    @staticmethod
+    def to_document(chunk: CrawledURLObject) -> Document:
+        return Document(id=chunk.id, page_content=chunk.content, metadata={"source": chunk.url})
+
     def retrieve_w_score(self, query: str):
         k_value = 4 if not self.retriever.search_kwargs.get('k') else self.retriever.search_kwargs.get('k')
         docs_and_scores = self.retriever.vectorstore.similarity_search_with_score(query, k=k_value)
@@ -53,7 +85,7 @@ class FaissRetriever:
         )
         ret_input_chain = contextualize_q_prompt | self.llm | StrOutputParser()
         ret_input = ret_input_chain.invoke({"chat_history": chat_history_str})
-        logger.info(f"Reformulated input for retriever search: {ret_input}")
+        logger.info("Reformulated input for retriever search: %s", ret_input)
         docs_and_score = self.retrieve_w_score(ret_input)
         retrieved_text = ""
         for doc, score in docs_and_score:
@@ -62,36 +94,88 @@ class FaissRetriever:
 
     @staticmethod
     def load_docs(database_path: str, embeddings: str=None, index_path: str="./index"):
-        document_path = os.path.join(database_path, "chunked_documents.pkl")
+        document_path = os.path.join(database_path, "chunked_documents.db")
         index_path = os.path.join(database_path, "index")
-        logger.info(f"Loaded documents from {document_path}")
-        with open(document_path, 'rb') as fread:
-            documents = pickle.load(fread)
-        logger.info(f"Loaded {len(documents)} documents")
+        if FaissRetriever.index_exists(index_path):
+            # loaded once per process, and again when create.py rewrites the index
+            key = (index_path, os.path.getmtime(os.path.join(index_path, "index.faiss")))
+            with _retrievers_lock:
+                if key not in _retrievers:
+                    for stale_key in [k for k in _retrievers if k[0] == index_path]:
+                        del _retrievers[stale_key]
+                    _retrievers[key] = FaissRetriever(texts=[], index_path=index_path)
+                    logger.info("Loaded index from %s", index_path)
+                return _retrievers[key]
+        logger.info("Loaded documents from %s", document_path)
+        with DocumentStore(document_path) as store:
+            documents = [FaissRetriever.to_document(doc) for doc in store]
+        logger.info("Loaded %s documents", len(documents))
 
         return FaissRetriever(
             texts=documents,
             index_path=index_path
         )
+
+    @staticmethod
+    def update_index(
+            database_path: str, 
+            removed_ids: List[str], 
+            added_chunks: List[CrawledURLObject], 
+            rebuild: bool = False,
+            embedding_model_name: str = "text-embedding-ada-002",
+        ):
+        """Keep the persisted index in sync with the chunk store, only embedding the added chunks.
+        The index is built from the whole chunk store when it does not exist or `rebuild` is set."""
+        index_path = os.path.join(database_path, "index")
+        embeddings = embedding_model(embedding_model_name)
+        if rebuild or not FaissRetriever.index_exists(index_path):
+            if os.path.exists(index_path):
+                shutil.rmtree(index_path)
+            with DocumentStore(os.path.join(database_path, "chunked_documents.db")) as store:
+                documents = [FaissRetriever.to_document(doc) for doc in store]
+            if not documents:
+                logger.warning("No documents to index")
+                return
+            docsearch = FAISS.from_documents(documents, embeddings)
+            logger.info("Built index of %s chunks at %s", len(documents), index_path)
+        else:
+            docsearch = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+            indexed_ids = set(docsearch.index_to_docstore_id.values())
+            stale_ids = [id for id in removed_ids if id in indexed_ids]
+            if stale_ids:
+                docsearch.delete(stale_ids)
+            if added_chunks:
+                docsearch.add_documents([FaissRetriever.to_document(doc) for doc in added_chunks])
+            logger.info("Updated index at %s: removed %s chunks, added %s chunks", index_path, len(stale_ids), len(added_chunks))
+        docsearch.save_local(index_path)
     
 
 class RetrieveEngine():
     @staticmethod
-    def retrieve(state: MessageState):
+    def warm_up():
+        database_path = os.environ.get("DATA_DIR")
+        if database_path and FaissRetriever.index_exists(os.path.join(database_path, "index")):
+            FaissRetriever.load_docs(database_path=database_path)
+
+    @staticmethod
+    @span("retrieval")
+    def search(state: MessageState) -> str:
         # get the input message
         user_message = state['user_message']
 
         # Search for the relevant documents
         docs = FaissRetriever.load_docs(database_path=os.environ.get("DATA_DIR"))
-        retrieved_text = docs.search(user_message.history)
+        return docs.search(user_message.history)
 
-        state["message_flow"] = retrieved_text
+    @staticmethod
+    def retrieve(state: MessageState):
+        state["message_flow"] = RetrieveEngine.search(state)
         return state
 
 
 class SearchEngine():
     def __init__(self):
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
         self.search_tool = TavilySearchResults(
             max_results=5,
             search_depth="advanced",
@@ -107,13 +191,14 @@ class SearchEngine():
             search_text += f"Content: {res['content']} \n\n"
         return search_text
 
+    @span("web_search")
     def search(self, state: MessageState):
         contextualize_q_prompt = PromptTemplate.from_template(
             retrieve_contextualize_q_prompt
         )
         ret_input_chain = contextualize_q_prompt | self.llm | StrOutputParser()
         ret_input = ret_input_chain.invoke({"chat_history": state["user_message"].history})
-        logger.info(f"Reformulated input for search engine: {ret_input}")
+        logger.info("Reformulated input for search engine: %s", ret_input)
         search_results = self.search_tool.invoke({"query": ret_input})
         state["message_flow"] = self.process_search_result(search_results)
         return state
@@ -121,34 +206,36 @@ class SearchEngine():
 
 class ToolGenerator():
     @staticmethod
+    @span("generation")
     def generate(state: MessageState):
         user_message = state['user_message']
         
-        llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        llm = chat_model()
         prompt = PromptTemplate.from_template(generator_prompt)
         input_prompt = prompt.invoke({"sys_instruct": state["sys_instruct"], "formatted_chat": user_message.history})
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
         final_chain = llm | StrOutputParser()
-        answer = final_chain.invoke(chunked_prompt)
+        answer = invoke_or_stream(final_chain, chunked_prompt)
 
         state["response"] = answer
         return state
 
     @staticmethod
+    @span("generation")
     def context_generate(state: MessageState):
-        llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        llm = chat_model()
         # get the input message
         user_message = state['user_message']
         message_flow = state['message_flow']
-        logger.info(f"Retrieved texts (from retriever to generator): {message_flow}")
+        logger.info("Retrieved texts (from retriever to generator): %s", message_flow)
         
         # generate answer based on the retrieved texts
         prompt = PromptTemplate.from_template(context_generator_prompt)
         input_prompt = prompt.invoke({"sys_instruct": state["sys_instruct"], "formatted_chat": user_message.history, "context": message_flow})
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
         final_chain = llm | StrOutputParser()
-        logger.info(f"Prompt: {input_prompt.text}")
-        answer = final_chain.invoke(chunked_prompt)
+        logger.info("Prompt: %s", input_prompt.text)
+        answer = invoke_or_stream(final_chain, chunked_prompt)
         state["message_flow"] = ""
         state["response"] = answer
 
@@ -6,14 +6,15 @@ import logging
 import pandas as pd
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 
 from agentorg.utils.utils import chunk_string
 from agentorg.utils.model_config import MODEL
+from agentorg.utils.clients import chat_model
 from agentorg.utils.graph_state import Slot, SlotDetail, Slots, MessageState
 from agentorg.workers.prompts import database_slot_prompt
 from agentorg.utils.graph_state import StatusEnum
+from agentorg.utils.timing import span
 
 
 DBNAME = 'show_booking_db.sqlite'
@@ -61,7 +62,7 @@ NO_BOOKING_MESSAGE = "You have not booked any show."
 class DatabaseActions:
     def __init__(self, user_id: str=USER_ID):
         self.db_path = os.path.join(os.environ.get("DATA_DIR"), DBNAME)
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = chat_model()
         self.user_id = user_id
 
     def log_in(self):
@@ -70,30 +71,44 @@ class DatabaseActions:
         cursor.execute("SELECT 1 FROM user WHERE id = ?", (self.user_id,))
         result = cursor.fetchone()
         if result is None:
-            logger.info(f"User {self.user_id} not found in the database.")
+            logger.info("User %s not found in the database.", self.user_id)
         else:
-            logger.info(f"User {self.user_id} successfully logged in.")
+            logger.info("User %s successfully logged in.", self.user_id)
         return result is not None
 
-    def init_slots(self, slots: list[Slot]):
+    @span("db_query")
+    def get_slot_values(self, slots: list[Slot]) -> dict:
         if not slots:
             slots = SLOTS
-        self.slots = []
-        self.slot_prompts = []
+        slot_values = {}
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         for slot in slots:
             query = f"SELECT DISTINCT {slot['name']} FROM show"
             cursor.execute(query)
             results = cursor.fetchall()
-            value_list = [result[0] for result in results]
+            slot_values[slot['name']] = [result[0] for result in results]
+        cursor.close()
+        conn.close()
+        return slot_values
+
+    def init_slots(self, slots: list[Slot], slot_values: dict = None):
+        if not slots:
+            slots = SLOTS
+        slot_values = slot_values or {}
+        missing_slots = [slot for slot in slots if slot['name'] not in slot_values]
+        if missing_slots:
+            slot_values = {**slot_values, **self.get_slot_values(missing_slots)}
+        self.slots = []
+        self.slot_prompts = []
+        for slot in slots:
+            value_list = slot_values[slot['name']]
             self.slots.append(self.verify_slot(slot, value_list))
             if not self.slots[-1].confirmed:
                 self.slot_prompts.append(slot["prompt"])
-        cursor.close()
-        conn.close()
         return SLOTS
 
+    @span("slot_verification")
     def verify_slot(self, slot: Slot, value_list: list) -> Slot:
         slot_detail = SlotDetail(**slot, verified_value="", confirmed=False)
         prompt = PromptTemplate.from_template(database_slot_prompt)
@@ -103,21 +118,22 @@ class DatabaseActions:
             "value_list": value_list
         })
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
-        logger.info(f"Chunked prompt for verifying slot: {chunked_prompt}")
+        logger.info("Chunked prompt for verifying slot: %s", chunked_prompt)
         final_chain = self.llm | StrOutputParser()
         try:
             answer = final_chain.invoke(chunked_prompt)
-            logger.info(f"Result for verifying slot value: {answer}")
+            logger.info("Result for verifying slot value: %s", answer)
             for value in value_list:
                 if value in answer:
-                    logger.info(f"Chosen slot value in the database worker: {value}")
+                    logger.info("Chosen slot value in the database worker: %s", value)
                     slot_detail.verified_value = value
                     slot_detail.confirmed = True
                     return slot_detail
         except Exception as e:
-            logger.error(f"Error occurred while verifying slot in the database worker: {e}")
+            logger.error("Error occurred while verifying slot in the database worker: %s", e)
         return slot_detail
 
+    @span("db_query")
     def search_show(self, msg_state: MessageState) -> MessageState:
         # Populate the slots with verified values
         conn = sqlite3.connect(self.db_path)
@@ -145,6 +161,7 @@ class DatabaseActions:
             msg_state["message_flow"] = "Available shows are:\n" + results_df.to_string(index=False)
         return msg_state
 
+    @span("db_query")
     def book_show(self, msg_state: MessageState) -> MessageState:
         logger.info("Enter book show function")
         conn = sqlite3.connect(self.db_path)
@@ -158,7 +175,7 @@ class DatabaseActions:
         # Execute the query
         cursor.execute(query, params)
         rows = cursor.fetchall()
-        logger.info(f"Rows found: {len(rows)}")
+        logger.info("Rows found: %s", len(rows))
         # Check whether info is enough to book a show
         if len(rows) == 0:
             msg_state["status"] = StatusEnum.INCOMPLETE
@@ -187,6 +204,7 @@ class DatabaseActions:
         conn.close()
         return msg_state
 
+    @span("db_query")
     def check_booking(self, msg_state: MessageState) -> MessageState:
         logger.info("Enter check booking function")
         conn = sqlite3.connect(self.db_path)
@@ -213,6 +231,7 @@ class DatabaseActions:
         msg_state["status"] = StatusEnum.COMPLETE
         return msg_state
 
+    @span("db_query")
     def cancel_booking(self, msg_state: MessageState) -> MessageState:
         logger.info("Enter cancel booking function")
         conn = sqlite3.connect(self.db_path)
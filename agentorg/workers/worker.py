@@ -1,18 +1,127 @@
+import logging
+import importlib
+import threading
 from abc import ABC, abstractmethod
+from importlib.metadata import entry_points
+from typing import NamedTuple, Optional
+
 from agentorg.utils.graph_state import MessageState
 
-WORKER_REGISTRY = {}
+
+logger = logging.getLogger(__name__)
+
+# entry point group of the workers defined outside of this package, e.g. in pyproject.toml:
+# [tool.poetry.plugins."agentorg.workers"]
+# MyWorker = "my_package.my_worker:MyWorker"
+ENTRY_POINT_GROUP = "agentorg.workers"
+
+
+class WorkerSpec(NamedTuple):
+    name: str
+    module: str
+    description: Optional[str] = None
+
+
+class WorkerRegistry:
+    """Worker classes by name, imported on first use.
+
+    The registry knows the name, module and description of every worker without importing
+    it: the workers of this package are listed in `agentorg/workers/__init__.py`, and the
+    other packages declare theirs as entry points of the `agentorg.workers` group. Looking
+    up a worker imports its module, whose `@register_worker` adds the class, so a task
+    graph only pays for the imports of the workers it uses."""
+
+    def __init__(self):
+        self.classes = {}
+        self.specs = {}
+        # unknown workers already reported by preload()
+        self.missing = set()
+        self.lock = threading.RLock()
+        self._entry_points_loaded = False
+
+    def add_spec(self, name: str, module: str, description: Optional[str] = None):
+        self.specs[name] = WorkerSpec(name, module, description)
+
+    def _load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            if entry_point.name not in self.specs:
+                self.add_spec(entry_point.name, entry_point.module)
+
+    def spec(self, name: str) -> Optional[WorkerSpec]:
+        if name not in self.specs:
+            self._load_entry_points()
+        return self.specs.get(name)
+
+    def load(self, name: str):
+        """The class of the worker, importing its module if needed. None for an unknown worker."""
+        if name in self.classes:
+            return self.classes[name]
+        spec = self.spec(name)
+        if spec is None:
+            return None
+        with self.lock:
+            importlib.import_module(spec.module)
+        if name not in self.classes:
+            logger.error("Module %s does not register the worker %s", spec.module, name)
+            return None
+        return self.classes[name]
+
+    def preload(self, names):
+        """Import the workers of a task graph up front, e.g. before serving its first turn."""
+        for name in names:
+            if self.load(name) is None and name not in self.missing:
+                self.missing.add(name)
+                logger.warning("Worker %s is not registered in the WORKER_REGISTRY", name)
+
+    def description(self, name: str) -> Optional[str]:
+        """The description of the worker, without importing it when its spec has one."""
+        spec = self.spec(name)
+        if spec is not None and spec.description is not None:
+            return spec.description
+        worker_class = self.load(name)
+        return worker_class.description if worker_class is not None else None
+
+    def __getitem__(self, name):
+        worker_class = self.load(name)
+        if worker_class is None:
+            raise KeyError(name)
+        return worker_class
+
+    def get(self, name, default=None):
+        worker_class = self.load(name)
+        return default if worker_class is None else worker_class
+
+    def __contains__(self, name):
+        return name in self.classes or self.spec(name) is not None
+
+    def keys(self):
+        self._load_entry_points()
+        return list(dict.fromkeys([*self.specs, *self.classes]))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+
+WORKER_REGISTRY = WorkerRegistry()
 
 def register_worker(cls):
     """Decorator to register a worker."""
     cls.name = cls.__name__  # Automatically set name to the class name
-    WORKER_REGISTRY[cls.__name__] = cls  # Register the class
+    WORKER_REGISTRY.classes[cls.__name__] = cls  # Register the class
     return cls
 
 
 class BaseWorker(ABC):
     
     description = None
+    # result of prepare(), set by the orchestrator when the speculative prefetch of the worker was used
+    prepared = None
 
     def __str__(self):
         return f"{self.__class__.__name__}"
@@ -20,6 +129,18 @@ class BaseWorker(ABC):
     def __repr__(self):
         return f"{self.__class__.__name__}"
     
+    @classmethod
+    def warm_up(cls):
+        """Load what the worker shares across turns (e.g. an index) before the first turn,
+        when a server starts."""
+        return None
+
+    def prepare(self, msg_state: MessageState):
+        """Expensive, side effect free work that only depends on the conversation, e.g. retrieval.
+        The orchestrator may run it speculatively while the next node is still being predicted,
+        and sets its result as `self.prepared` before `execute` if the prediction was right."""
+        return None
+
     @abstractmethod
     def execute(self, msg_state: MessageState):
         pass
@@ -0,0 +1,59 @@
+import os
+import json
+
+from agentorg.orchestrator.compiled_graph import CompiledTaskGraph, compiled_graph_path
+
+
+def load_recording(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_taskgraph(recording: dict, nluapi: str, slotfillapi: str) -> dict:
+    """Task graph of a recorded conversation set, in the layout of the generator: a start
+    node, then a chain of nodes per task reached from the start node through the intent of
+    the task. The example configs do not list their tasks, so they come with the recording,
+    and every node is a MessageWorker so that the graph runs without documents or tools."""
+    with open(recording["config"]) as f:
+        config = json.load(f)
+    nodes = [["0", {
+        "name": "MessageWorker",
+        "attribute": {"value": recording["start_message"], "task": "start message", "directed": False},
+        "limit": 1,
+        "type": "start"
+    }]]
+    edges = []
+    node_id = 1
+    for task in recording["tasks"]:
+        for idx, step in enumerate(task["steps"]):
+            nodes.append([str(node_id), {
+                "name": "MessageWorker",
+                "attribute": {"value": step, "task": task["intent"], "directed": False},
+                "limit": 1
+            }])
+            edges.append([
+                "0" if idx == 0 else str(node_id - 1),
+                str(node_id),
+                {
+                    "intent": task["intent"] if idx == 0 else "None",
+                    "attribute": {"weight": 1, "pred": idx == 0, "definition": "", "sample_utterances": []}
+                }
+            ])
+            node_id += 1
+    task_graph = {"nodes": nodes, "edges": edges}
+    for key, value in config.items():
+        task_graph[key] = value
+    task_graph.setdefault("safety_response", "Sorry, I cannot help with that.")
+    task_graph["nluapi"] = nluapi
+    task_graph["slotfillapi"] = slotfillapi
+    return task_graph
+
+
+def write_taskgraph(task_graph: dict, output_dir: str) -> str:
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    taskgraph_path = os.path.join(output_dir, "taskgraph.json")
+    with open(taskgraph_path, "w") as f:
+        json.dump(task_graph, f, indent=4)
+    CompiledTaskGraph(task_graph).save(compiled_graph_path(taskgraph_path))
+    return taskgraph_path
@@ -0,0 +1,279 @@
+"""End-to-end turn latency benchmark.
+
+Replays the recorded conversations of `benchmarks/conversations` over task graphs built
+from the example configs, against the stub LLM server, through `AgentOrg.get_response`
+(`orchestrator` mode) or the `/eval/chat` route of model_api.py (`api` mode), and writes
+the latency percentiles, LLM calls and tokens per turn and the throughput to a JSON file.
+
+    python -m benchmarks.turn_latency --concurrency 1 4 16 --output benchmark.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import uvicorn
+from fastapi.testclient import TestClient
+
+import model_api
+from agentorg.orchestrator.orchestrator import AgentOrg
+from agentorg.utils.utils import init_logger
+from agentorg.utils.model_config import INPROC_ADDR
+from agentorg.utils.stub_llm import create_app, Latency, LATENCY_DISTRIBUTIONS
+from benchmarks.graphs import load_recording, build_taskgraph, write_taskgraph
+
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONVERSATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations")
+USER_PREFIX = "USER"
+WORKER_PREFIX = "ASSISTANT"
+PERCENTILES = (50, 95, 99)
+STARTUP_TIMEOUT = 30
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = STARTUP_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing is listening on port {port} after {timeout}s")
+
+
+class StubServer:
+    """The stub LLM server, served from a background thread of this process."""
+
+    def __init__(self, latency: Latency):
+        self.app = create_app(latency=latency)
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        self.thread.start()
+        wait_for_port(self.port)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+    def stats(self) -> dict:
+        return self.app.state.stats.snapshot()
+
+    def reset_stats(self):
+        self.app.state.stats.reset()
+
+
+def start_nlu_api(port: int) -> subprocess.Popen:
+    # the NLU and slot filling api, as started by start_apis(), on the stub LLM through the inherited environment
+    command = [
+        sys.executable, "-m", "uvicorn", "agentorg.orchestrator.NLU.api:app",
+        "--port", str(port), "--host", "127.0.0.1", "--log-level", "warning"
+    ]
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=os.environ.copy())
+    wait_for_port(port)
+    return process
+
+
+class OrchestratorDriver:
+    """Runs a turn the way run.py does, with a new AgentOrg per turn."""
+
+    def __init__(self, taskgraph_path: str):
+        self.taskgraph_path = taskgraph_path
+
+    def turn(self, history: list, text: str, params: dict):
+        orchestrator = AgentOrg(config=self.taskgraph_path)
+        result = orchestrator.get_response({"text": text, "chat_history": history, "parameters": params})
+        return result["answer"], result["parameters"]
+
+
+class ApiDriver:
+    """Runs a turn through the `/eval/chat` route of model_api.py, served in process."""
+
+    def __init__(self, taskgraph_path: str):
+        model_api.args = argparse.Namespace(input_dir=os.path.dirname(taskgraph_path))
+        self.client = TestClient(model_api.app)
+
+    def turn(self, history: list, text: str, params: dict):
+        response = self.client.post("/eval/chat", json={
+            "history": history + [{"role": USER_PREFIX, "content": text}],
+            "parameters": params
+        })
+        response.raise_for_status()
+        result = response.json()
+        return result["answer"], result["parameters"]
+
+
+DRIVERS = {"orchestrator": OrchestratorDriver, "api": ApiDriver}
+
+
+def run_conversation(driver, start_message: str, utterances: list, conv_id: str) -> list:
+    history = [{"role": WORKER_PREFIX, "content": start_message}]
+    # a fixed conversation id seeds the routing decisions, so that the runs are comparable
+    params = {"metadata": {"conv_id": conv_id}}
+    latencies = []
+    for text in utterances:
+        start_time = time.perf_counter()
+        answer, params = driver.turn(history, text, params)
+        latencies.append(time.perf_counter() - start_time)
+        history.append({"role": USER_PREFIX, "content": text})
+        history.append({"role": WORKER_PREFIX, "content": answer})
+    return latencies
+
+
+def summarize(latencies: list, wall_time: float, stats: dict) -> dict:
+    num_turns = len(latencies)
+    requests = stats["requests"]
+    return {
+        "turns": num_turns,
+        "wall_time": wall_time,
+        "throughput": num_turns / wall_time if wall_time else 0.0,
+        "latency": {
+            "mean": float(np.mean(latencies)),
+            **{f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}
+        },
+        "llm_calls_per_turn": requests.get("chat.completions", 0) / num_turns,
+        "requests_per_turn": {endpoint: count / num_turns for endpoint, count in requests.items()},
+        "prompt_tokens_per_turn": stats["prompt_tokens"] / num_turns,
+        "completion_tokens_per_turn": stats["completion_tokens"] / num_turns,
+        "tokens_per_turn": (stats["prompt_tokens"] + stats["completion_tokens"]) / num_turns,
+    }
+
+
+def run_benchmark(name: str, recording: dict, driver, stub: StubServer, concurrency: int, repeat: int) -> dict:
+    conversations = recording["conversations"]
+    num_convos = max(len(conversations), concurrency * repeat)
+    stub.reset_stats()
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(run_conversation, driver, recording["start_message"], conversations[idx % len(conversations)], f"{name}-{idx}")
+            for idx in range(num_convos)
+        ]
+        latencies = [latency for future in futures for latency in future.result()]
+    wall_time = time.perf_counter() - start_time
+    result = summarize(latencies, wall_time, stub.stats())
+    result["conversations"] = num_convos
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except Exception:
+        return ""
+
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["example"], r["mode"], r["concurrency"]): r for r in json.load(f)["results"]}
+    for result in results:
+        base = baseline.get((result["example"], result["mode"], result["concurrency"]))
+        if base is None:
+            continue
+        changes = [
+            f"{metric} {(result['latency'][metric] / base['latency'][metric] - 1) * 100:+.1f}%"
+            for metric in ("p50", "p95", "p99") if base["latency"][metric]
+        ]
+        if base["throughput"]:
+            changes.append(f"throughput {(result['throughput'] / base['throughput'] - 1) * 100:+.1f}%")
+        print(f"{result['example']} {result['mode']} x{result['concurrency']}: {', '.join(changes)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", type=str, nargs="*", default=None, help="Names of the recordings under benchmarks/conversations. Default is all of them.")
+    parser.add_argument("--mode", type=str, nargs="+", default=["orchestrator"], choices=list(DRIVERS))
+    parser.add_argument("--nlu-mode", type=str, default="remote", choices=["remote", "inproc"], help="NLU and slot filling through their api, or in process")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="Numbers of conversations run concurrently")
+    parser.add_argument("--repeat", type=int, default=2, help="Conversations per concurrent slot")
+    parser.add_argument("--latency", type=str, default="lognormal", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--latency-mean", type=float, default=0.3)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--latency-per-token", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="benchmark_results.json")
+    parser.add_argument("--baseline", type=str, default=None, help="Results of a previous run to compare with")
+    parser.add_argument("--log-level", type=str, default="WARNING")
+    args = parser.parse_args()
+
+    recordings = {
+        os.path.splitext(os.path.basename(path))[0]: path
+        for path in sorted(glob.glob(os.path.join(CONVERSATIONS_DIR, "*.json")))
+    }
+    names = args.examples or list(recordings)
+
+    latency = Latency(args.latency, mean=args.latency_mean, sigma=args.latency_sigma, per_token=args.latency_per_token, seed=args.seed)
+    stub = StubServer(latency)
+    stub.start()
+    os.environ["OPENAI_BASE_URL"] = stub.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    nlu_process = None
+    if args.nlu_mode == "inproc":
+        nluapi, slotfillapi = INPROC_ADDR, INPROC_ADDR
+    else:
+        nlu_port = free_port()
+        nlu_process = start_nlu_api(nlu_port)
+        nluapi, slotfillapi = f"http://127.0.0.1:{nlu_port}/nlu/predict", f"http://127.0.0.1:{nlu_port}/slotfill/predict"
+    init_logger(log_level=getattr(logging, args.log_level.upper(), logging.WARNING))
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in names:
+                recording = load_recording(recordings[name])
+                recording["config"] = os.path.join(ROOT_DIR, recording["config"])
+                task_graph = build_taskgraph(recording, nluapi=nluapi, slotfillapi=slotfillapi)
+                taskgraph_path = write_taskgraph(task_graph, os.path.join(tmp_dir, name))
+                os.environ["DATA_DIR"] = os.path.dirname(taskgraph_path)
+                for mode in args.mode:
+                    driver = DRIVERS[mode](taskgraph_path)
+                    for concurrency in args.concurrency:
+                        result = run_benchmark(name, recording, driver, stub, concurrency, args.repeat)
+                        result.update({"example": name, "mode": mode, "concurrency": concurrency})
+                        results.append(result)
+                        print(
+                            f"{name} {mode} x{concurrency}: "
+                            f"p50 {result['latency']['p50']:.3f}s p95 {result['latency']['p95']:.3f}s p99 {result['latency']['p99']:.3f}s, "
+                            f"{result['llm_calls_per_turn']:.2f} LLM calls and {result['tokens_per_turn']:.0f} tokens per turn, "
+                            f"{result['throughput']:.2f} turns/s"
+                        )
+    finally:
+        if nlu_process is not None:
+            nlu_process.terminate()
+            nlu_process.wait()
+        stub.stop()
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "settings": vars(args),
+            "results": results
+        }, f, indent=4)
+    print(f"Results saved to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
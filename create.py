@@ -12,26 +12,37 @@ from langchain_openai import ChatOpenAI
 from agentorg.utils.utils import init_logger
 from agentorg.orchestrator.orchestrator import AgentOrg
 from agentorg.orchestrator.generator.generator import Generator
+from agentorg.orchestrator.compiled_graph import CompiledTaskGraph, compiled_graph_path
 from agentorg.workers.tools.RAG.build_rag import build_rag
 from agentorg.workers.tools.database.build_database import build_database
-from agentorg.utils.model_config import MODEL
+from agentorg.utils.model_config import MODEL, API_PORT, NLUAPI_ADDR, SLOTFILLAPI_ADDR, INPROC_ADDR
+from agentorg.utils.llm_cache import LLMCache
 
 logger = init_logger(log_level=logging.INFO, filename=os.path.join(os.path.dirname(__file__), "logs", "agentorg.log"))
 
-API_PORT = "55135"
-NLUAPI_ADDR = f"http://localhost:{API_PORT}/nlu/predict"
-SLOTFILLAPI_ADDR = f"http://localhost:{API_PORT}/slotfill/predict"
+
+def generation_model(args) -> ChatOpenAI:
+    # responses are cached on disk so that reruns and resumed runs skip the completed calls
+    cache = None if args.no_llm_cache else LLMCache(os.path.join(args.output_dir, "llm_cache.db"))
+    return ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000, cache=cache)
+
 
 def generate_taskgraph(args):
-    model = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+    model = generation_model(args)
     generator = Generator(args, args.config, model, args.output_dir)
     taskgraph_filepath = generator.generate()
     # Update the task graph with the API URLs
     task_graph = json.load(open(os.path.join(os.path.dirname(__file__), taskgraph_filepath)))
-    task_graph["nluapi"] = NLUAPI_ADDR
-    task_graph["slotfillapi"] = SLOTFILLAPI_ADDR
+    if args.nlu_mode == "inproc":
+        task_graph["nluapi"] = INPROC_ADDR
+        task_graph["slotfillapi"] = INPROC_ADDR
+    else:
+        task_graph["nluapi"] = NLUAPI_ADDR
+        task_graph["slotfillapi"] = SLOTFILLAPI_ADDR
     with open(taskgraph_filepath, "w") as f:
         json.dump(task_graph, f, indent=4)
+    # Compile the task graph for the runtime, it is picked up next to the task graph json
+    CompiledTaskGraph(task_graph).save(compiled_graph_path(taskgraph_filepath))
 
 
 def init_worker(args):
@@ -40,7 +51,7 @@ def init_worker(args):
     workers = config["workers"]
     if "RAGWorker" in workers:
         logger.info("Initializing RAGWorker...")
-        build_rag(args.output_dir, config["rag_docs"])
+        build_rag(args.output_dir, config["rag_docs"], refresh=args.refresh_docs)
 
     elif "DataBaseWorker" in workers:
         logger.info("Initializing DataBaseWorker...")
@@ -53,6 +64,10 @@ if __name__ == "__main__":
     parser.add_argument('--output-dir', type=str, default="./examples/test")
     parser.add_argument('--model', type=str, default=MODEL["model_type_or_path"])
     parser.add_argument('--log-level', type=str, default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    parser.add_argument('--max-concurrency', type=int, default=8, help="Maximum number of tasks planned concurrently by the generator")
+    parser.add_argument('--no-llm-cache', action='store_true', help="Do not reuse the LLM responses cached under output-dir")
+    parser.add_argument('--refresh-docs', action='store_true', help="Re-crawl the saved documents and only re-process the pages that changed")
+    parser.add_argument('--nlu-mode', type=str, default="remote", choices=["remote", "inproc"], help="Call the NLU and slot filling models through their api, or in the chatbot process")
     args = parser.parse_args()
     MODEL["model_type_or_path"] = args.model
     log_level = getattr(logging, args.log_level.upper(), logging.INFO)
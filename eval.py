@@ -5,6 +5,7 @@ import argparse
 from agentorg.evaluation.simulate_first_pass_convos import simulate_conversations
 from agentorg.evaluation.extract_conversation_info import extract_task_completion_metrics
 from agentorg.evaluation.simulate_second_pass_convos import get_labeled_convos
+from agentorg.evaluation.chatgpt_utils import rate_limiter
 from agentorg.utils.model_config import MODEL
 
 
@@ -38,9 +39,13 @@ if __name__ == "__main__":
     parser.add_argument('--config', type=str)
     parser.add_argument('--output-dir', type=str)
     parser.add_argument('--model', type=str, default=MODEL["model_type_or_path"])
+    parser.add_argument('--concurrency', type=int, default=1, help="Number of conversations simulated in parallel")
+    parser.add_argument('--rate-limit', type=int, default=None, help="Maximum number of requests per minute of the simulated users to the OpenAI api")
+    parser.add_argument('--refresh-docs', action='store_true', help="Re-crawl the saved documents and only re-process the pages that changed")
     args = parser.parse_args()
 
     MODEL["model_type_or_path"] = args.model
+    rate_limiter.set_rate(args.rate_limit)
 
     assert args.model_api is not None, "Model api must be provided"
     assert args.config is not None, "Config file must be provided"
@@ -54,9 +59,10 @@ if __name__ == "__main__":
     config = json.load(open(args.config))
     config['model_api'] = args.model_api
     config['documents_dir'] = args.documents_dir
+    config['refresh_docs'] = args.refresh_docs
     config['model_params'] = args.model_params
     config['synthetic_data_params'] = {'num_convos': args.num_convos, 'num_goals': args.num_goals, 
-                                       'max_turns': args.max_turns}
+                                       'max_turns': args.max_turns, 'concurrency': args.concurrency}
 
     first_pass_data, final_convos, goal_metrics = evaluate(config)
 
@@ -4,7 +4,9 @@ import string
 import subprocess
 import signal
 import atexit
+import threading
 from typing import Dict
+from contextlib import asynccontextmanager, contextmanager
 import json
 from http import HTTPStatus
 import argparse
@@ -12,15 +14,103 @@ import argparse
 import uvicorn
 
 from openai import OpenAI
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, PlainTextResponse
 
 from agentorg.orchestrator.orchestrator import AgentOrg
-from create import API_PORT
-from agentorg.utils.model_config import MODEL
+from agentorg.orchestrator.NLU.nlu import is_inproc
+from agentorg.utils.model_config import MODEL, API_PORT
+from agentorg.utils.timing import metrics
+from agentorg.utils.utils import init_logger
 
 
 logger = logging.getLogger(__name__)
-app = FastAPI()
+
+# The settings are read from the environment, so that every worker process of the server
+# (uvicorn --workers, gunicorn) gets them; `python model_api.py` sets them from its arguments.
+INPUT_DIR_ENV = "AGENTORG_INPUT_DIR"
+MODEL_ENV = "AGENTORG_MODEL"
+LOG_LEVEL_ENV = "AGENTORG_LOG_LEVEL"
+LOG_FORMAT_ENV = "AGENTORG_LOG_FORMAT"
+WORKERS_ENV = "AGENTORG_WORKERS"
+GRACEFUL_TIMEOUT_ENV = "AGENTORG_GRACEFUL_TIMEOUT"
+# conversation id of the request and of the response, for load balancers that route the turns
+# of a conversation to the same server (e.g. nginx `hash $http_x_conversation_id consistent`)
+CONV_ID_HEADER = "X-Conversation-Id"
+
+args = argparse.Namespace(input_dir=os.environ.get(INPUT_DIR_ENV, "./examples/test"))
+if os.environ.get(MODEL_ENV):
+    MODEL["model_type_or_path"] = os.environ[MODEL_ENV]
+if os.environ.get(INPUT_DIR_ENV):
+    os.environ.setdefault("DATA_DIR", args.input_dir)
+
+
+class OrchestratorPool:
+    """The idle orchestrators of the process, per task graph. An AgentOrg keeps the state of
+    the turn it serves on its task graph, so a turn takes one out of the pool and puts it back
+    when it is done, and concurrent turns get their own. A rewritten task graph gets new ones."""
+
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _key(self, config: str):
+        return config, os.path.getmtime(config)
+
+    def put(self, config: str, orchestrator: AgentOrg):
+        key = self._key(config)
+        with self._lock:
+            for stale in [other for other in self._idle if other[0] == config and other != key]:
+                del self._idle[stale]
+            self._idle.setdefault(key, []).append(orchestrator)
+
+    @contextmanager
+    def acquire(self, config: str):
+        key = self._key(config)
+        with self._lock:
+            idle = self._idle.get(key)
+            orchestrator = idle.pop() if idle else None
+        if orchestrator is None:
+            orchestrator = AgentOrg(config=config)
+        try:
+            yield orchestrator
+        finally:
+            self.put(config, orchestrator)
+
+
+orchestrators = OrchestratorPool()
+
+
+def warm_up():
+    """Runs in every worker process before it serves: builds an orchestrator of the task graph,
+    which loads its compiled graph and its workers, and the indexes of the workers. The
+    orchestrator then serves the first turn of the process."""
+    if os.environ.get(LOG_LEVEL_ENV):
+        init_logger(
+            log_level=getattr(logging, os.environ[LOG_LEVEL_ENV].upper(), logging.INFO),
+            filename=os.path.join(os.path.dirname(__file__), "logs", "agentorg.log"),
+            json_format=os.environ.get(LOG_FORMAT_ENV) == "json"
+        )
+    config = os.path.join(args.input_dir, "taskgraph.json")
+    if not os.path.exists(config):
+        logger.warning("No task graph at %s, nothing to preload", config)
+        return
+    orchestrator = AgentOrg(config=config)
+    orchestrator.warm_up()
+    orchestrators.put(config, orchestrator)
+    logger.info("Worker process %s is ready", os.getpid())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up()
+    yield
+    # uvicorn has stopped accepting connections and waited for the in-flight requests
+    logger.info("Worker process %s drained", os.getpid())
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CONFIG_TASKGRAPH = None
 
@@ -45,18 +135,19 @@ def terminate_subprocess():
         process.wait()  # Ensure it stops
         logger.info("FastAPI process terminated.")
 
-# Register cleanup function to run on program exit
-atexit.register(terminate_subprocess)
 
-# Handle signals (e.g., Ctrl+C)
-signal.signal(signal.SIGINT, lambda signum, frame: exit(0))
-signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+def conversation_id(request: Request, params: dict):
+    """Use the conversation id of the request header for a new conversation."""
+    metadata = params.setdefault("metadata", {})
+    if not metadata.get("conv_id") and request.headers.get(CONV_ID_HEADER):
+        metadata["conv_id"] = request.headers[CONV_ID_HEADER]
+    return metadata.get("conv_id")
 
 
 def get_api_bot_response(args, history, user_text, parameters):
     data = {"text": user_text, 'chat_history': history, 'parameters': parameters}
-    orchestrator = AgentOrg(config=os.path.join(args.input_dir, "taskgraph.json"))
-    result = orchestrator.get_response(data)
+    with orchestrators.acquire(os.path.join(args.input_dir, "taskgraph.json")) as orchestrator:
+        result = orchestrator.get_response(data)
 
     return result['answer'], result['parameters']
 
@@ -84,12 +175,58 @@ def start_apis():
     logger.info(f"Started FastAPI process with PID: {process.pid}")
 
 
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def stream_api_bot_response(args, history, user_text, parameters):
+    data = {"text": user_text, 'chat_history': history, 'parameters': parameters}
+    try:
+        # the orchestrator is held until the stream ends or the client goes away
+        with orchestrators.acquire(os.path.join(args.input_dir, "taskgraph.json")) as orchestrator:
+            for event in orchestrator.get_response_stream(data):
+                if event["type"] == "token":
+                    yield format_sse("token", {"content": event["content"]})
+                else:
+                    yield format_sse("final", {"answer": event["answer"], "parameters": event["parameters"]})
+    except Exception as e:
+        logger.exception("Error while streaming the response")
+        yield format_sse("error", {"message": str(e)})
+
+
+@app.post("/eval/chat/stream")
+def predict_stream(data: Dict, request: Request):
+    """Server-sent events: a `token` event per generated token, then a `final` event
+    with the whole answer and the parameters of the next turn."""
+    history = data['history']
+    params = data['parameters']
+    user_text = history[-1]['content']
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    conv_id = conversation_id(request, params)
+    if conv_id:
+        headers[CONV_ID_HEADER] = conv_id
+    return StreamingResponse(
+        stream_api_bot_response(args, history[:-1], user_text, params),
+        media_type="text/event-stream",
+        headers=headers
+    )
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Per-stage timing, LLM calls, tokens and cache hits of the turns served so far, in the
+    Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/eval/chat")
-def predict(data: Dict):
+def predict(data: Dict, request: Request, response: Response):
     history = data['history']
     params = data['parameters']
     user_text = history[-1]['content']
+    conversation_id(request, params)
     answer, params = get_api_bot_response(args, history[:-1], user_text, params)
+    response.headers[CONV_ID_HEADER] = params["metadata"]["conv_id"]
     return {"answer": answer, "parameters": params}
 
 
@@ -98,12 +235,40 @@ if __name__ == "__main__":
     parser.add_argument('--input-dir', type=str, default="./examples/test")
     parser.add_argument('--model', type=str, default=MODEL["model_type_or_path"])
     parser.add_argument('--port', type=int, default=8000, help="Port to run the FastAPI app")
+    parser.add_argument('--log-level', type=str, default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    parser.add_argument('--log-format', type=str, default="text", choices=["text", "json"])
+    parser.add_argument('--workers', type=int, default=int(os.environ.get(WORKERS_ENV, 1)), help="Number of worker processes of the server")
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get(GRACEFUL_TIMEOUT_ENV, 30)), help="Seconds left to the in-flight requests on shutdown")
     
     args = parser.parse_args()
     os.environ["DATA_DIR"] = args.input_dir
     MODEL["model_type_or_path"] = args.model
+    # the worker processes read their settings from the environment
+    os.environ[INPUT_DIR_ENV] = args.input_dir
+    os.environ[MODEL_ENV] = args.model
+    os.environ[LOG_LEVEL_ENV] = args.log_level
+    os.environ[LOG_FORMAT_ENV] = args.log_format
+    init_logger(
+        log_level=getattr(logging, args.log_level.upper(), logging.INFO),
+        filename=os.path.join(os.path.dirname(__file__), "logs", "agentorg.log"),
+        json_format=args.log_format == "json"
+    )
+
+    # the api is not needed when the task graph runs the NLU and slot filling models in process
+    config = json.load(open(os.path.join(args.input_dir, "taskgraph.json")))
+    if not (is_inproc(config.get("nluapi")) and is_inproc(config.get("slotfillapi"))):
+        start_apis()
+
+    # Register cleanup function to run on program exit
+    atexit.register(terminate_subprocess)
 
-    start_apis()
+    # Handle signals (e.g., Ctrl+C), uvicorn takes them over while it serves to drain the requests
+    signal.signal(signal.SIGINT, lambda signum, frame: exit(0))
+    signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
 
     #run server
-    uvicorn.run(app, host="0.0.0.0", port=args.port)
\ No newline at end of file
+    if args.workers > 1:
+        # the workers import the app, and preload their caches before serving
+        uvicorn.run("model_api:app", host="0.0.0.0", port=args.port, workers=args.workers, timeout_graceful_shutdown=args.graceful_timeout)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=args.port, timeout_graceful_shutdown=args.graceful_timeout)
\ No newline at end of file
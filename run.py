@@ -6,24 +6,12 @@ import logging
 import subprocess
 import signal
 import atexit
-
-from langchain_openai import ChatOpenAI
+import threading
 
 from agentorg.utils.utils import init_logger
 from agentorg.orchestrator.orchestrator import AgentOrg
-from create import API_PORT
-from agentorg.utils.model_config import MODEL
-
-from openai import OpenAI
-from pydub import AudioSegment
-from pydub.playback import play
-
-import openai
-import sounddevice as sd
-import numpy as np
-from scipy.io.wavfile import write
-import wave
-from pynput import keyboard
+from agentorg.orchestrator.NLU.nlu import is_inproc
+from agentorg.utils.model_config import MODEL, API_PORT
 
 process = None  # Global reference for the FastAPI subprocess
 
@@ -73,127 +61,114 @@ def start_apis():
         )
     logger.info(f"Started FastAPI process with PID: {process.pid}")
 
-def text2speech(text):
-    # Initialize the required variables and create folders
-    client = OpenAI()
-    save_path = os.path.join("speech_tmp", "speech.mp3")
-    os.makedirs("speech_tmp", exist_ok=True)
-
-    # Convert the text into speech
-    with client.audio.speech.with_streaming_response.create(
-        model="tts-1",
-        voice="alloy",
-        input=f"""{text}""",
-    ) as response:
-        response.stream_to_file(save_path)
-
-    # Play the speech
-    audio = AudioSegment.from_file(save_path)
-    play(audio)
-
-def record_audio_with_toggle():
+def get_api_bot_response_stream(args, history, user_text, parameters):
+    data = {"text": user_text, 'chat_history': history, 'parameters': parameters}
+    orchestrator = AgentOrg(config=os.path.join(args.input_dir, "taskgraph.json"))
+    return orchestrator.get_response_stream(data)
+
+
+# the audio dependencies are only imported with --sound
+def text2speech(text, pipeline=None):
+    from agentorg.utils.audio import SpeechPipeline, split_sentences
+
+    pipeline = pipeline or SpeechPipeline()
+    pipeline.speak(split_sentences([text]))
+
+
+def speak_bot_response(args, history, user_text, parameters, pipeline=None):
+    """Print and speak the response while it is generated, sentence by sentence."""
+    from agentorg.utils.audio import SpeechPipeline, split_sentences
+
+    pipeline = pipeline or SpeechPipeline()
+    final = {}
+
+    def tokens():
+        for event in get_api_bot_response_stream(args, history, user_text, parameters):
+            if event["type"] == "token":
+                print(event["content"], end="", flush=True)
+                yield event["content"]
+            else:
+                final.update(event)
+
+    print("Bot: ", end="", flush=True)
+    try:
+        # an error of the response stream is raised here, once the text before it is spoken
+        pipeline.speak(split_sentences(tokens()))
+    finally:
+        print()
+    if "answer" not in final:
+        raise RuntimeError("The response stream ended without the final response")
+    return final["answer"], final["parameters"]
+
+
+def record_audio_with_toggle(recorder=None):
     """
     Records audio when 'r' is pressed and stops recording when 's' is pressed.
-    Saves the audio to 'output.wav'.
+    Returns the audio as an in-memory WAV file.
     """
-    # Parameters for recording
-    sample_rate = 44100  # Sampling frequency
-    channels = 1  # Number of audio channels
-    dtype = 'int16'  # Data type for audio
-    filename = os.path.join("speech_tmp", "recorded_speech.wav")  # Output filename
-    os.makedirs("speech_tmp", exist_ok=True)
-
-    # Buffer to store audio data
-    audio_data = []
+    from pynput import keyboard
+    from agentorg.utils.audio import Recorder
+
+    recorder = recorder or Recorder()
+    stopped = threading.Event()
     recording = False
-    stop_recording = False
     print("Press 'r' to start recording and 's' to stop.")
 
     # Event handlers
     def on_press(key):
-        nonlocal recording, audio_data, stop_recording
+        nonlocal recording
         try:
             if key.char == 'r' and not recording:
                 print("Recording started. Press 's' to stop.")
                 recording = True
-                audio_data = []  # Reset audio buffer
+                recorder.start()
             elif key.char == 's' and recording:
                 print("Recording stopped.")
                 recording = False
-                stop_recording = True
+                stopped.set()
         except AttributeError:
             pass  # Ignore special keys
 
     # Start the listener
-    with keyboard.Listener(on_press=on_press) as listener:
-        while not stop_recording:  # Exit the loop when 's' is pressed
-            if recording:
-                # Capture a chunk of audio
-                chunk = sd.rec(int(sample_rate * 0.1), samplerate=sample_rate, channels=channels, dtype=dtype)
-                sd.wait()
-                audio_data.append(chunk)
-
-    # Concatenate all recorded chunks
-    audio_data = np.concatenate(audio_data, axis=0)
-
-    # Save the audio data to a WAV file
-    with wave.open(filename, 'wb') as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(np.dtype(dtype).itemsize)
-        wf.setframerate(sample_rate)
-        wf.writeframes(audio_data.tobytes())
-
-    print(f"Audio saved to {filename}.")
-    return filename
+    with keyboard.Listener(on_press=on_press):
+        stopped.wait()
+    return recorder.stop()
+
 
 def speech2text():
-    # Record the audio
-    audio_file = record_audio_with_toggle()
+    from agentorg.utils.audio import transcribe
 
-    # Detect text
-    text_detected = False
-    while not text_detected:
+    # Record the audio and detect text until something is recognized
+    while True:
+        audio = record_audio_with_toggle()
         try:
-            client = OpenAI()
-            with open(audio_file, "rb") as audio_file_obj:
-                response = client.audio.transcriptions.create(
-                    model="whisper-1",  # Using Whisper model
-                    file=audio_file_obj
-                )
-                text = response.text
-                print(f"Recognized text: {text}")
-                os.remove(audio_file)  # Clean up temporary file
-
-                # Check if the recognized text is adequate
-                if text == '':
-                    print("Inadequate text...")
-                    text_detected = False
-                else:
-                    text_detected = True
-                    return text
+            text = transcribe(audio)
+            print(f"Recognized text: {text}")
+            if text:
+                return text
+            print("Inadequate text...")
         except Exception as e:
             print(f"Error during transcription: {e}")
-            os.remove(audio_file)  # Clean up temporary file
-            text_detected = False
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--input-dir', type=str, default="./examples/test")
     parser.add_argument('--model', type=str, default=MODEL["model_type_or_path"])
     parser.add_argument('--log-level', type=str, default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    parser.add_argument('--log-format', type=str, default="text", choices=["text", "json"])
     parser.add_argument('--sound', action='store_true', help="Enable sound (default is disabled)")
     args = parser.parse_args()
     os.environ["DATA_DIR"] = args.input_dir
     MODEL["model_type_or_path"] = args.model
     log_level = getattr(logging, args.log_level.upper(), logging.WARNING)
-    logger = init_logger(log_level=log_level, filename=os.path.join(os.path.dirname(__file__), "logs", "agentorg.log"))
-
-    # Set up audio recording
-    start_apis()
+    logger = init_logger(log_level=log_level, filename=os.path.join(os.path.dirname(__file__), "logs", "agentorg.log"), json_format=args.log_format == "json")
 
     history = []
     params = {}
     config = json.load(open(os.path.join(args.input_dir, "taskgraph.json")))
+    # the api is not needed when the task graph runs the NLU and slot filling models in process
+    if not (is_inproc(config.get("nluapi")) and is_inproc(config.get("slotfillapi"))):
+        start_apis()
     user_prefix = "USER"
     worker_prefix = "ASSISTANT"
     for node in config['nodes']:
@@ -216,15 +191,18 @@ if __name__ == "__main__":
             if user_text.lower() == "quit":
                 break
             start_time = time.time()
-            output, params = get_api_bot_response(args, history, user_text, params)
+            if args.sound:
+                # the response is spoken while it is generated
+                output, params = speak_bot_response(args, history, user_text, params)
+            else:
+                output, params = get_api_bot_response(args, history, user_text, params)
             history.append({"role": user_prefix, "content": user_text})
             history.append({"role": worker_prefix, "content": output})
             print(f"getAPIBotResponse Time: {time.time() - start_time}")
             
-            # Print the output and play it
-            print(f"Bot: {output}")
-            if args.sound:
-                text2speech(output)
+            # Print the output
+            if not args.sound:
+                print(f"Bot: {output}")
             
     finally:
         terminate_subprocess()  # Ensure the subprocess is terminated
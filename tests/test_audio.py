@@ -0,0 +1,138 @@
+import sys
+import types
+import wave
+
+import numpy as np
+import pytest
+
+# the streams are injected below, the tests do not need the PortAudio bindings
+sys.modules.setdefault("sounddevice", types.ModuleType("sounddevice"))
+
+from agentorg.utils.audio import Recorder, SpeechPipeline, split_sentences
+
+
+class StubTTS:
+    sample_rate = 16000
+
+    def __init__(self, fail_on=None):
+        self.sentences = []
+        self.fail_on = fail_on
+
+    def synthesize(self, text):
+        if text == self.fail_on:
+            raise RuntimeError("synthesis failed")
+        self.sentences.append(text)
+        pcm = text.encode()
+        # chunks of odd length, frames are split across them
+        for start in range(0, len(pcm), 3):
+            yield pcm[start:start + 3]
+
+
+class FakeOutputStream:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.writes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+class FakeInputStream:
+    def __init__(self, samplerate, channels, dtype, callback):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.dtype = dtype
+        self.callback = callback
+        self.started = False
+        self.closed = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pipeline(tts):
+    streams = []
+
+    def factory(**kwargs):
+        streams.append(FakeOutputStream(**kwargs))
+        return streams[-1]
+
+    return SpeechPipeline(tts=tts, output_stream_factory=factory), streams
+
+
+def test_split_sentences_groups_tokens():
+    tokens = ["Hi. ", "This is the first", " sentence. And", " the last one"]
+    assert list(split_sentences(tokens)) == ["Hi. This is the first sentence.", "And the last one"]
+
+
+def test_speech_pipeline_plays_whole_frames_in_order():
+    tts = StubTTS()
+    pipeline, streams = make_pipeline(tts)
+
+    pipeline.speak(["First sentence!", "Second one."])
+
+    assert tts.sentences == ["First sentence!", "Second one."]
+    (stream,) = streams
+    assert stream.kwargs == {"samplerate": 16000, "channels": 1, "dtype": "int16"}
+    assert all(len(data) % 2 == 0 for data in stream.writes)
+    assert b"".join(stream.writes) == b"First sentence!Second one."
+
+
+def test_speech_pipeline_raises_the_error_of_the_sentences():
+    tts = StubTTS()
+    pipeline, streams = make_pipeline(tts)
+
+    def sentences():
+        yield "Spoken before the error."
+        raise ValueError("stream broken")
+
+    with pytest.raises(ValueError, match="stream broken"):
+        pipeline.speak(sentences())
+    assert tts.sentences == ["Spoken before the error."]
+
+
+def test_speech_pipeline_logs_synthesis_errors():
+    tts = StubTTS(fail_on="Not spoken.")
+    pipeline, streams = make_pipeline(tts)
+
+    pipeline.speak(["Spoken.", "Not spoken."])
+
+    # the odd trailing byte is not a whole frame
+    assert b"".join(streams[0].writes) == b"Spoken"
+
+
+def test_recorder_writes_the_callback_frames_to_a_wav_file():
+    streams = []
+
+    def factory(**kwargs):
+        streams.append(FakeInputStream(**kwargs))
+        return streams[-1]
+
+    recorder = Recorder(sample_rate=8000, input_stream_factory=factory)
+    recorder.start()
+    (stream,) = streams
+    assert stream.started
+    frames = np.arange(10, dtype=np.int16).reshape(-1, 1)
+    stream.callback(frames[:4], 4, None, None)
+    stream.callback(frames[4:], 6, None, None)
+    audio = recorder.stop()
+
+    assert stream.closed
+    assert audio.name == "speech.wav"
+    with wave.open(audio, "rb") as wav:
+        assert wav.getframerate() == 8000
+        assert wav.getnchannels() == 1
+        assert wav.getnframes() == 10
+        assert np.frombuffer(wav.readframes(10), dtype=np.int16).tolist() == list(range(10))
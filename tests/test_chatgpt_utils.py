@@ -0,0 +1,23 @@
+import pytest
+
+from agentorg.evaluation.chatgpt_utils import map_concurrently
+
+
+def test_map_concurrently_keeps_the_order_of_the_items():
+    assert map_concurrently(lambda item: item * 2, [3, 1, 2], concurrency=2) == [6, 2, 4]
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_map_concurrently_raises_after_all_items_ran(concurrency):
+    done = []
+
+    def simulate(item):
+        if item % 2:
+            raise ValueError(f"conversation {item} failed")
+        done.append(item)
+        return item
+
+    with pytest.raises(RuntimeError, match="2 of 4 simulated conversations failed") as error:
+        map_concurrently(simulate, [0, 1, 2, 3], concurrency=concurrency)
+    assert sorted(done) == [0, 2]
+    assert isinstance(error.value.__cause__, ValueError)
@@ -0,0 +1,90 @@
+import copy
+
+import networkx as nx
+
+from agentorg.orchestrator import compiled_graph
+from agentorg.orchestrator.compiled_graph import CompiledTaskGraph, compiled_graph_path
+
+
+def edge(intent, weight=1, pred=False):
+    return {"intent": intent, "attribute": {"weight": weight, "pred": pred, "definition": "", "sample_utterances": []}}
+
+
+PRODUCT_KWARGS = {
+    "nodes": [
+        ["0", {"name": "MessageWorker", "attribute": {"value": "Welcome"}, "limit": 1, "type": "start"}],
+        ["1", {"name": "RAGWorker", "attribute": {"value": ""}, "limit": 1}],
+        ["2", {"name": "MessageWorker", "attribute": {"value": "Which size?"}, "limit": 1}],
+        ["3", {"name": "MessageWorker", "attribute": {"value": "Which color?"}, "limit": 1}],
+        ["4", {"name": "MessageWorker", "attribute": {"value": "Done"}, "limit": 1}],
+    ],
+    "edges": [
+        ["0", "1", edge("User asks about products", pred=True)],
+        ["0", "2", edge("User wants to buy", weight=2, pred=True)],
+        ["2", "3", edge("None", weight=3)],
+        ["2", "4", edge("None")],
+        ["3", "4", edge("None")],
+        # a repeated edge merges into the first one, as in networkx
+        ["0", "2", edge("User wants to BUY", weight=5, pred=True)],
+    ],
+}
+
+
+def nx_graph(product_kwargs):
+    # the construction of the task graph before it was compiled
+    graph = nx.DiGraph()
+    edges = copy.deepcopy(product_kwargs["edges"])
+    for source, target, data in edges:
+        data["intent"] = data["intent"].lower()
+    graph.add_nodes_from(product_kwargs["nodes"])
+    graph.add_edges_from(edges)
+    return graph
+
+
+def test_compiled_graph_matches_the_networkx_graph():
+    graph = nx_graph(PRODUCT_KWARGS)
+    compiled = CompiledTaskGraph(PRODUCT_KWARGS)
+
+    assert compiled.node_ids == list(graph.nodes)
+    assert compiled.start_node == "0"
+    for node_id in graph.nodes:
+        assert compiled.nodes[node_id] == graph.nodes[node_id]
+        assert compiled.out_degree(node_id) == graph.out_degree(node_id)
+        out_edges = {}
+        for _, target, data in graph.out_edges(node_id, data=True):
+            out_edges.setdefault(data["intent"], []).append((target, data["attribute"]["weight"]))
+        assert set(compiled.local_intents[compiled.node_index[node_id]]) == set(out_edges)
+        for intent, targets in out_edges.items():
+            edge_ids = compiled.intent_edges(node_id, intent)
+            assert [(compiled.edges[idx]["target_node"], compiled.weights[idx]) for idx in edge_ids] == targets
+            assert [compiled.node_ids[target] for target in compiled.targets[edge_ids.start:edge_ids.stop]] == [target for target, _ in targets]
+        in_edges = list(graph.in_edges(node_id, data="intent"))
+        assert (compiled.in_edge(node_id) or {}).get("intent") == (in_edges[0][2] if in_edges else None)
+    pred_intents = {}
+    for source, target, data in graph.edges(data=True):
+        if data["attribute"]["pred"]:
+            pred_intents.setdefault(data["intent"], []).append((source, target, data["attribute"]["weight"]))
+    assert {
+        intent: [(edge["source_node"], edge["target_node"], edge["attribute"]["weight"]) for edge in edges]
+        for intent, edges in compiled.pred_intents.items()
+    } == pred_intents
+    assert pred_intents["user wants to buy"] == [("0", "2", 5)]
+
+
+def test_changed_task_graph_is_recompiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiled_graph, "_loaded", {})
+    path = compiled_graph_path(str(tmp_path / "taskgraph.json"))
+    CompiledTaskGraph(PRODUCT_KWARGS).save(path)
+
+    loaded = CompiledTaskGraph.load(path, PRODUCT_KWARGS)
+    assert CompiledTaskGraph.load(path, PRODUCT_KWARGS) is loaded
+
+    # taskgraph.json changed but the artifact was not rebuilt
+    changed = copy.deepcopy(PRODUCT_KWARGS)
+    changed["edges"][2][2]["attribute"]["weight"] = 7
+    recompiled = CompiledTaskGraph.load(path, changed)
+
+    assert recompiled is not loaded
+    assert recompiled.source_hash != loaded.source_hash
+    assert recompiled.weights[recompiled.intent_edges("2", "none")[0]] == 7
+    assert CompiledTaskGraph.load(path, PRODUCT_KWARGS) is loaded
@@ -0,0 +1,12 @@
+from agentorg.utils.doc_store import DocumentStore, CrawledURLObject
+
+
+def test_add_replaces_the_indexed_content(tmp_path):
+    with DocumentStore(str(tmp_path / "documents.db")) as store:
+        store.add([CrawledURLObject(id="a", url="http://example.com/a", content="apple banana")])
+        store.add([CrawledURLObject(id="a", url="http://example.com/a", content="cherry durian")])
+
+        store.conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('integrity-check')")
+        assert len(store) == 1
+        assert store.search("apple") == []
+        assert [doc.content for doc in store.search("cherry")] == ["cherry durian"]
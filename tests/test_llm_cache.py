@@ -0,0 +1,32 @@
+import argparse
+import os
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import create
+from agentorg.utils.llm_cache import LLMCache
+
+
+def test_second_identical_call_is_served_from_the_cache(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.db"))
+    model = FakeListChatModel(responses=["first", "second"], cache=cache)
+
+    assert model.invoke("hello").content == "first"
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert model.invoke("hello").content == "first"
+    assert (cache.hits, cache.misses) == (1, 1)
+    # a resumed run reads the responses committed by the previous one
+    cache.close()
+    resumed = LLMCache(str(tmp_path / "llm_cache.db"))
+    assert FakeListChatModel(responses=["first", "second"], cache=resumed).invoke("hello").content == "first"
+    assert resumed.hits == 1
+
+
+def test_no_llm_cache_bypasses_the_cache(tmp_path):
+    args = argparse.Namespace(output_dir=str(tmp_path), no_llm_cache=False)
+    assert isinstance(create.generation_model(args).cache, LLMCache)
+    assert os.path.exists(tmp_path / "llm_cache.db")
+
+    args = argparse.Namespace(output_dir=str(tmp_path / "uncached"), no_llm_cache=True)
+    assert create.generation_model(args).cache is None
+    assert not os.path.exists(tmp_path / "uncached" / "llm_cache.db")
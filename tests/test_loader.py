@@ -0,0 +1,127 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agentorg.utils.doc_store import URLObject
+from agentorg.utils.loader import Loader
+
+
+class FixtureSite:
+    """A small site served from memory. `pages` maps paths to html, each page has an ETag
+    derived from its content and missing paths are answered with a 404."""
+
+    def __init__(self, pages: dict):
+        self.pages = dict(pages)
+        self.requests = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append((self.path, time.monotonic()))
+                html = site.pages.get(self.path)
+                if html is None:
+                    self.send_error(404)
+                    return
+                etag = f'"{hash(html) & 0xffffffff:x}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                body = html.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path: str) -> str:
+        return self.base_url + path
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+PAGES = {
+    "/": '<html><title>Home</title><body><p>Welcome home</p><a href="/a">A</a> <a href="/b#top">B</a></body></html>',
+    "/a": '<html><title>Page A</title><body><p>apple banana</p><a href="/">Home</a></body></html>',
+    "/b": '<html><title>Page B</title><body><p>cherry durian</p><a href="/a/">A</a></body></html>',
+}
+
+
+@pytest.fixture
+def site():
+    site = FixtureSite(PAGES)
+    yield site
+    site.close()
+
+
+def test_crawl_stores_documents_and_links(site, tmp_path):
+    url_objs = [URLObject(str(i), site.url(path)) for i, path in enumerate(PAGES)]
+    docs = Loader().crawl_urls(url_objs, min_host_interval=0.2, use_browser="never")
+
+    Loader.save(str(tmp_path / "documents.db"), docs)
+    with Loader.load(str(tmp_path / "documents.db")) as store:
+        assert len(store) == 3
+        home, page_a, page_b = (store.get(str(i)) for i in range(3))
+        assert home.metadata["title"] == "Home"
+        assert "apple banana" in page_a.content
+        assert home.links == [site.url("/a"), site.url("/b")]
+        assert page_b.links == [site.url("/a")]
+        assert store.get_manifest(site.url("/a"))["etag"] is not None
+        assert [doc.id for doc in store.search("cherry")] == ["2"]
+
+
+def test_crawl_spaces_out_requests_to_the_same_host(site):
+    url_objs = [URLObject(str(i), site.url(path)) for i, path in enumerate(PAGES)]
+    Loader().crawl_urls(url_objs, concurrency=8, min_host_interval=0.2, use_browser="never")
+
+    times = sorted(request_time for _, request_time in site.requests)
+    assert len(times) == 3
+    # a little slack for the scheduling of the server threads
+    assert all(later - earlier >= 0.15 for earlier, later in zip(times, times[1:]))
+
+
+def test_refresh_handles_unchanged_changed_and_removed_pages(site, tmp_path):
+    url_objs = [URLObject(str(i), site.url(path)) for i, path in enumerate(PAGES)]
+    loader = Loader()
+    Loader.save(str(tmp_path / "documents.db"), loader.crawl_urls(url_objs, min_host_interval=0, use_browser="never"))
+
+    with Loader.load(str(tmp_path / "documents.db")) as store:
+        before = {entry["url"]: entry for entry in store.iter_manifest()}
+        site.pages["/a"] = '<html><title>Page A</title><body><p>elderberry fig</p></body></html>'
+        del site.pages["/b"]
+        site.requests.clear()
+
+        changed = loader.refresh(store, min_host_interval=0, use_browser="never")
+
+        assert changed == [site.url("/a")]
+        assert len(site.requests) == 3
+        # unchanged: answered with a 304, the row and its manifest entry are kept as they were
+        assert store.get_manifest(site.url("/")) == before[site.url("/")]
+        assert "Welcome home" in store.get("0").content
+        # changed: the row is replaced and the manifest records the new validators
+        manifest_a = store.get_manifest(site.url("/a"))
+        assert manifest_a["etag"] != before[site.url("/a")]["etag"]
+        assert manifest_a["content_hash"] != before[site.url("/a")]["content_hash"]
+        assert "elderberry fig" in store.get("1").content
+        assert store.get("1").links == []
+        assert [doc.id for doc in store.search("elderberry")] == ["1"]
+        assert store.search("apple") == []
+        # removed: the 404 keeps the previous version
+        assert store.get_manifest(site.url("/b")) == before[site.url("/b")]
+        assert "cherry durian" in store.get("2").content
+        assert len(store) == 3
+        store.conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('integrity-check')")
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agentorg.orchestrator.NLU import api
+from agentorg.orchestrator.NLU.api import BatchMetrics, MicroBatcher, QueueFull
+
+
+def make_batcher(handler, **kwargs):
+    batches = []
+
+    async def record(batch):
+        batches.append(batch)
+        return await handler(batch)
+
+    return MicroBatcher("test", record, BatchMetrics(), **kwargs), batches
+
+
+async def echo(batch):
+    return [request["text"].upper() for request in batch]
+
+
+def test_concurrent_submits_are_served_as_one_batch():
+    batcher, batches = make_batcher(echo, window_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit({"text": text}) for text in "abc"))
+
+    assert asyncio.run(run()) == ["A", "B", "C"]
+    assert batches == [[{"text": "a"}, {"text": "b"}, {"text": "c"}]]
+    stats = batcher.metrics.endpoints["test"]
+    assert (stats["batches"], stats["batch_size_sum"], stats["pending"]) == (1, 3, 0)
+
+
+def test_submit_beyond_max_pending_raises_queue_full():
+    batcher, batches = make_batcher(echo, window_ms=50, max_pending=2)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit({"text": text}) for text in "abc"), return_exceptions=True)
+
+    first, second, third = asyncio.run(run())
+    assert (first, second) == ("A", "B")
+    assert isinstance(third, QueueFull)
+    assert batches == [[{"text": "a"}, {"text": "b"}]]
+    assert batcher.metrics.endpoints["test"]["rejected"] == 1
+    assert 'agentorg_nlu_rejected_total{endpoint="test"} 1' in batcher.metrics.render()
+
+
+def test_an_error_fails_only_its_own_request():
+    async def handler(batch):
+        return [ValueError("bad request") if request["text"] == "b" else request["text"] for request in batch]
+
+    batcher, batches = make_batcher(handler, window_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit({"text": text}) for text in "abc"), return_exceptions=True)
+
+    first, second, third = asyncio.run(run())
+    assert (first, third) == ("a", "c")
+    assert isinstance(second, ValueError)
+    assert len(batches) == 1
+
+
+def test_full_queue_is_answered_with_503(monkeypatch):
+    batcher, _ = make_batcher(echo, max_pending=0)
+    monkeypatch.setattr(api, "nlu_batcher", batcher)
+
+    response = TestClient(api.app).post("/nlu/predict", json={"text": "a"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_slotfill_returns_the_input_slots_when_the_model_refuses(monkeypatch):
+    async def refuse(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(api.slotfilling_openai, "aget_response", refuse)
+    monkeypatch.setattr(api, "slotfill_batcher", MicroBatcher("slotfill", api.slotfilling_openai.predict_batch, BatchMetrics()))
+    slots = [{"name": "size", "type": "str", "value": "", "description": "shoe size", "prompt": "Which size?"}]
+
+    response = TestClient(api.app).post("/slotfill/predict", json={"text": "hi", "slots": slots, "chat_history_str": "USER: hi"})
+
+    assert response.status_code == 200
+    assert response.json() == slots
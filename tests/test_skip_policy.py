@@ -0,0 +1,94 @@
+import collections
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from agentorg.orchestrator import skip_policy
+from agentorg.orchestrator.compiled_graph import CompiledTaskGraph
+from agentorg.orchestrator.skip_policy import SkipPolicy
+
+
+class StubModel:
+    """Answers every skip check with `answer` and counts the prompts per node value."""
+
+    def __init__(self, answer="yes"):
+        self.answer = answer
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self.lock:
+            for value in ("Ask the size", "Ask the color", "Confirm"):
+                if value in prompt:
+                    self.calls[value] += 1
+        return SimpleNamespace(content=self.answer)
+
+
+def node(value, **attribute):
+    return {"name": "MessageWorker", "attribute": {"value": value, **attribute}, "limit": 1}
+
+
+def none_edge():
+    return {"intent": "None", "attribute": {"weight": 1, "pred": False}}
+
+
+GRAPH = CompiledTaskGraph({
+    "nodes": [
+        ["0", {**node("Welcome"), "type": "start"}],
+        ["1", node("Ask the size", slots=["size"])],
+        ["2", node("Ask the color")],
+        ["3", node("Confirm")],
+    ],
+    "edges": [["0", "1", none_edge()], ["1", "2", none_edge()], ["2", "3", none_edge()]],
+})
+AVAILABLE_NODES = {node_id: {"limit": 1} for node_id in GRAPH.node_ids}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(skip_policy, "_cache", collections.OrderedDict())
+
+
+def test_slots_mode_skips_filled_slots_without_a_model_call():
+    model = StubModel()
+    policy = SkipPolicy(model, GRAPH, default_mode="slots")
+
+    assert policy.should_skip("1", "USER: size 42", [{"name": "size", "value": "42"}])
+    assert not policy.should_skip("1", "USER: hi", [{"name": "size", "value": ""}])
+    # the node does not declare its slots, the slots mode keeps it
+    assert not policy.should_skip("2", "USER: hi", [])
+    assert model.calls == {}
+
+
+def test_never_mode_never_skips():
+    model = StubModel()
+    policy = SkipPolicy(model, GRAPH, default_mode="never")
+
+    assert not policy.should_skip("1", "USER: size 42", [{"name": "size", "value": "42"}])
+    assert not policy.should_skip("2", "USER: blue", [])
+    assert model.calls == {}
+
+
+def test_identical_history_reuses_the_cached_decision():
+    model = StubModel()
+    policy = SkipPolicy(model, GRAPH)
+
+    assert policy.should_skip("2", "USER: blue please", [])
+    assert policy.should_skip("2", "USER: blue please", [])
+    assert model.calls == {"Ask the color": 1}
+    policy.should_skip("2", "USER: red please", [])
+    assert model.calls == {"Ask the color": 2}
+
+
+def test_lookahead_decision_is_used_by_the_next_node():
+    model = StubModel(answer="yes")
+    policy = SkipPolicy(model, GRAPH, lookahead=2)
+    history = "USER: a blue one, that's all"
+
+    # node 2 is checked, node 3 along the none edge in the background
+    assert policy.lookahead_chain("2", AVAILABLE_NODES) == ["3"]
+    assert policy.should_skip("2", history, [], AVAILABLE_NODES)
+    assert [key[1] for key in skip_policy._cache] == ["3", "2"]
+    assert policy.should_skip("3", history, [], AVAILABLE_NODES)
+    assert model.calls == {"Ask the color": 1, "Confirm": 1}
@@ -0,0 +1,68 @@
+import json
+
+from agentorg.orchestrator.task_graph import TaskGraph, dump_rng, load_rng
+
+
+def node(value, **data):
+    return {"name": "MessageWorker", "attribute": {"value": value}, "limit": 1, **data}
+
+
+def none_edge(weight=1):
+    return {"intent": "None", "attribute": {"weight": weight, "pred": False}}
+
+
+# every turn moves along a `none` edge, picked at random among the successors
+PRODUCT_KWARGS = {
+    "nodes": [["0", node("Welcome", type="start")]]
+        + [[str(idx), node(f"Step {idx}")] for idx in range(1, 13)],
+    "edges": [["0", str(idx), none_edge(idx)] for idx in range(1, 4)]
+        + [[str(source), str(target), none_edge()] for source in range(1, 4) for target in range(4, 13)],
+    "skip_check": "never",
+}
+
+
+def run_conversation(task_graph, conv_id, turns=2):
+    params = {"metadata": {"conv_id": conv_id}}
+    nodes = []
+    for turn in range(turns):
+        node_info, params = task_graph.get_node({"text": "next", "chat_history_str": "USER: next", "parameters": params})
+        nodes.append(params["curr_node"])
+        # the parameters travel through the client as JSON
+        params = json.loads(json.dumps(params))
+    return nodes, params
+
+
+def test_same_conversation_id_replays_the_same_nodes():
+    task_graph = TaskGraph("taskgraph", PRODUCT_KWARGS)
+
+    first, _ = run_conversation(task_graph, "conv-1")
+    second, _ = run_conversation(TaskGraph("taskgraph", PRODUCT_KWARGS), "conv-1")
+
+    assert first == second
+    assert len(set(first)) == 2
+    # the seed follows the conversation id
+    assert len({tuple(run_conversation(task_graph, f"conv-{idx}")[0]) for idx in range(10)}) > 1
+
+
+def test_rng_state_round_trips_through_the_parameters():
+    task_graph = TaskGraph("taskgraph", PRODUCT_KWARGS)
+    _, params = run_conversation(task_graph, "conv-1", turns=1)
+
+    rng_state = params["rng_state"]
+    assert all(isinstance(rng_state[field], str) for field in ("state", "inc", "uinteger"))
+    rng = load_rng(params)
+    assert dump_rng(rng) == rng_state
+    assert rng.random() == task_graph.rng.random()
+
+
+def test_postprocess_intent_matches_normalized_and_misspelled_intents():
+    task_graph = TaskGraph("taskgraph", PRODUCT_KWARGS)
+    available_intents = {"user wants to buy shoes": [], "user asks about shipping": [], "others": []}
+
+    assert task_graph._postprocess_intent("user asks about shipping", available_intents) == (True, "user asks about shipping", 0)
+    # case and whitespace variants hit the normalized index
+    assert task_graph._postprocess_intent("  User Wants to  buy shoes.", available_intents) == (True, "user wants to buy shoes", 0)
+    # a typo is matched by the fuzzy fallback, the index suffix is kept
+    assert task_graph._postprocess_intent("user wants to by shoes__<1>", available_intents) == (True, "user wants to buy shoes", 1)
+    # a dissimilar intent is not found, the caller falls back to `others`
+    assert task_graph._postprocess_intent("user wants a refund", available_intents) == (False, "user wants a refund", 0)